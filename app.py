@@ -1,22 +1,28 @@
 import streamlit as st
 import os
-import asyncio
 import json
 import nest_asyncio
-import time
 import shutil
-import zipfile
-import re
-import base64
-from datetime import datetime
-from gtts import gTTS
-import google.generativeai as genai
-from google.api_core import exceptions
-import requests
-from bs4 import BeautifulSoup
-import edge_tts
+import io
+import uuid
 import streamlit.components.v1 as components
-from PIL import Image
+from tts_cache import TTSCache
+from tts_scheduler import SchedulerConfig, process_metrics
+from model_catalog import ModelCatalog
+from image_prep import IMAGE_MAX_EDGE, IMAGE_JPEG_QUALITY
+from menu_cache import MenuResultCache
+from menu_pipeline import (
+    MenuJob, VOICE_OPTIONS, READING_MODES, PAGE_PARALLELISM,
+    create_model, run_menu_pipeline, run_menu_update, write_playlist_json,
+)
+from player_template import load_template
+from workspace import WORK_ROOT, WorkspaceReaper, session_work_dir
+from dictionary_store import DictionaryStore, GLOBAL_NAMESPACE, DICT_PAGE_SIZE, store_namespace
+from stage_metrics import start_metrics_server
+from audio_post import AudioProfile, ffmpeg_available
+from publish_server import PUBLISH_PORT, PublishStore, default_base_url, make_store_id, public_url, start_publish_server
+from job_queue import JobRunner, JobStore, QUEUED, RUNNING, DONE
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 
 # ----------------------------
 # 初期設定
@@ -81,405 +87,220 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # ----------------------------
-# 辞書ファイルの管理
+# 共通関数
 # ----------------------------
 
-DICT_FILE = "my_dictionary.json"
-
-def load_dictionary():
-    if os.path.exists(DICT_FILE):
-        with open(DICT_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
+def get_session_id() -> str:
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx else "default"
+
+def job_work_dir(job_id: str) -> str:
+    """ジョブ専用の作業フォルダ（呼ぶたびに最終利用時刻を更新し、自動削除の対象から外す）"""
+    return session_work_dir(f"job_{job_id}")
+
+@st.cache_resource
+def start_workspace_reaper() -> WorkspaceReaper:
+    """放置されたセッションの作業フォルダを定期的に削除するスレッド（プロセスに1つ）"""
+    reaper = WorkspaceReaper([WORK_ROOT, STATIC_PREVIEW_DIR])
+    reaper.start()
+    return reaper
+
+@st.cache_resource
+def start_metrics_endpoint():
+    """RUNWITH_METRICS_PORT が設定されていれば /metrics（Prometheus形式）を公開する（プロセスに1つ）"""
+    return start_metrics_server()
+
+@st.cache_resource
+def get_publish_store():
+    """RUNWITH_PUBLISH_PORT が設定されていれば公開サーバーを起動する（プロセスに1つ）。無効なら None"""
+    if not PUBLISH_PORT:
+        return None
+    store = PublishStore()
+    start_publish_server(PUBLISH_PORT, store)
+    return store
+
+@st.cache_resource
+def get_model_catalog() -> ModelCatalog:
+    """全セッションで共有するモデル一覧キャッシュ（再実行のたびにAPIを呼ばない）"""
+    return ModelCatalog()
+
+@st.cache_resource
+def get_menu_cache() -> MenuResultCache:
+    """メニュー画像の解析結果キャッシュ（全セッション共有）"""
+    return MenuResultCache()
+
+@st.cache_resource
+def get_tts_cache() -> TTSCache:
+    """プロセス内で共有する音声キャッシュ"""
+    return TTSCache()
+
+@st.cache_resource
+def get_dictionary_store() -> DictionaryStore:
+    """読み方辞書（全セッション共有・変更番号で再読み込みを判断）"""
+    return DictionaryStore()
+
+@st.cache_resource
+def get_pending_api_keys() -> dict:
+    """ジョブ投入からワーカーが取り出すまでの間だけAPIキーを預かる"""
     return {}
 
-def save_dictionary(new_dict):
-    with open(DICT_FILE, "w", encoding="utf-8") as f:
-        json.dump(new_dict, f, ensure_ascii=False, indent=2)
+@st.cache_resource
+def get_job_runner() -> JobRunner:
+    """生成ジョブを順に処理するワーカー（プロセスに1つ・全セッション共有）
+
+    APIキーはデータベースに保存せずメモリ上だけで受け渡す。
+    再起動後に再開するジョブは、secrets / 環境変数のキーがあればそれを使う。
+    """
+    tts_cache, menu_cache, dict_store = get_tts_cache(), get_menu_cache(), get_dictionary_store()
+    default_api_key = st.secrets["GEMINI_API_KEY"] if "GEMINI_API_KEY" in st.secrets else os.environ.get("GEMINI_API_KEY")
+    api_keys = get_pending_api_keys()
+
+    def handle(job_id, payload, progress, notify):
+        work_dir = job_work_dir(job_id)
+        progress.on_update = lambda: job_work_dir(job_id)
+        if payload.get("kind") == "update":
+            # 読み方辞書は実行時点の内容を使う（変更がなければ変換済みのものを再利用）
+            readings = dict_store.readings(payload["previous"]["store_name"])
+            result = run_menu_update(
+                payload["previous"], payload["chapters"], os.path.join(work_dir, "audio"),
+                os.path.join(work_dir, "export"), tts_cache, payload["scheduler_config"], progress, readings
+            )
+            result["work_dir"] = work_dir
+            return result
+        api_key = api_keys.pop(payload["key_ref"], None) or default_api_key
+        if not api_key:
+            raise RuntimeError("サーバーの再起動によりAPIキーが失われました。もう一度作成してください。")
+        model = create_model(api_key, payload["model_name"])
+        readings = dict_store.readings(payload["job"].store_name)
+        result = run_menu_pipeline(
+            payload["job"], model, payload["model_name"], os.path.join(work_dir, "audio"),
+            os.path.join(work_dir, "export"), readings, tts_cache, menu_cache, progress, notify
+        )
+        result["work_dir"] = work_dir
+        return result
 
-# ----------------------------
-# 共通関数
-# ----------------------------
+    runner = JobRunner(JobStore(), handle)
+    runner.start()
+    return runner
 
-def sanitize_filename(name: str) -> str:
-    """ファイル名に使えない文字を安全な形に整形"""
-    return re.sub(r'[\\/*?:"<>|]', "", name).replace(" ", "_").replace("　", "_")
-
-def fetch_text_from_url(url: str) -> str | None:
-    """URLから本文テキストを取得"""
-    try:
-        headers = {'User-Agent': 'Mozilla/5.0'}
-        response = requests.get(url, headers=headers, timeout=10)
-        response.encoding = response.apparent_encoding
-        soup = BeautifulSoup(response.text, 'html.parser')
-        for s in soup(["script", "style", "header", "footer", "nav"]):
-            s.extract()
-        text = soup.get_text(separator="\n")
-        lines = [line.strip() for line in text.splitlines() if line.strip()]
-        return "\n".join(lines)
-    except Exception:
-        return None
+def submit_menu_job(job: MenuJob, api_key: str, model_name: str) -> str:
+    key_ref = uuid.uuid4().hex
+    get_pending_api_keys()[key_ref] = api_key
+    payload = {"job": job, "model_name": model_name, "key_ref": key_ref}
+    return get_job_runner().submit(get_session_id(), payload, label=job.store_name)
 
-async def generate_single_track_fast(text: str, filename: str, voice_code: str, rate_value: str) -> bool:
-    """edge-tts で音声生成。失敗時は gTTS にフォールバック"""
-    for attempt in range(3):
-        try:
-            comm = edge_tts.Communicate(text, voice_code, rate=rate_value)
-            await comm.save(filename)
-            if os.path.exists(filename) and os.path.getsize(filename) > 0:
-                return True
-        except Exception:
-            await asyncio.sleep(1)
-
-    try:
-        def gtts_task():
-            tts = gTTS(text=text, lang='ja')
-            tts.save(filename)
-        await asyncio.to_thread(gtts_task)
-        return True
-    except Exception:
-        return False
-
-async def process_all_tracks_fast(menu_data, output_dir, voice_code, rate_value, progress_bar):
-    """すべてのチャプター音声を並列生成"""
-    tasks = []
-    track_info_list = []
-    
-    for i, track in enumerate(menu_data):
-        safe_title = sanitize_filename(track['title'])
-        filename = f"{i:02}_{safe_title}.mp3"
-        save_path = os.path.join(output_dir, filename)
-        speech_text = track['text']
-        
-        if i > 0:
-            speech_text = f"{i}、{track['title']}。\n{track['text']}"
-            
-        tasks.append(generate_single_track_fast(speech_text, save_path, voice_code, rate_value))
-        track_info_list.append({"title": track['title'], "path": save_path})
-    
-    total = len(tasks)
-    completed = 0
-    for task in asyncio.as_completed(tasks):
-        await task
-        completed += 1
-        progress_bar.progress(completed / total)
-    return track_info_list
+def submit_update_job(previous: dict, chapters: list[dict], scheduler_config: SchedulerConfig) -> str:
+    """前回の結果を元に、変更したチャプターだけを作り直すジョブを投入"""
+    payload = {"kind": "update", "previous": previous, "chapters": chapters, "scheduler_config": scheduler_config}
+    return get_job_runner().submit(get_session_id(), payload, label=previous["store_name"])
 
 # ----------------------------
-# HTMLプレイヤー生成（JS埋め込み完全版・シークバー機能付き）
+# プレビュー用プレイヤー（簡易版・シークバーなし）
 # ----------------------------
 
-def create_standalone_html_player(store_name, menu_data, map_url=""):
-    """店舗向け配布用のスタンドアロンHTMLプレイヤーを生成"""
-    playlist_js = []
-    for track in menu_data:
-        file_path = track['path']
-        if os.path.exists(file_path):
-            with open(file_path, "rb") as f:
-                b64_data = base64.b64encode(f.read()).decode()
-                playlist_js.append({
-                    "title": track['title'],
-                    "src": f"data:audio/mp3;base64,{b64_data}"
-                })
-    playlist_json_str = json.dumps(playlist_js, ensure_ascii=False)
-    
-    map_button_html = ""
-    if map_url:
-        map_button_html = f"""
-        <div style="text-align:center; margin-bottom: 20px;">
-            <a href="{map_url}" target="_blank" 
-               role="button" 
-               aria-label="Googleマップを開く（{store_name}の場所）" 
-               class="map-btn">
-               🗺️ 地図を開く
-            </a>
-        </div>
-        """
+# Streamlitの静的ファイル配信（.streamlit/config.toml の enableStaticServing）で公開する場所
+STATIC_PREVIEW_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static", "preview")
 
-    # ここからHTMLテンプレート（非常に長い文字列）です。途中で切れないように注意してください。
-    html_template = """<!DOCTYPE html>
-<html lang="ja">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>__STORE_NAME__ 音声メニュー - Runwith AI</title>
-<style>
-:root { --bg-navy: #001F3F; --text-orange: #FF851B; --accent-white: #FFFFFF; --bg-dark: #003366; }
-body { font-family: sans-serif; background: var(--bg-navy); color: var(--text-orange); margin: 0; padding: 15px; line-height: 1.8; font-size: 18px; }
-.c { max-width: 600px; margin: 0 auto; }
-h1 { text-align: center; font-size: 2em; color: var(--accent-white); border-bottom: 4px solid var(--text-orange); padding-bottom: 15px; margin-bottom: 25px; }
-
-/* 再生中タイトルエリア */
-.box { 
-    background: var(--bg-dark); 
-    border: 5px solid var(--text-orange); 
-    border-radius: 15px; 
-    padding: 25px; 
-    text-align: center; 
-    margin-bottom: 15px; 
-    min-height: 100px; 
-    display: flex; 
-    align-items: center; 
-    justify-content: center;
-    cursor: pointer;
-    box-shadow: 0 4px 10px rgba(0,0,0,0.3);
-    transition: transform 0.1s;
-    user-select: none;
-}
-.box:active { transform: scale(0.98); }
-.box:hover { background-color: #004080; }
-
-.ti { font-size: 1.8em; font-weight: bold; color: var(--text-orange); }
-.ctrl-group { display: flex; flex-direction: column; gap: 20px; margin-bottom: 25px; }
-.main-ctrl { display: grid; grid-template-columns: 1fr 1fr; gap: 20px; }
-button { width: 100%; padding: 25px 0; font-size: 1.8em; font-weight: bold; color: var(--bg-navy) !important; background: var(--text-orange) !important; border: 3px solid var(--accent-white); border-radius: 15px; cursor: pointer; min-height: 80px; }
-button.reset-btn { font-size: 1.3em; background: var(--bg-dark) !important; color: var(--accent-white) !important; border-color: var(--text-orange); }
-.map-btn { display: block; width: 100%; padding: 25px; background-color: var(--accent-white); color: var(--bg-navy) !important; text-decoration: none; border-radius: 15px; font-size: 1.6em; font-weight: bold; border: 3px solid var(--text-orange); box-sizing: border-box; text-align: center; }
-
-/* シークバーのデザイン */
-.seek-container {
-    background: #001021;
-    padding: 15px 20px;
-    border-radius: 12px;
-    margin-bottom: 25px;
-    border: 1px solid #FF851B;
-}
-input[type=range] {
-    -webkit-appearance: none;
-    width: 100%;
-    background: transparent;
-    height: 40px; /* 操作しやすい高さ */
-    cursor: pointer;
-}
-input[type=range]:focus { outline: none; }
-input[type=range]::-webkit-slider-thumb {
-    -webkit-appearance: none;
-    height: 36px;
-    width: 36px;
-    border-radius: 50%;
-    background: #FF851B;
-    border: 4px solid #FFFFFF;
-    margin-top: -14px;
-    box-shadow: 0 2px 6px rgba(0,0,0,0.5);
-}
-input[type=range]::-webkit-slider-runnable-track {
-    width: 100%;
-    height: 12px;
-    cursor: pointer;
-    background: #555;
-    border-radius: 6px;
-    border: 1px solid #888;
-}
-.time-disp {
-    display: flex;
-    justify-content: space-between;
-    font-size: 1.2em;
-    font-weight: bold;
-    color: #FFFFFF;
-    margin-top: 5px;
-}
-
-.lst { border-top: 4px solid var(--text-orange); padding-top: 20px; margin-top: 25px; }
-.itm { padding: 25px 15px; border-bottom: 2px solid #666; cursor: pointer; font-size: 1.4em; color: var(--accent-white); border-radius: 10px; margin-bottom: 8px; }
-.itm.active { background: var(--text-orange) !important; color: var(--bg-navy) !important; font-weight: bold; border-left: 12px solid var(--accent-white); }
-</style>
-</head>
-<body>
-<main class="c" role="main">
-    <h1>🎧 __STORE_NAME__</h1>
-    __MAP_BUTTON__
-    
-    <section aria-label="再生状況と操作">
-        <div class="box" onclick="toggle()" role="button" aria-label="再生・一時停止">
-            <div class="ti" id="ti" aria-live="polite">▶ 読み込み中...</div>
-        </div>
+def publish_preview_tracks(tracks):
+    """静的配信が有効ならトラックを static/preview/<token>/ に置き、URLのプレイリストを返す"""
+    if not st.get_option("server.enableStaticServing"):
+        return None, None
+    token = uuid.uuid4().hex
+    dest_dir = os.path.join(STATIC_PREVIEW_DIR, token)
+    os.makedirs(dest_dir, exist_ok=True)
+    base_path = st.get_option("server.baseUrlPath").strip("/")
+    url_prefix = f"/{base_path}/app/static/preview/{token}" if base_path else f"/app/static/preview/{token}"
 
-        <div class="seek-container">
-            <input type="range" id="sb" value="0" min="0" step="1" aria-label="再生位置">
-            <div class="time-disp">
-                <span id="ct">0:00</span>
-                <span id="dt">0:00</span>
-            </div>
-        </div>
-    </section>
-    
-    <audio id="au" preload="metadata" style="opacity:0;position:absolute;"></audio>
-    
-    <section class="ctrl-group">
-        <button onclick="restart()" class="reset-btn">⏮ 最初に戻る</button>
-        <button onclick="toggle()" id="pb">▶ 再生</button>
-        <div class="main-ctrl">
-            <button onclick="prev()">⏮ 前</button>
-            <button onclick="next()">次 ⏭</button>
-        </div>
-    </section>
-    <div style="text-align:center; margin:25px 0; padding:20px; background:var(--bg-dark); border-radius:12px;">
-        <label for="sp" style="font-size:1.4em; color:var(--accent-white); font-weight:bold;">話す速さ: </label>
-        <select id="sp" onchange="csp()" style="font-size:1.4em; padding:12px; border-radius:10px;">
-            <option value="0.8">0.8 (ゆっくり)</option>
-            <option value="1.0" selected>1.0 (標準)</option>
-            <option value="1.2">1.2 (せっかち)</option>
-            <option value="1.5">1.5 (爆速)</option>
-        </select>
-    </div>
-    <section>
-        <h2>📜 メニュー一覧</h2>
-        <div id="ls" class="lst"></div>
-    </section>
-</main>
-<script>
-const pl=__PLAYLIST_JSON__;let idx=0;
-const au=document.getElementById('au'); const ti=document.getElementById('ti'); const pb=document.getElementById('pb');
-const sb=document.getElementById('sb'); const ct=document.getElementById('ct'); const dt=document.getElementById('dt');
-
-function init(){ ren(); ld(0); csp(); updateTitleUI(); }
-
-function ld(i){ idx=i; au.src=pl[idx].src; updateTitleUI(); ren(); csp(); }
-
-function updateTitleUI() {
-    const icon = au.paused ? "▶" : "⏸";
-    ti.innerText = icon + " " + pl[idx].title;
-}
-
-function fmt(s) {
-    const m = Math.floor(s / 60);
-    const ss = Math.floor(s % 60);
-    return m + ":" + (ss < 10 ? "0" : "") + ss;
-}
-
-// 音声メタデータ読み込み完了時
-au.onloadedmetadata = function() {
-    sb.max = au.duration;
-    dt.innerText = fmt(au.duration);
-    ct.innerText = fmt(0);
-};
-
-// 再生位置が変わった時
-au.ontimeupdate = function() {
-    sb.value = au.currentTime;
-    ct.innerText = fmt(au.currentTime);
-};
-
-// シークバー操作時
-sb.oninput = function() {
-    au.currentTime = sb.value;
-    ct.innerText = fmt(sb.value);
-};
-
-function toggle(){ 
-    if(au.paused){ 
-        au.play(); 
-        pb.innerText="⏸ 一時停止"; 
-    }else{ 
-        au.pause(); 
-        pb.innerText="▶ 再生"; 
-    } 
-    updateTitleUI();
-}
-
-function restart(){ idx=0; ld(0); au.play(); pb.innerText="⏸ 一時停止"; updateTitleUI(); }
-
-function next(){ 
-    if(idx<pl.length-1){ ld(idx+1); au.play(); pb.innerText="⏸ 一時停止"; }
-    updateTitleUI();
-}
-
-function prev(){ 
-    if(idx>0){ ld(idx-1); au.play(); pb.innerText="⏸ 一時停止"; }
-    updateTitleUI();
-}
-
-function csp(){ au.playbackRate=parseFloat(document.getElementById('sp').value); }
-
-au.onended=function(){ 
-    if(idx<pl.length-1){ next(); } 
-    else { pb.innerText="▶ 再生"; idx=0; ld(0); au.pause(); updateTitleUI(); } 
-};
-
-au.onplay = function() { pb.innerText="⏸ 一時停止"; updateTitleUI(); };
-au.onpause = function() { pb.innerText="▶ 再生"; updateTitleUI(); };
-
-function ren(){
-    const d=document.getElementById('ls'); d.innerHTML="";
-    pl.forEach((t,i)=>{
-        const m=document.createElement('div'); m.className="itm "+(i===idx?"active":"");
-        let label = t.title; if(i > 0){ label = i + ". " + t.title; }
-        m.innerText=label; 
-        m.onclick=()=>{ ld(i); au.play(); pb.innerText="⏸ 一時停止"; };
-        d.appendChild(m);
-    });
-}
-init();
-</script>
-</body>
-</html>"""
-
-    final_html = html_template.replace("__STORE_NAME__", store_name)
-    final_html = final_html.replace("__PLAYLIST_JSON__", playlist_json_str)
-    final_html = final_html.replace("__MAP_BUTTON__", map_button_html)
-    return final_html
+    playlist_data = []
+    for i, track in enumerate(tracks):
+        if not os.path.exists(track['path']):
+            continue
+        name = f"{i:02}.mp3"
+        dest = os.path.join(dest_dir, name)
+        try:
+            os.link(track['path'], dest)
+        except OSError:
+            shutil.copyfile(track['path'], dest)
+        playlist_data.append({"title": track['title'], "src": f"{url_prefix}/{name}"})
+    return playlist_data, dest_dir
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def build_preview_html(track_keys, playlist_json=None):
+    """track_keys は (タイトル, パス, 更新時刻, サイズ) の組。ファイルが変わらない間は再描画でも作り直さない"""
+    if playlist_json is None:
+        tracks = [{"title": title, "path": path} for title, path, _, _ in track_keys]
+        playlist = lambda out: write_playlist_json(out, tracks, embed_audio=True)
+    else:
+        playlist = playlist_json
+    buf = io.BytesIO()
+    load_template("preview.html").render(buf, {"PLAYLIST": playlist})
+    return buf.getvalue().decode("utf-8")
+
+def render_preview_player(tracks, playlist_data=None):
+    """playlist_data（URL版）があればそれを使い、なければ音声をdata URIで埋め込む"""
+    track_keys = []
+    for track in tracks:
+        if os.path.exists(track['path']):
+            stat = os.stat(track['path'])
+            track_keys.append((track['title'], track['path'], stat.st_mtime_ns, stat.st_size))
+    playlist_json = json.dumps(playlist_data) if playlist_data is not None else None
+    components.html(build_preview_html(tuple(track_keys), playlist_json), height=450)
 
 # ----------------------------
-# プレビュー用プレイヤー（簡易版・シークバーなし）
+# 生成ジョブの状態表示
 # ----------------------------
 
-def render_preview_player(tracks):
-    playlist_data = []
-    for track in tracks:
-        if os.path.exists(track['path']):
-            with open(track['path'], "rb") as f:
-                b64 = base64.b64encode(f.read()).decode()
-                playlist_data.append({
-                    "title": track['title'],
-                    "src": f"data:audio/mp3;base64,{b64}"
-                })
-    playlist_json = json.dumps(playlist_data)
-    
-    html_template = """<!DOCTYPE html><html><head><style>
-    body{margin:0;padding:0;font-family:sans-serif;}
-    .p-box{border:3px solid #001F3F;border-radius:12px;padding:15px;background:#fcfcfc;text-align:center;}
-    .t-ti{font-size:18px;font-weight:bold;color:#001F3F;margin-bottom:10px;padding:10px;background:#fff;border-radius:8px;border-left:5px solid #FF851B;}
-    .ctrls{display:flex; gap:10px; margin:15px 0;}
-    button {
-        flex: 1;
-        background-color: #FF851B; color: #001F3F; border: 2px solid #001F3F;
-        border-radius: 8px; font-size: 24px; padding: 10px 0;
-        cursor: pointer; line-height: 1; min-height: 50px; font-weight: bold;
+def adopt_job_result(job):
+    """完了したジョブの成果物を、このセッションの結果として表示できるようにする"""
+    previous = st.session_state.generated_result
+    if previous and previous.get("job_id") != job["id"]:
+        if previous.get("preview_dir"):
+            shutil.rmtree(previous["preview_dir"], ignore_errors=True)
+        if previous.get("work_dir"):
+            shutil.rmtree(previous["work_dir"], ignore_errors=True)
+
+    result = job["result"]
+    preview_playlist, preview_dir = publish_preview_tracks(result["tracks"])
+    st.session_state.generated_result = {
+        "job_id": job["id"],
+        "work_dir": result["work_dir"],
+        "tracks": result["tracks"],
+        "preview_playlist": preview_playlist,
+        "preview_dir": preview_dir,
+        "html_path": result["html_path"],
+        "html_name": result["html_name"],
+        "zip_path": result["zip_path"],
+        "zip_name": result["zip_name"],
+        "store_name": result["store_name"],
+        "menu_data": result["menu_data"],
+        "source": result
     }
-    button:hover { background-color: #FF6B00; }
-    button:focus { outline: 3px solid #001F3F; outline-offset: 2px; }
-    .lst{text-align:left;max-height:150px;overflow-y:auto;border-top:1px solid #eee;margin-top:10px;padding-top:5px;}
-    .it{padding:8px;border-bottom:1px solid #eee;cursor:pointer;font-size:14px;}
-    .it:focus{outline:2px solid #001F3F; background:#eee;}
-    .it.active{color:#FF851B;font-weight:bold;background:#001F3F;}
-    </style></head><body><div class="p-box"><div id="ti" class="t-ti">...</div><audio id="au" controls style="width:100%;height:30px;"></audio>
-    <div class="ctrls">
-        <button onclick="pv()" aria-label="前へ">⏮</button>
-        <button onclick="tg()" id="pb" aria-label="再生">▶</button>
-        <button onclick="nx()" aria-label="次へ">⏭</button>
-    </div>
-    <div style="font-size:12px;color:#666; margin-top:5px;">
-        速度:<select id="sp" onchange="sp()"><option value="0.8">0.8</option><option value="1.0" selected>1.0</option><option value="1.2">1.2</option><option value="1.5">1.5</option></select>
-    </div>
-    <div id="ls" class="lst" role="list"></div></div>
-    <script>
-    const pl=__PLAYLIST__;let x=0;const au=document.getElementById('au');const ti=document.getElementById('ti');const pb=document.getElementById('pb');const ls=document.getElementById('ls');
-    function init(){rn();ld(0);sp();}
-    function ld(i){x=i;au.src=pl[x].src;ti.innerText=pl[x].title;rn();sp();}
-    function tg(){if(au.paused){au.play();pb.innerText="⏸";pb.setAttribute("aria-label","一時停止");}else{au.pause();pb.innerText="▶";pb.setAttribute("aria-label","再生");}}
-    function nx(){if(x<pl.length-1){ld(x+1);au.play();pb.innerText="⏸";pb.setAttribute("aria-label","一時停止");}}
-    function pv(){if(x>0){ld(x-1);au.play();pb.innerText="⏸";pb.setAttribute("aria-label","一時停止");}}
-    function sp(){au.playbackRate=parseFloat(document.getElementById('sp').value);}
-    au.onended=function(){if(x<pl.length-1)nx();else{pb.innerText="▶";pb.setAttribute("aria-label","再生");}};
-    function rn(){ls.innerHTML="";pl.forEach((t,i)=>{
-        const d=document.createElement('div');
-        d.className="it "+(i===x?"active":"");
-        let l=t.title; if(i>0){l=i+". "+t.title;}
-        d.innerText=l;
-        d.setAttribute("role","listitem");d.setAttribute("tabindex","0");d.onclick=()=>{ld(i);au.play();pb.innerText="⏸";pb.setAttribute("aria-label","一時停止");};d.onkeydown=(e)=>{if(e.key==='Enter'||e.key===' '){e.preventDefault();d.click();}};ls.appendChild(d);});}
-    init();</script></body></html>"""
-    
-    final_html = html_template.replace("__PLAYLIST__", playlist_json)
-    components.html(final_html, height=450)
+
+def read_file(path: str) -> bytes:
+    """ダウンロードボタンが押されたときにだけ成果物を読み込む（data に渡す関数から呼ぶ）"""
+    with open(path, "rb") as f:
+        return f.read()
+
+def show_job_notices(job):
+    notices = {"info": st.info, "warning": st.warning}
+    for level, message in job["notices"]:
+        notices.get(level, st.info)(message)
+
+@st.fragment(run_every=2)
+def job_status_panel(job_id: str):
+    """ジョブの状態を定期的に確認して表示（画面全体は再実行しない）"""
+    store = get_job_runner().store
+    job = store.get(job_id)
+    if job is None or job["status"] not in (QUEUED, RUNNING):
+        # 完了・失敗したら画面全体を再実行して結果を表示する
+        st.rerun()
+    counts = store.counts()
+    if job["status"] == QUEUED:
+        st.info(f"⏳ 順番待ちです（前に {store.queue_position(job_id)} 件）。この画面を閉じても処理は続きます。")
+    else:
+        st.progress(job["progress"], text=f"Runwith Menu AI が「{job['label']}」を作成中...")
+        show_job_notices(job)
+    st.caption(f"サーバー全体: 実行中 {counts[RUNNING]} 件 / 順番待ち {counts[QUEUED]} 件")
 
 # ----------------------------
 # サイドバー（設定）
@@ -503,57 +324,99 @@ with st.sidebar:
     valid_models = []
     target_model_name = None
     if api_key:
-        try:
-            genai.configure(api_key=api_key)
-            all_models = list(genai.list_models())
-            valid_models = [m.name for m in all_models if 'generateContent' in m.supported_generation_methods]
-            default_idx = next((i for i, n in enumerate(valid_models) if "flash" in n.lower()), 0)
-            target_model_name = st.selectbox("🤖 AIモデル", valid_models, index=default_idx)
-        except Exception as e:
-            st.error(f"APIエラー: {e}")
+        valid_models, _, model_error = get_model_catalog().models(api_key)
+        if model_error:
+            st.warning(f"モデル一覧を取得できませんでした（標準の候補を表示）: {model_error}")
+        default_idx = next((i for i, n in enumerate(valid_models) if "flash" in n.lower()), 0)
+        target_model_name = st.selectbox("🤖 AIモデル", valid_models, index=default_idx)
     
     st.divider()
     st.header("🗣️ 音声設定")
     # 表示名シンプル化、デフォルト速度+10%
-    voice_options = {"👩 女性": "ja-JP-NanamiNeural", "👨 男性": "ja-JP-KeitaNeural"}
-    selected_voice = st.radio("声の種類", list(voice_options.keys()), horizontal=True)
-    voice_code = voice_options[selected_voice]
+    selected_voice = st.radio("声の種類", list(VOICE_OPTIONS.keys()), horizontal=True)
+    voice_code = VOICE_OPTIONS[selected_voice]
     rate_value = "+10%"
 
+    with st.expander("⚙️ 音声生成の詳細設定"):
+        tts_concurrency = st.number_input("同時生成数", min_value=1, max_value=16, value=SchedulerConfig().max_concurrency)
+        tts_attempts = st.number_input("再試行回数 (edge-tts)", min_value=1, max_value=6, value=SchedulerConfig().max_attempts)
+        tts_backoff = st.number_input("待機時間の初期値 (秒)", min_value=0.1, max_value=5.0, value=SchedulerConfig().backoff_base, step=0.1)
+        stream_mode = st.checkbox("⚡ 解析と音声合成を同時に進める", value=True)
+        show_timing_panel = st.checkbox("⏱️ 処理時間の内訳を表示", value=False)
+        shared = process_metrics()
+        st.caption(f"サーバー全体: 待機中 {shared['waiting']} / 生成中 {shared['running']} (最大待機 {shared['peak_waiting']}) / 再試行 {shared['retries']} / gTTS代替 {shared['fallbacks']}")
+    scheduler_config = SchedulerConfig(max_concurrency=int(tts_concurrency), max_attempts=int(tts_attempts), backoff_base=float(tts_backoff))
+
+    with st.expander("🔊 音声の仕上げ（ファイルを小さく）"):
+        has_ffmpeg = ffmpeg_available()
+        audio_post_enabled = st.checkbox("音量をそろえ、前後の無音を削って再圧縮する", value=False, disabled=not has_ffmpeg)
+        audio_bitrate = st.select_slider("ビットレート", ["24k", "32k", "48k", "64k"], value=AudioProfile().bitrate)
+        st.caption("読み上げ音声はモノラル・32kbps 程度で十分聞き取れます。" if has_ffmpeg else "サーバーに ffmpeg がないため利用できません。")
+    audio_profile = AudioProfile(bitrate=audio_bitrate) if audio_post_enabled and has_ffmpeg else None
+
     st.divider()
     st.header("📝 読み上げモード")
     reading_mode = st.radio(
         "情報の詳しさ", 
-        ("💬 シンプル (商品名と価格)", "🌟 詳細 (説明・イメージ付き)"), 
+        READING_MODES, 
         index=0
     )
 
+    with st.expander("🖼️ 画像の送信設定"):
+        image_max_edge = st.slider("長辺の最大ピクセル数", 800, 3200, IMAGE_MAX_EDGE, step=100)
+        image_quality = st.slider("JPEG画質", 50, 95, IMAGE_JPEG_QUALITY, step=5)
+        st.caption("シンプルモードでは色の情報が不要なため、白黒にして送信します。")
+        page_parallel = st.checkbox("📄 ページごとに並列で解析", value=True)
+        page_workers = st.number_input("同時リクエスト数", min_value=1, max_value=8, value=PAGE_PARALLELISM)
+        pages_per_request = st.number_input("1リクエストあたりのページ数", min_value=1, max_value=4, value=1)
+        force_reanalyze = st.checkbox("🔁 再解析する", value=False, help="以前と同じ画像でも保存済みの解析結果を使わず、読み直します。")
+
     st.divider()
     st.subheader("📖 読み方辞書")
-    st.caption("AIが読み間違える単語を登録してください。")
-    
-    user_dict = load_dictionary()
+    st.caption("読み間違える単語を登録してください。音声にする直前に読み方へ置き換えます。")
+
+    dict_store = get_dictionary_store()
+    current_store = store_namespace(st.session_state.get("store_name", ""))
+    namespace_labels = {"🌐 共通": GLOBAL_NAMESPACE}
+    if current_store:
+        namespace_labels[f"🏪 {current_store} のみ"] = current_store
+    dict_namespace = namespace_labels[st.radio("登録先", list(namespace_labels.keys()), horizontal=True)]
+
     with st.form("dict_form", clear_on_submit=True):
         c_word, c_read = st.columns(2)
         new_word = c_word.text_input("単語", placeholder="例: 辛口")
         new_read = c_read.text_input("読み", placeholder="例: からくち")
         if st.form_submit_button("➕ 追加"):
             if new_word and new_read:
-                user_dict[new_word] = new_read
-                save_dictionary(user_dict)
+                dict_store.put(new_word, new_read, dict_namespace)
                 st.success(f"登録: {new_word} -> {new_read}")
                 st.rerun()
 
-    if user_dict:
-        with st.expander(f"登録済み ({len(user_dict)})"):
-            for word, read in list(user_dict.items()):
+    # 件数と一部だけを読み出すため、辞書が大きくても表示の重さは変わらない
+    dict_count = dict_store.count(dict_namespace)
+    if dict_count:
+        with st.expander(f"登録済み ({dict_count})"):
+            dict_query = st.text_input("🔍 検索", key="dict_query")
+            dict_page = st.number_input("ページ", min_value=1, max_value=max(1, -(-dict_count // DICT_PAGE_SIZE)), value=1)
+            for word, read in dict_store.page(dict_namespace, dict_query, (dict_page - 1) * DICT_PAGE_SIZE, DICT_PAGE_SIZE):
                 c1, c2 = st.columns([3, 1])
                 c1.text(f"{word} : {read}")
-                if c2.button("🗑️", key=f"del_{word}"):
-                    del user_dict[word]
-                    save_dictionary(user_dict)
+                if c2.button("🗑️", key=f"del_{dict_namespace}_{word}"):
+                    dict_store.delete(word, dict_namespace)
                     st.rerun()
 
+    with st.expander("📄 CSVで一括登録・書き出し"):
+        csv_file = st.file_uploader("CSV（単語,読み）", type=["csv"], key="dict_csv")
+        if csv_file and st.button("📥 取り込む"):
+            added = dict_store.import_csv(csv_file.getvalue(), dict_namespace)
+            st.success(f"{added} 件を登録しました。")
+        st.download_button(
+            "📤 CSVを書き出す",
+            data=lambda: dict_store.export_csv(dict_namespace),
+            file_name="reading_dictionary.csv",
+            mime="text/csv"
+        )
+
 # ----------------------------
 # メイン画面
 # ----------------------------
@@ -567,18 +430,26 @@ st.markdown("""
 </div>
 """, unsafe_allow_html=True)
 
+# 作業フォルダの自動削除と、生成ジョブのワーカー・計測値の公開・公開サーバーを開始
+start_workspace_reaper()
+get_job_runner()
+start_metrics_endpoint()
+publish_store = get_publish_store()
+
 # State管理
 if 'retake_index' not in st.session_state: st.session_state.retake_index = None
 if 'captured_images' not in st.session_state: st.session_state.captured_images = []
 if 'camera_key' not in st.session_state: st.session_state.camera_key = 0
 if 'generated_result' not in st.session_state: st.session_state.generated_result = None
 if 'show_camera' not in st.session_state: st.session_state.show_camera = False
+# 再読み込み・再接続後も、URLのジョブIDから進行中のジョブや結果に戻れるようにする
+if 'active_job_id' not in st.session_state: st.session_state.active_job_id = st.query_params.get("job")
 
 # Step 1: お店情報
 st.markdown("### 🏪 1. 店舗情報入力")
 col1, col2 = st.columns(2)
 with col1: 
-    store_name = st.text_input("🏠 店名（必須）", placeholder="例：Runwith Cafe")
+    store_name = st.text_input("🏠 店名（必須）", placeholder="例：Runwith Cafe", key="store_name")
 with col2: 
     menu_title = st.text_input("📖 メニュー名（任意）", placeholder="例：ランチメニュー")
 
@@ -593,6 +464,7 @@ input_method = st.radio("入力方法", ("📂 ファイル選択", "📷 カメ
 
 final_image_list = []
 target_url = None
+follow_menu_links = False
 
 if input_method == "📂 ファイル選択":
     uploaded_files = st.file_uploader("メニュー画像", type=['png', 'jpg', 'jpeg'], accept_multiple_files=True)
@@ -647,6 +519,7 @@ elif input_method == "📷 カメラ撮影":
 
 elif input_method == "🌐 Web URL":
     target_url = st.text_input("読み取りたいURL", placeholder="https://...")
+    follow_menu_links = st.checkbox("🔗 同じサイト内のメニューページも読み込む", value=True)
 
 # 画像プレビュー & 削除/再撮影
 if final_image_list and st.session_state.retake_index is None:
@@ -669,156 +542,177 @@ st.markdown("---")
 # Step 3: 生成実行
 st.markdown("### 🚀 3. 音声メニュー生成")
 
-can_run = (final_image_list or target_url) and api_key and store_name and st.session_state.retake_index is None
+export_mode = st.radio(
+    "ZIPの形式",
+    ("📂 分割 (軽量・再生する曲だけ読み込み)", "📲 オフライン対応 (分割＋アプリとして保存)", "📄 1ファイル (音声を埋め込み)"),
+    index=0, horizontal=True,
+    help="オフライン対応は、Webサーバー（https）に置くと2回目以降は通信なしで開け、ホーム画面にも追加できます。",
+)
+segmented_export = st.checkbox(
+    "⏩ 長い説明もすぐ再生（音声を数秒ごとに区切る）",
+    value=False, disabled="1ファイル" in export_mode,
+    help="Webサーバーに置いたとき、章全体を読み込む前に再生が始まります（分割・オフライン対応のZIPのみ）。",
+)
+
+active_job = get_job_runner().store.get(st.session_state.active_job_id) if st.session_state.active_job_id else None
+if st.session_state.active_job_id and active_job is None:
+    # 保存期間を過ぎた、または存在しないジョブID
+    st.session_state.active_job_id = None
+    st.query_params.pop("job", None)
+job_in_progress = bool(active_job) and active_job["status"] in (QUEUED, RUNNING)
+
+can_run = (final_image_list or target_url) and api_key and store_name and st.session_state.retake_index is None and not job_in_progress
 
 if st.button("🎙️ 作成開始 (Runwith AI)", type="primary", disabled=not can_run, use_container_width=True):
-    with st.spinner('Runwith Menu AI が解析中...'):
-        output_dir = "menu_audio_temp"
-        if os.path.exists(output_dir): shutil.rmtree(output_dir)
-        os.makedirs(output_dir, exist_ok=True)
-
-        try:
-            genai.configure(api_key=api_key)
-            model = genai.GenerativeModel(target_model_name)
-            
-            user_dict_str = json.dumps(user_dict, ensure_ascii=False)
-            
-            # ★変更点3-C：モードに応じたプロンプトの切り替え
-            mode_instruction = ""
-            if "シンプル" in reading_mode:
-                mode_instruction = """
-                - 商品名と価格だけを簡潔に読み上げてください。
-                - 「美味しそうです」などの形容詞や説明は一切省いてください。
-                - 挨拶や余計な言葉は不要です。淡々と情報を伝えてください。
-                """
-            else:
-                mode_instruction = """
-                - 写真から「美味しそうな特徴（赤くて辛そう、ボリュームがある等）」が分かれば、一言添えて魅力を伝えてください。
-                - ユーザーが料理のイメージができるような丁寧なガイドを心がけてください。
-                """
-
-            prompt = f"""
-            役割設定:
-            あなたは視覚障害者の外食をサポートするパートナー「Runwith Menu AI」です。
-            メニュー画像を解析し、ユーザーが料理を選びやすいように整理してガイドしてください。
-
-            重要ミッション:
-            1. メニュー全体を【5つ〜8つ程度の論理的なチャプター（カテゴリー）】に分けてください。
-               （悪い例：各商品を1つのチャプターにする）
-               （良い例：「前菜」「メイン」「ドリンク」のようにまとめる）
-            
-            2. 読み上げ原稿のルール:
-               - 商品名ははっきりと。価格は必ず「円」をつけて読む。
-               - アレルギー情報や注意事項は絶対に省略しない。
-               {mode_instruction}
-
-            ★最重要：以下の固有名詞・読み方辞書を必ず守ってください。
-            {user_dict_str}
-
-            出力フォーマット（JSONのみ）:
-            [
-              {{"title": "カテゴリー名（例：おすすめ・フェア）", "text": "読み上げテキスト..."}},
-              {{"title": "カテゴリー名（例：メイン料理）", "text": "読み上げテキスト..."}}
-            ]
-            """
-            
-            inputs = [prompt]
-            if final_image_list:
-                for f in final_image_list:
-                    f.seek(0)
-                    inputs.append({"mime_type": f.type if hasattr(f, 'type') else "image/jpeg", "data": f.getvalue()})
-            elif target_url:
-                web_text = fetch_text_from_url(target_url)
-                inputs.append(web_text[:30000] if web_text else "")
-
-            resp = model.generate_content(inputs)
-            
-            text_resp = resp.text
-            match = re.search(r'\[.*\]', text_resp, re.DOTALL)
-            if not match: raise Exception("AIからの応答がJSON形式ではありませんでした。")
-            menu_data = json.loads(match.group())
-
-            intro_t = f"こんにちは、{store_name}です。"
-            if menu_title: intro_t += f"ただいまより{menu_title}をご紹介します。"
-            intro_t += "このプレイヤーは、スクリーンリーダーでの操作に対応しています。"
-            intro_t += f"このメニューは、全部で{len(menu_data)}つのカテゴリーに分かれています。まずは目次です。"
-            
-            for i, tr in enumerate(menu_data): 
-                intro_t += f"{i+1}、{tr['title']}。"
-                
-            intro_t += "それではどうぞ。"
-            menu_data.insert(0, {"title": "はじめに・目次", "text": intro_t})
-
-            progress_bar = st.progress(0)
-            generated_tracks = asyncio.run(process_all_tracks_fast(menu_data, output_dir, voice_code, rate_value, progress_bar))
-            
-            html_content = create_standalone_html_player(store_name, generated_tracks, map_url)
-            
-            date_str = datetime.now().strftime('%Y%m%d')
-            safe_name = sanitize_filename(store_name)
-            zip_name = f"Runwith_{safe_name}_{date_str}.zip"
-            zip_path = os.path.abspath(zip_name)
-            with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zf:
-                zf.writestr("index.html", html_content)
-
-            with open(zip_path, "rb") as f:
-                zip_data = f.read()
-
-            st.session_state.generated_result = {
-                "tracks": generated_tracks,
-                "html_content": html_content,
-                "html_name": f"{safe_name}_player.html",
-                "zip_data": zip_data,
-                "zip_name": zip_name,
-                "store_name": store_name
-            }
-            st.success("✨ 完成しました！")
-            st.balloons()
-            
-        except Exception as e:
-            st.error(f"エラーが発生しました: {e}")
+    raw_images = []
+    for f in final_image_list:
+        f.seek(0)
+        raw_images.append((f.getvalue(), f.type if hasattr(f, 'type') else "image/jpeg"))
+
+    job = MenuJob(
+        store_name=store_name, menu_title=menu_title, map_url=map_url,
+        images=raw_images, url=target_url, follow_links=follow_menu_links,
+        voice_code=voice_code, rate_value=rate_value, reading_mode=reading_mode,
+        split_export="1ファイル" not in export_mode, offline_export="オフライン" in export_mode,
+        segmented_export=segmented_export and "1ファイル" not in export_mode, stream_mode=stream_mode,
+        page_parallel=page_parallel, page_workers=int(page_workers), pages_per_request=int(pages_per_request),
+        image_max_edge=image_max_edge, image_quality=image_quality, scheduler_config=scheduler_config,
+        audio_profile=audio_profile, force_reanalyze=force_reanalyze,
+    )
+    # 生成はバックグラウンドのワーカーで行い、この画面は状態を確認するだけにする
+    job_id = submit_menu_job(job, api_key, target_model_name)
+    st.session_state.active_job_id = job_id
+    st.query_params["job"] = job_id
+    active_job = get_job_runner().store.get(job_id)
+    job_in_progress = True
+
+if job_in_progress:
+    job_status_panel(active_job["id"])
+elif active_job and active_job["status"] == DONE and not os.path.exists(active_job["result"]["zip_path"]):
+    # 成果物が保存期間を過ぎて削除されたジョブ
+    st.session_state.active_job_id = None
+    st.query_params.pop("job", None)
+elif active_job and active_job["status"] == DONE:
+    if (st.session_state.generated_result or {}).get("job_id") != active_job["id"]:
+        adopt_job_result(active_job)
+        result = active_job["result"]
+        tts_metrics = result["tts_metrics"]
+        show_job_notices(active_job)
+        st.success("✨ 完成しました！")
+        if "changed_tracks" in result:
+            st.caption(f"🔁 作り直した音声: {len(result['changed_tracks'])} 件（ほかは前回の音声を使用）")
+        if result.get("audio_post"):
+            st.caption(f"🔊 音声の仕上げ: {result['audio_post']['bytes_before'] // 1024} KB → {result['audio_post']['bytes_after'] // 1024} KB")
+        st.caption(f"🗂️ 音声キャッシュ: 再利用 {result['tts_cache_hits']} 件 / 新規生成 {result['tts_cache_misses']} 件")
+        st.caption(f"⏱️ 音声生成: 最大待機 {tts_metrics['peak_waiting']} 件 / 同時生成 {tts_metrics['peak_running']} 件 / 再試行 {tts_metrics['retries']} 回 / gTTS代替 {tts_metrics['fallbacks']} 件")
+        st.balloons()
+elif active_job:
+    show_job_notices(active_job)
+    st.error(f"エラーが発生しました: {active_job['error']}")
+    st.session_state.active_job_id = None
+    st.query_params.pop("job", None)
 
 # Step 4: 結果出力 & 店頭POP
+if st.session_state.generated_result and not all(
+    os.path.exists(st.session_state.generated_result[k]) for k in ("html_path", "zip_path")
+):
+    # 長時間放置で作業フォルダが削除された場合
+    st.session_state.generated_result = None
+    st.info("前回の生成結果は保存期間を過ぎたため削除されました。もう一度作成してください。")
+
 if st.session_state.generated_result:
     res = st.session_state.generated_result
+    if res.get("job_id"):
+        job_work_dir(res["job_id"])
     
     st.markdown("---")
     st.markdown("### ▶️ プレビュー")
-    render_preview_player(res["tracks"])
+    if res.get("preview_dir") and os.path.isdir(res["preview_dir"]):
+        os.utime(res["preview_dir"])
+    render_preview_player(res["tracks"], res.get("preview_playlist"))
 
     st.markdown("---")
     st.markdown("### 📥 保存")
     
     st.info("""
     **Webプレイヤー**：アクセシビリティ対応済みのHTMLファイルです。スマホへの保存やLINE共有に便利です。  
-    **ZIPファイル**：PCでの保存や、My Menu Bookへの追加にご利用ください。
+    **ZIPファイル**：PCでの保存や、My Menu Bookへの追加にご利用ください。分割形式は展開してWebサーバーに置くと、再生する曲だけを読み込むため表示が速くなります。オフライン対応版は一度開くと音声まで端末に保存され、次からは電波がなくてもすぐに開けます。
     """)
     
     c1, c2 = st.columns(2)
+    # 再実行のたびに成果物を読み込まないよう、押されたときに読む関数を渡す
     with c1:
         st.download_button(
             f"🌐 Webプレイヤー ({res['html_name']})",
-            res['html_content'],
-            res['html_name'],
-            "text/html",
+            data=lambda p=res['html_path']: read_file(p),
+            file_name=res['html_name'],
+            mime="text/html",
             type="primary"
         )
     with c2:
         st.download_button(
             f"📦 ZIPファイル ({res['zip_name']})",
-            data=res["zip_data"],
+            data=lambda p=res['zip_path']: read_file(p),
             file_name=res['zip_name'],
             mime="application/zip"
         )
 
+    if show_timing_panel and res.get("source"):
+        with st.expander("⏱️ 処理時間の内訳", expanded=True):
+            timings = res["source"].get("timings", {})
+            st.caption(" / ".join(f"{name}: {sec:.1f}秒" for name, sec in timings.items()))
+            st.dataframe(res["source"].get("stage_summary", []), use_container_width=True, hide_index=True)
+
+    with st.expander("✏️ 内容を修正して作り直す"):
+        st.caption("価格の変更などは、ここで直すと変更したチャプターの音声だけを作り直します。")
+        with st.form(f"edit_{res['job_id']}"):
+            edited = []
+            for i, chapter in enumerate(res["menu_data"][1:], 1):
+                st.markdown(f"**{i}.**")
+                title = st.text_input("タイトル", chapter['title'], key=f"edit_title_{res['job_id']}_{i}")
+                text = st.text_area("読み上げる内容", chapter['text'], key=f"edit_text_{res['job_id']}_{i}")
+                if not st.checkbox("このチャプターを削除", key=f"edit_remove_{res['job_id']}_{i}"):
+                    edited.append({"title": title, "text": text})
+            if st.form_submit_button("🔁 変更した部分だけ作り直す", disabled=job_in_progress):
+                if not edited:
+                    st.warning("チャプターが1つもありません。")
+                elif edited == [{"title": ch['title'], "text": ch['text']} for ch in res["menu_data"][1:]]:
+                    st.info("変更はありません。")
+                else:
+                    job_id = submit_update_job(res["source"], edited, scheduler_config)
+                    st.session_state.active_job_id = job_id
+                    st.query_params["job"] = job_id
+                    st.rerun()
+
+    if publish_store:
+        st.markdown("---")
+        st.markdown("### 🌐 公開")
+        st.caption("このサーバーからメニューを配信します。作り直して公開し直しても、URL（QRコード）は変わりません。")
+        store_id = st.text_input("公開ID（URLの一部になります）", make_store_id(res["store_name"]), key=f"publish_id_{res['job_id']}")
+        store_url = public_url(store_id, default_base_url(st.context.url))
+        if st.button("🌐 このメニューを公開する", use_container_width=True):
+            try:
+                publish_store.publish(store_id, res["zip_path"])
+            except ValueError as e:
+                st.error(f"公開できませんでした: {e}")
+            else:
+                # 下の店頭用POPにそのまま使う
+                st.session_state.pop_url = store_url
+                st.success("公開しました。")
+        if publish_store.current_version(store_id):
+            st.markdown(f"公開中のURL: {store_url}")
+
     st.markdown("---")
     st.markdown("### 🏪 店頭用POP作成")
-    st.warning("⚠️ まずは、ダウンロードしたHTMLファイルをインターネット上に公開（アップロード）してください。")
+    if publish_store:
+        st.info("💡 上の「公開」を押すと、公開したURLがここに入ります。")
+    else:
+        st.warning("⚠️ まずは、ダウンロードしたHTMLファイルをインターネット上に公開（アップロード）してください。")
     
-    public_url = st.text_input("公開したURLを入力 (例: https://my-shop.com/menu.html)", key="pop_url")
+    pop_url_value = st.text_input("公開したURLを入力 (例: https://my-shop.com/menu.html)", key="pop_url")
     
-    if public_url:
-        qr_url = f"https://api.qrserver.com/v1/create-qr-code/?size=300x300&data={public_url}"
+    if pop_url_value:
+        qr_url = f"https://api.qrserver.com/v1/create-qr-code/?size=300x300&data={pop_url_value}"
         
         pop_html = f"""
         <div style="border:6px solid #001F3F; padding:30px; background:white; text-align:center; max-width:400px; margin:0 auto; border-radius:20px; color:#001F3F; font-family:sans-serif;">
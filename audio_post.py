@@ -0,0 +1,89 @@
+import os
+import uuid
+import shutil
+import subprocess
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+
+# ----------------------------
+# 音声の仕上げ（音量の正規化・前後の無音の削除・音声向けの低ビットレートへの再圧縮）
+# ----------------------------
+
+FFMPEG = os.environ.get("RUNWITH_FFMPEG", "ffmpeg")
+AUDIO_POST_WORKERS = int(os.environ.get("RUNWITH_AUDIO_POST_WORKERS", str(os.cpu_count() or 2)))
+FFMPEG_TIMEOUT_SEC = 120
+# 前後の無音とみなす音量
+SILENCE_THRESHOLD_DB = -50
+
+
+@dataclass
+class AudioProfile:
+    """仕上げの設定（edge-tts と gTTS の音量差をそろえ、読み上げに十分な音質まで落とす）"""
+    bitrate: str = os.environ.get("RUNWITH_AUDIO_BITRATE", "32k")
+    mono: bool = True
+    sample_rate: int = 24000
+    normalize: bool = True
+    loudness_lufs: float = -16.0
+    trim_silence: bool = True
+    # 削除した後に前後へ残す無音（秒）
+    keep_silence_sec: float = 0.15
+
+
+def ffmpeg_available() -> bool:
+    return shutil.which(FFMPEG) is not None
+
+
+def build_filter(profile: AudioProfile) -> str:
+    filters = []
+    if profile.trim_silence:
+        # 先頭の無音を削除し、反転してもう一度削除することで末尾の無音も削る
+        trim = (f"silenceremove=start_periods=1:start_threshold={SILENCE_THRESHOLD_DB}dB"
+                f":start_silence={profile.keep_silence_sec}")
+        filters += [trim, "areverse", trim, "areverse"]
+    if profile.normalize:
+        filters.append(f"loudnorm=I={profile.loudness_lufs}:TP=-1.5:LRA=11")
+    return ",".join(filters)
+
+
+def postprocess_track(path: str, profile: AudioProfile) -> tuple[int, int]:
+    """1トラックを仕上げて置き換え、(処理前のバイト数, 処理後のバイト数) を返す
+
+    音量をそろえることが目的のため、再圧縮で大きくなっても仕上げた方を使う。
+    ffmpeg がない・失敗した・空のファイルを出した場合だけ元のファイルを残す。
+    """
+    before = os.path.getsize(path)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp.mp3"
+    cmd = [FFMPEG, "-hide_banner", "-loglevel", "error", "-y", "-i", path]
+    audio_filter = build_filter(profile)
+    if audio_filter:
+        cmd += ["-af", audio_filter]
+    if profile.mono:
+        cmd += ["-ac", "1"]
+    cmd += ["-ar", str(profile.sample_rate), "-codec:a", "libmp3lame", "-b:a", profile.bitrate,
+            "-map_metadata", "-1", "-id3v2_version", "0", "-write_xing", "0", tmp_path]
+    try:
+        subprocess.run(cmd, check=True, capture_output=True, timeout=FFMPEG_TIMEOUT_SEC)
+        after = os.path.getsize(tmp_path)
+        if after > 0:
+            os.replace(tmp_path, path)
+            return before, after
+    except (OSError, subprocess.SubprocessError):
+        pass
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return before, before
+
+
+def postprocess_tracks(paths: list[str], profile: AudioProfile, max_workers: int = AUDIO_POST_WORKERS) -> dict:
+    """複数トラックを並列に仕上げる（各トラックは別の ffmpeg プロセスで処理）"""
+    paths = [p for p in paths if os.path.exists(p)]
+    if not paths or not ffmpeg_available():
+        return {"tracks": 0, "bytes_before": 0, "bytes_after": 0}
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(paths)))) as pool:
+        sizes = list(pool.map(lambda p: postprocess_track(p, profile), paths))
+    return {
+        "tracks": len(paths),
+        "bytes_before": sum(b for b, _ in sizes),
+        "bytes_after": sum(a for _, a in sizes),
+    }
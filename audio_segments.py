@@ -0,0 +1,67 @@
+import os
+import math
+import struct
+import hashlib
+import zipfile
+import posixpath
+from mp3_frames import split_frames
+
+# ----------------------------
+# 章の音声の分割配信（HLS形式：短い区切りのMP3と .m3u8 のプレイリスト）
+# ----------------------------
+
+# 1区切りの長さ（秒）。再生開始までに読み込むのは最初の1区切りだけになる
+SEGMENT_SEC = float(os.environ.get("RUNWITH_SEGMENT_SEC", "4"))
+# ファイル名に入れる内容のハッシュの桁数（tracks/01/000.<ハッシュ>.mp3）
+CONTENT_HASH_CHARS = 10
+# HLS のパック音声では、各区切りの先頭の ID3 タグにこの名前で開始時刻を入れる
+HLS_TIMESTAMP_OWNER = b"com.apple.streaming.transportStreamTimestamp\x00"
+
+
+def _syncsafe(n: int) -> bytes:
+    return bytes([(n >> 21) & 0x7F, (n >> 14) & 0x7F, (n >> 7) & 0x7F, n & 0x7F])
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()[:CONTENT_HASH_CHARS]
+
+
+def timestamp_tag(start_sec: float) -> bytes:
+    """区切りの開始時刻（90kHz 単位・33ビット）を記録した ID3v2.4 タグ"""
+    body = HLS_TIMESTAMP_OWNER + struct.pack(">Q", round(start_sec * 90000) & ((1 << 33) - 1))
+    frame = b"PRIV" + _syncsafe(len(body)) + b"\x00\x00" + body
+    return b"ID3\x04\x00\x00" + _syncsafe(len(frame)) + frame
+
+
+def build_m3u8(segments: list[tuple[str, float]]) -> str:
+    """(区切りのURL, 秒) の一覧から、最後まで確定したHLSプレイリスト（VOD）を作る"""
+    target = max([math.ceil(d) for _, d in segments] or [1])
+    lines = ["#EXTM3U", "#EXT-X-VERSION:3", f"#EXT-X-TARGETDURATION:{target}",
+             "#EXT-X-MEDIA-SEQUENCE:0", "#EXT-X-PLAYLIST-TYPE:VOD"]
+    for uri, duration in segments:
+        lines += [f"#EXTINF:{duration:.3f},", uri]
+    lines.append("#EXT-X-ENDLIST")
+    return "\n".join(lines) + "\n"
+
+
+def write_segmented_track(zf, path: str, base: str, segment_sec: float = SEGMENT_SEC) -> dict:
+    """path の音声を <base>/NNN.<ハッシュ>.mp3 に区切って ZIP に入れ、<base>.<ハッシュ>.m3u8 も加える
+
+    戻り値はプレイヤーのプレイリスト項目（src は .m3u8、segs は [区切りのURL, 秒] の一覧、dur は章全体の秒）。
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    segs = []
+    start = 0.0
+    for n, (chunk, duration) in enumerate(split_frames(data, segment_sec)):
+        body = timestamp_tag(start) + chunk
+        name = f"{base}/{n:03}.{content_hash(body)}.mp3"
+        # MP3は圧縮済みのため無圧縮で格納
+        zf.writestr(name, body, compress_type=zipfile.ZIP_STORED)
+        segs.append([name, round(duration, 3)])
+        start += duration
+    prefix = posixpath.basename(base)
+    m3u8 = build_m3u8([(f"{prefix}/{posixpath.basename(name)}", d) for name, d in segs]).encode("utf-8")
+    src = f"{base}.{content_hash(m3u8)}.m3u8"
+    zf.writestr(src, m3u8)
+    return {"src": src, "dur": round(start, 3), "segs": segs}
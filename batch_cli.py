@@ -0,0 +1,216 @@
+"""複数店舗の音声メニューをまとめて生成するコマンドラインツール
+
+使い方:
+    python batch_cli.py stores.csv --out batch_output --workers 3
+
+マニフェスト（CSV または JSON の配列）の列:
+    store_name（必須）, menu_title, images（; 区切り・ワイルドカード可）, url,
+    map_url, voice（female / male / 音声コード）, mode（simple / detail）, id
+
+完了した店舗は <out>/<id>/result.json に記録され、再実行時はスキップされます（--force で再生成）。
+店舗ごとの所要時間は <out>/report.jsonl と <out>/report.csv に出力されます。
+"""
+import os
+import csv
+import sys
+import json
+import glob
+import time
+import argparse
+import mimetypes
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from tts_cache import TTSCache
+from menu_cache import MenuResultCache
+from menu_pipeline import (
+    MenuJob, VOICE_OPTIONS, READING_MODES,
+    create_model, run_menu_pipeline, sanitize_filename,
+)
+from dictionary_store import DICT_DB_PATH, DictionaryStore
+from audio_post import AudioProfile
+from publish_server import PublishStore, make_store_id
+
+VOICE_ALIASES = {
+    "female": VOICE_OPTIONS["👩 女性"], "女性": VOICE_OPTIONS["👩 女性"],
+    "male": VOICE_OPTIONS["👨 男性"], "男性": VOICE_OPTIONS["👨 男性"],
+}
+MODE_ALIASES = {"simple": READING_MODES[0], "シンプル": READING_MODES[0], "detail": READING_MODES[1], "詳細": READING_MODES[1]}
+REPORT_FIELDS = ["id", "store_name", "status", "error", "input", "pages", "analysis", "analysis+tts", "tts",
+                 "html", "zip", "total", "zip_path"]
+
+
+def load_manifest(path: str) -> list[dict]:
+    """CSV または JSON のマニフェストを読み込む"""
+    if path.lower().endswith(".json"):
+        with open(path, "r", encoding="utf-8") as f:
+            rows = json.load(f)
+    else:
+        with open(path, "r", encoding="utf-8-sig", newline="") as f:
+            rows = list(csv.DictReader(f))
+    base_dir = os.path.dirname(os.path.abspath(path))
+    stores = []
+    for row in rows:
+        row = {k: (v.strip() if isinstance(v, str) else v) for k, v in row.items() if k}
+        if not row.get("store_name"):
+            continue
+        row.setdefault("id", "")
+        row["id"] = row["id"] or sanitize_filename(row["store_name"])
+        row["base_dir"] = base_dir
+        stores.append(row)
+    return stores
+
+
+def read_images(value, base_dir: str) -> list[tuple[bytes, str]]:
+    patterns = value if isinstance(value, list) else [p for p in (value or "").split(";") if p.strip()]
+    images = []
+    for pattern in patterns:
+        pattern = pattern.strip()
+        if not os.path.isabs(pattern):
+            pattern = os.path.join(base_dir, pattern)
+        for path in sorted(glob.glob(pattern)):
+            with open(path, "rb") as f:
+                images.append((f.read(), mimetypes.guess_type(path)[0] or "image/jpeg"))
+    return images
+
+
+_caches = None
+
+
+def process_caches(dict_path: str) -> tuple[TTSCache, MenuResultCache, DictionaryStore]:
+    """ワーカープロセスごとに1度だけキャッシュと辞書を開く"""
+    global _caches
+    if _caches is None:
+        _caches = (TTSCache(), MenuResultCache(), DictionaryStore(dict_path))
+    return _caches
+
+
+def run_store(row: dict, options: dict) -> dict:
+    """1店舗分を生成（ワーカープロセス内で実行）"""
+    store_dir = os.path.join(options["out"], row["id"])
+    summary = {"id": row["id"], "store_name": row["store_name"]}
+    try:
+        job = MenuJob(
+            store_name=row["store_name"],
+            menu_title=row.get("menu_title", ""),
+            map_url=row.get("map_url", ""),
+            images=read_images(row.get("images"), row["base_dir"]),
+            url=row.get("url") or None,
+            follow_links=options["follow_links"],
+            voice_code=VOICE_ALIASES.get(row.get("voice") or "female", row.get("voice")),
+            reading_mode=MODE_ALIASES.get(row.get("mode") or "simple", READING_MODES[0]),
+            split_export=not options["single_file"],
+            offline_export=options["offline"],
+            segmented_export=options["segmented"],
+            audio_profile=AudioProfile(bitrate=options["audio_bitrate"]) if options["audio_bitrate"] else None,
+            force_reanalyze=options["reanalyze"],
+        )
+        if not job.images and not job.url:
+            raise ValueError("images と url のどちらも指定されていません")
+        model = create_model(options["api_key"], options["model"])
+        tts_cache, menu_cache, dict_store = process_caches(options["dict_path"])
+        result = run_menu_pipeline(
+            job, model, options["model"], os.path.join(store_dir, "audio"), store_dir,
+            dict_store.readings(job.store_name), tts_cache, menu_cache,
+        )
+        summary.update(status="ok", zip_path=result["zip_path"], timings=result["timings"],
+                       chapters=len(result["menu_data"]) - 1)
+        if options["publish_root"]:
+            store_id = make_store_id(row["id"])
+            PublishStore(options["publish_root"]).publish(store_id, result["zip_path"])
+            summary["published_path"] = f"/{store_id}/"
+    except Exception as e:
+        summary.update(status="error", error=str(e))
+    write_result(options["out"], summary)
+    return summary
+
+
+def write_result(out: str, summary: dict):
+    """店舗の結果を <out>/<id>/result.json に記録する"""
+    summary["finished_at"] = time.time()
+    store_dir = os.path.join(out, summary["id"])
+    os.makedirs(store_dir, exist_ok=True)
+    with open(os.path.join(store_dir, "result.json"), "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+
+
+def is_done(out: str, store_id: str) -> bool:
+    try:
+        with open(os.path.join(out, store_id, "result.json"), "r", encoding="utf-8") as f:
+            return json.load(f).get("status") == "ok"
+    except (OSError, ValueError):
+        return False
+
+
+def write_report_csv(out: str, stores: list[dict]):
+    """全店舗の最新結果を report.csv にまとめる"""
+    with open(os.path.join(out, "report.csv"), "w", encoding="utf-8-sig", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        for row in stores:
+            try:
+                with open(os.path.join(out, row["id"], "result.json"), "r", encoding="utf-8") as rf:
+                    summary = json.load(rf)
+            except (OSError, ValueError):
+                summary = {"id": row["id"], "store_name": row["store_name"], "status": "pending"}
+            writer.writerow({**summary, **summary.get("timings", {})})
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Runwith Menu Maker 一括生成")
+    parser.add_argument("manifest", help="店舗一覧（CSV または JSON）")
+    parser.add_argument("--out", default="batch_output", help="出力先フォルダ")
+    parser.add_argument("--workers", type=int, default=2, help="同時に処理する店舗数（プロセス数）")
+    parser.add_argument("--model", default="models/gemini-2.5-flash", help="使用するGeminiモデル")
+    parser.add_argument("--api-key", default=os.environ.get("GEMINI_API_KEY"), help="Gemini APIキー（既定: 環境変数 GEMINI_API_KEY）")
+    parser.add_argument("--dict", default=DICT_DB_PATH, help="読み方辞書のデータベース（共通＋店舗ごとの辞書を適用）")
+    parser.add_argument("--single-file", action="store_true", help="ZIPを音声埋め込みの1ファイル形式にする")
+    parser.add_argument("--offline", action="store_true", help="分割形式のZIPにサービスワーカーとマニフェストを加える（--single-file とは併用不可）")
+    parser.add_argument("--segmented", action="store_true", help="分割形式のZIPで各章を数秒ごとの区切りと .m3u8 に分ける（--single-file とは併用不可）")
+    parser.add_argument("--follow-links", action="store_true", help="URL入力時に同じサイトのメニューページも読み込む")
+    parser.add_argument("--audio-bitrate", help="指定すると音量の正規化・無音削除のうえこのビットレートで再圧縮する（例: 32k、ffmpeg が必要）")
+    parser.add_argument("--publish-root", help="指定すると生成したZIPを公開サーバーの保存先（例: published）に店舗IDで公開する")
+    parser.add_argument("--force", action="store_true", help="完了済みの店舗も再生成する")
+    parser.add_argument("--reanalyze", action="store_true", help="保存済みの解析結果を使わず、メニュー画像を読み直す")
+    args = parser.parse_args(argv)
+
+    if not args.api_key:
+        parser.error("APIキーを --api-key または環境変数 GEMINI_API_KEY で指定してください")
+    if args.single_file and (args.offline or args.segmented):
+        parser.error("--offline / --segmented は分割形式のZIPにだけ使えます（--single-file と併用できません）")
+    stores = load_manifest(args.manifest)
+    os.makedirs(args.out, exist_ok=True)
+    pending = [row for row in stores if args.force or not is_done(args.out, row["id"])]
+    print(f"{len(stores)} 店舗中 {len(stores) - len(pending)} 店舗は完了済み、{len(pending)} 店舗を生成します。")
+
+    options = {
+        "out": args.out, "api_key": args.api_key, "model": args.model,
+        "single_file": args.single_file, "offline": args.offline, "segmented": args.segmented,
+        "follow_links": args.follow_links, "reanalyze": args.reanalyze,
+        "dict_path": args.dict, "audio_bitrate": args.audio_bitrate, "publish_root": args.publish_root,
+    }
+    failures = 0
+    with ProcessPoolExecutor(max_workers=max(1, args.workers)) as pool, \
+            open(os.path.join(args.out, "report.jsonl"), "a", encoding="utf-8") as report:
+        futures = {pool.submit(run_store, row, options): row for row in pending}
+        for fut in as_completed(futures):
+            try:
+                summary = fut.result()
+            except Exception as e:  # BrokenProcessPool など
+                # ワーカーごと落ちた店舗もエラーとして記録し、残りの店舗と report.csv の出力を続ける
+                row = futures[fut]
+                summary = {"id": row["id"], "store_name": row["store_name"], "status": "error",
+                           "error": f"ワーカーが異常終了しました: {e!r}"}
+                write_result(args.out, summary)
+            report.write(json.dumps(summary, ensure_ascii=False) + "\n")
+            report.flush()
+            if summary["status"] == "ok":
+                print(f"✅ {summary['store_name']}: {summary['timings']['total']:.1f}秒 -> {summary['zip_path']}")
+            else:
+                failures += 1
+                print(f"❌ {summary['store_name']}: {summary['error']}", file=sys.stderr)
+
+    write_report_csv(args.out, stores)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,267 @@
+"""Gemini・edge-tts・gTTS を手元の代用品に置き換えて、生成処理の速さを計測するツール
+
+使い方:
+    python benchmark.py --sizes small,medium,large --repeat 3 --out bench.json
+    python benchmark.py --compare bench.json --out bench_new.json   # 前回の結果と比べる
+
+代用品は遅延と失敗率を指定でき、音声はそれらしい長さの MP3 フレーム列を返します。
+1回の計測は別プロセスで行うため、ピークメモリ（RSS）は計測ごとの値になります。
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import resource
+import statistics
+import tempfile
+import multiprocessing
+from dataclasses import dataclass, asdict
+
+# メニューの大きさ -> (チャプター数, 1チャプターあたりの品数)
+MENU_SIZES = {"small": (3, 5), "medium": (6, 15), "large": (8, 40)}
+ITEM_NAMES = ["唐揚げ定食", "辛口カレー", "季節のサラダ", "自家製プリン", "生ビール", "烏龍茶", "焼き鳥盛り合わせ", "海鮮丼"]
+# edge-tts の既定出力（MPEG-2 Layer III・24kHz・48kbps）の1フレーム（144バイト・0.024秒）
+FAKE_FRAME = bytes([0xFF, 0xF3, 0x64, 0xC4]) + bytes(140)
+FAKE_FRAME_SEC = 0.024
+# 読み上げ1文字あたりの秒数（速度 +10% の目安）
+SECONDS_PER_CHAR = 0.12
+
+
+def synthetic_menu(size: str, seed: int = 0) -> list[dict]:
+    """指定の大きさの架空メニュー（目次を除くチャプターの一覧）"""
+    chapters, items = MENU_SIZES[size]
+    rng = random.Random(seed)
+    menu = []
+    for c in range(chapters):
+        lines = [f"{rng.choice(ITEM_NAMES)}、{rng.randrange(3, 30) * 50}円。" for _ in range(items)]
+        menu.append({"title": f"カテゴリー{c + 1}", "text": "\n".join(lines)})
+    return menu
+
+
+def fake_mp3(text: str) -> bytes:
+    return FAKE_FRAME * max(1, int(len(text) * SECONDS_PER_CHAR / FAKE_FRAME_SEC))
+
+
+@dataclass
+class BackendProfile:
+    """代用品の振る舞い（遅延は秒・失敗率は 0〜1）"""
+    gemini_latency: float = 1.0
+    gemini_failure_rate: float = 0.0
+    tts_latency: float = 0.3
+    tts_failure_rate: float = 0.05
+    gtts_latency: float = 0.8
+    gtts_failure_rate: float = 0.0
+    seed: int = 0
+
+
+class FakeCommunicate:
+    """edge_tts.Communicate の代わり"""
+    profile = BackendProfile()
+    rng = random.Random(0)
+
+    def __init__(self, text, voice=None, rate=None):
+        self.text = text
+
+    async def save(self, filename):
+        await asyncio.sleep(self.profile.tts_latency * (0.5 + self.rng.random()))
+        if self.rng.random() < self.profile.tts_failure_rate:
+            raise ConnectionError("fake edge-tts failure")
+        with open(filename, "wb") as f:
+            f.write(fake_mp3(self.text))
+
+
+class FakeGTTS:
+    """gtts.gTTS の代わり"""
+    profile = BackendProfile()
+    rng = random.Random(0)
+
+    def __init__(self, text, lang="ja"):
+        self.text = text
+
+    def save(self, filename):
+        time.sleep(self.profile.gtts_latency * (0.5 + self.rng.random()))
+        if self.rng.random() < self.profile.gtts_failure_rate:
+            raise ConnectionError("fake gTTS failure")
+        with open(filename, "wb") as f:
+            f.write(fake_mp3(self.text))
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeModel:
+    """GenerativeModel の代わり。stream=True では応答を少しずつ返す"""
+
+    def __init__(self, menu: list[dict], profile: BackendProfile):
+        self.body = json.dumps(menu, ensure_ascii=False)
+        self.profile = profile
+        self.rng = random.Random(profile.seed)
+
+    def generate_content(self, inputs, stream=False):
+        if self.rng.random() < self.profile.gemini_failure_rate:
+            raise ConnectionError("fake Gemini failure")
+        if not stream:
+            time.sleep(self.profile.gemini_latency)
+            return FakeResponse(self.body)
+        return self._stream()
+
+    def _stream(self):
+        chunk = 200
+        pieces = [self.body[i:i + chunk] for i in range(0, len(self.body), chunk)]
+        for piece in pieces:
+            time.sleep(self.profile.gemini_latency / len(pieces))
+            yield FakeResponse(piece)
+
+
+def _dir_bytes(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(base, name)) for base, _, names in os.walk(path) for name in names)
+
+
+def run_scenario(size: str, mode: str, split_export: bool, concurrency: int, profile: BackendProfile) -> dict:
+    """1回分の計測（新しいプロセスの中で実行する）"""
+    with tempfile.TemporaryDirectory() as work:
+        # 計測中の記録は本番のログに混ぜない
+        os.environ["RUNWITH_METRICS_DIR"] = os.path.join(work, "metrics")
+        # 本物の通信をしないよう、パイプラインを読み込む前に代用品へ差し替える
+        import edge_tts
+        edge_tts.Communicate = FakeCommunicate
+        import menu_pipeline
+        import tts_scheduler
+        menu_pipeline.gTTS = FakeGTTS
+        FakeCommunicate.profile = FakeGTTS.profile = profile
+        FakeCommunicate.rng, FakeGTTS.rng = random.Random(profile.seed), random.Random(profile.seed + 1)
+
+        chapters = synthetic_menu(size, profile.seed)
+        # レート制限（トークンバケット）は本番と同じ設定のまま計測に含める
+        config = tts_scheduler.SchedulerConfig(max_concurrency=concurrency)
+        output_dir, export_dir = os.path.join(work, "audio"), os.path.join(work, "export")
+        os.makedirs(output_dir)
+        os.makedirs(export_dir)
+        started = time.perf_counter()
+        if mode == "pipeline":
+            job = menu_pipeline.MenuJob(store_name="ベンチマーク食堂", url="about:blank", split_export=split_export,
+                                        stream_mode=True, scheduler_config=config)
+            menu_pipeline.fetch_text_from_url = lambda url, follow_links=False: "架空のメニュー"
+            result = menu_pipeline.run_menu_pipeline(job, FakeModel(chapters, profile), "fake", output_dir, export_dir, None)
+            timings, tts_metrics = result["timings"], result["tts_metrics"]
+            html_path, zip_path = result["html_path"], result["zip_path"]
+        else:
+            menu_data = [{"title": "はじめに・目次",
+                          "text": menu_pipeline.build_intro_text("ベンチマーク食堂", "", chapters)}] + chapters
+            t = time.perf_counter()
+            tracks, tts_metrics = asyncio.run(menu_pipeline.process_all_tracks_fast(
+                menu_data, output_dir, menu_pipeline.VOICE_OPTIONS["👩 女性"], "+10%", None, None, config
+            ))
+            timings = {"tts": round(time.perf_counter() - t, 3)}
+            exported = menu_pipeline.export_player("ベンチマーク食堂", tracks, "", export_dir, split_export, timings)
+            html_path, zip_path = exported["html_path"], exported["zip_path"]
+        wall = time.perf_counter() - started
+
+        return {
+            "size": size,
+            "mode": mode,
+            "export": "split" if split_export else "single",
+            "chapters": len(chapters),
+            "wall_sec": round(wall, 3),
+            "timings": timings,
+            # Linux の ru_maxrss は KB 単位
+            "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            "audio_bytes": _dir_bytes(output_dir),
+            "html_bytes": os.path.getsize(html_path),
+            "zip_bytes": os.path.getsize(zip_path),
+            "retries": tts_metrics["retries"],
+            "fallbacks": tts_metrics["fallbacks"],
+        }
+
+
+def summarize(runs: list[dict]) -> list[dict]:
+    """大きさ・方式ごとに、所要時間は中央値、メモリは最大値でまとめる"""
+    groups = {}
+    for run in runs:
+        groups.setdefault((run["size"], run["mode"], run["export"]), []).append(run)
+    rows = []
+    for (size, mode, export), group in groups.items():
+        rows.append({
+            "size": size, "mode": mode, "export": export, "runs": len(group),
+            "wall_sec": round(statistics.median(r["wall_sec"] for r in group), 3),
+            "peak_rss_mb": max(r["peak_rss_mb"] for r in group),
+            "html_bytes": group[-1]["html_bytes"],
+            "zip_bytes": group[-1]["zip_bytes"],
+            "retries": round(statistics.mean(r["retries"] for r in group), 1),
+            "fallbacks": round(statistics.mean(r["fallbacks"] for r in group), 1),
+        })
+    return rows
+
+
+def print_table(rows: list[dict], baseline: list[dict] | None = None):
+    base = {(r["size"], r["mode"], r["export"]): r for r in baseline or []}
+    print(f"{'size':<8}{'mode':<10}{'export':<8}{'wall(s)':>10}{'RSS(MB)':>10}{'html(KB)':>11}{'zip(KB)':>10}{'retry':>7}{'gTTS':>6}")
+    for r in rows:
+        line = (f"{r['size']:<8}{r['mode']:<10}{r['export']:<8}{r['wall_sec']:>10.2f}{r['peak_rss_mb']:>10.1f}"
+                f"{r['html_bytes'] / 1024:>11.0f}{r['zip_bytes'] / 1024:>10.0f}{r['retries']:>7}{r['fallbacks']:>6}")
+        old = base.get((r["size"], r["mode"], r["export"]))
+        if old and old["wall_sec"]:
+            line += f"   wall {100 * (r['wall_sec'] / old['wall_sec'] - 1):+.1f}% / RSS {r['peak_rss_mb'] - old['peak_rss_mb']:+.1f}MB"
+        print(line)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Runwith Menu Maker オフライン性能計測")
+    parser.add_argument("--sizes", default="small,medium,large", help=f"計測するメニューの大きさ（{','.join(MENU_SIZES)}）")
+    parser.add_argument("--mode", choices=("tracks", "pipeline"), default="tracks",
+                        help="tracks: 音声合成〜HTML/ZIP、pipeline: 解析（代用品）を含む全体")
+    parser.add_argument("--single-file", action="store_true", help="ZIPを音声埋め込みの1ファイル形式にする")
+    parser.add_argument("--repeat", type=int, default=3, help="1条件あたりの計測回数")
+    parser.add_argument("--concurrency", type=int, default=4, help="音声の同時生成数")
+    parser.add_argument("--gemini-latency", type=float, default=BackendProfile.gemini_latency)
+    parser.add_argument("--gemini-failure-rate", type=float, default=BackendProfile.gemini_failure_rate)
+    parser.add_argument("--tts-latency", type=float, default=BackendProfile.tts_latency)
+    parser.add_argument("--tts-failure-rate", type=float, default=BackendProfile.tts_failure_rate)
+    parser.add_argument("--gtts-latency", type=float, default=BackendProfile.gtts_latency)
+    parser.add_argument("--gtts-failure-rate", type=float, default=BackendProfile.gtts_failure_rate)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="結果を書き出すJSONファイル")
+    parser.add_argument("--compare", help="比較する前回の結果（--out で書き出したJSON）")
+    args = parser.parse_args(argv)
+
+    sizes = [s.strip() for s in args.sizes.split(",") if s.strip()]
+    unknown = [s for s in sizes if s not in MENU_SIZES]
+    if unknown:
+        parser.error(f"不明な大きさ: {', '.join(unknown)}")
+    profile = BackendProfile(args.gemini_latency, args.gemini_failure_rate, args.tts_latency, args.tts_failure_rate,
+                             args.gtts_latency, args.gtts_failure_rate, args.seed)
+
+    # 計測ごとに新しいプロセスを使い、前の計測のメモリやキャッシュを持ち越さない
+    ctx = multiprocessing.get_context("spawn")
+    runs = []
+    for size in sizes:
+        for n in range(args.repeat):
+            try:
+                with ctx.Pool(1) as pool:
+                    run = pool.apply(run_scenario, (size, args.mode, not args.single_file, args.concurrency, profile))
+            except Exception as e:
+                print(f"{size} #{n + 1}: 失敗 ({e})", file=sys.stderr)
+                continue
+            runs.append(run)
+            print(f"{size} #{n + 1}: {run['wall_sec']:.2f}秒", file=sys.stderr)
+
+    rows = summarize(runs)
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)["summary"]
+    print_table(rows, baseline)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"profile": asdict(profile), "mode": args.mode, "concurrency": args.concurrency,
+                       "summary": rows, "runs": runs}, f, ensure_ascii=False, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
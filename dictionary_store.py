@@ -0,0 +1,154 @@
+import io
+import os
+import csv
+import json
+import time
+import sqlite3
+import threading
+from reading_dict import ReadingDictionary
+
+# ----------------------------
+# 読み方辞書の保存先（SQLite・共通／店舗ごとの名前空間・変更番号で無効化するキャッシュ）
+# ----------------------------
+
+DICT_DB_PATH = os.environ.get("RUNWITH_DICT_DB", "dictionary.sqlite3")
+# 以前の JSON 形式の辞書（データベースが空のときに共通辞書として取り込む）
+LEGACY_DICT_FILE = "my_dictionary.json"
+GLOBAL_NAMESPACE = ""
+# 画面に一度に表示する件数
+DICT_PAGE_SIZE = 50
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    namespace TEXT NOT NULL,
+    word TEXT NOT NULL,
+    reading TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (namespace, word)
+);
+CREATE TABLE IF NOT EXISTS namespaces (
+    namespace TEXT PRIMARY KEY,
+    version INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+
+def store_namespace(store_name: str) -> str:
+    """店舗名から店舗ごとの辞書の名前空間を決める（画面の入力とジョブで前後の空白の有無が違っても同じ辞書を使う）"""
+    return (store_name or "").strip()
+
+
+class DictionaryStore:
+    """辞書の読み書き。書き込みは1トランザクションで行い、名前空間の変更番号を上げる
+
+    読み出し結果と変換済みの ReadingDictionary は変更番号が同じ間だけ再利用するため、
+    別のセッションやプロセスが書き込んでも次の読み出しで反映される。
+    """
+
+    def __init__(self, db_path: str = DICT_DB_PATH, legacy_file: str = LEGACY_DICT_FILE):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        # 名前空間 -> (変更番号, 辞書)
+        self._entries_cache: dict[str, tuple[int, dict]] = {}
+        # (共通の変更番号, 店舗の変更番号, 店舗名) -> 変換済み辞書
+        self._compiled_cache: dict[tuple, ReadingDictionary] = {}
+        if legacy_file and os.path.exists(legacy_file) and not self.count(GLOBAL_NAMESPACE):
+            with open(legacy_file, "r", encoding="utf-8") as f:
+                self.put_many(json.load(f).items(), GLOBAL_NAMESPACE)
+
+    def _write(self, namespace: str, statements: list[tuple[str, tuple]]) -> int:
+        """statements をまとめて実行し、名前空間の変更番号を上げる（途中で失敗すれば何も反映しない）"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                changed = 0
+                for sql, params in statements:
+                    changed += self._conn.execute(sql, params).rowcount
+                self._conn.execute(
+                    "INSERT INTO namespaces (namespace, version) VALUES (?, 1) "
+                    "ON CONFLICT(namespace) DO UPDATE SET version = version + 1", (namespace,)
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return changed
+
+    def version(self, namespace: str = GLOBAL_NAMESPACE) -> int:
+        with self._lock:
+            row = self._conn.execute("SELECT version FROM namespaces WHERE namespace = ?", (namespace,)).fetchone()
+        return row[0] if row else 0
+
+    def put(self, word: str, reading: str, namespace: str = GLOBAL_NAMESPACE):
+        self.put_many([(word, reading)], namespace)
+
+    def put_many(self, items, namespace: str = GLOBAL_NAMESPACE) -> int:
+        now = time.time()
+        sql = ("INSERT INTO entries (namespace, word, reading, updated_at) VALUES (?, ?, ?, ?) "
+               "ON CONFLICT(namespace, word) DO UPDATE SET reading = excluded.reading, updated_at = excluded.updated_at")
+        statements = [(sql, (namespace, word.strip(), reading.strip(), now))
+                      for word, reading in items if word and word.strip() and reading and reading.strip()]
+        return self._write(namespace, statements) if statements else 0
+
+    def delete(self, word: str, namespace: str = GLOBAL_NAMESPACE):
+        self._write(namespace, [("DELETE FROM entries WHERE namespace = ? AND word = ?", (namespace, word))])
+
+    def count(self, namespace: str = GLOBAL_NAMESPACE) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM entries WHERE namespace = ?", (namespace,)).fetchone()[0]
+
+    def page(self, namespace: str = GLOBAL_NAMESPACE, query: str = "", offset: int = 0, limit: int = DICT_PAGE_SIZE) -> list[tuple[str, str]]:
+        """画面表示用に一部だけ取り出す（query は単語・読みの部分一致）"""
+        pattern = f"%{query}%"
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT word, reading FROM entries WHERE namespace = ? AND (word LIKE ? OR reading LIKE ?) "
+                "ORDER BY word LIMIT ? OFFSET ?", (namespace, pattern, pattern, limit, offset)
+            ).fetchall()
+        return [tuple(row) for row in rows]
+
+    def entries(self, namespace: str = GLOBAL_NAMESPACE) -> dict:
+        version = self.version(namespace)
+        cached = self._entries_cache.get(namespace)
+        if cached and cached[0] == version:
+            return cached[1]
+        with self._lock:
+            rows = self._conn.execute("SELECT word, reading FROM entries WHERE namespace = ?", (namespace,)).fetchall()
+        entries = dict(rows)
+        self._entries_cache[namespace] = (version, entries)
+        return entries
+
+    def readings(self, store_name: str = "") -> ReadingDictionary:
+        """共通辞書に店舗の辞書を重ねたもの（同じ単語は店舗側が優先）"""
+        store_name = store_namespace(store_name)
+        key = (self.version(GLOBAL_NAMESPACE), self.version(store_name) if store_name else 0, store_name)
+        compiled = self._compiled_cache.get(key)
+        if compiled is None:
+            merged = dict(self.entries(GLOBAL_NAMESPACE))
+            if store_name:
+                merged.update(self.entries(store_name))
+            compiled = ReadingDictionary(merged)
+            # 古い変更番号のものは使われないので、同じ店舗の分は入れ替える
+            self._compiled_cache = {k: v for k, v in self._compiled_cache.items() if k[2] != store_name}
+            self._compiled_cache[key] = compiled
+        return compiled
+
+    def import_csv(self, data: bytes | str, namespace: str = GLOBAL_NAMESPACE) -> int:
+        """「単語,読み」の CSV を取り込む（見出し行 word,reading / 単語,読み は読み飛ばす）"""
+        text = data.decode("utf-8-sig") if isinstance(data, bytes) else data
+        items = []
+        for row in csv.reader(io.StringIO(text)):
+            if len(row) < 2 or row[0].strip() in ("word", "単語"):
+                continue
+            items.append((row[0], row[1]))
+        return self.put_many(items, namespace)
+
+    def export_csv(self, namespace: str = GLOBAL_NAMESPACE) -> bytes:
+        out = io.StringIO()
+        writer = csv.writer(out)
+        writer.writerow(["word", "reading"])
+        writer.writerows(sorted(self.entries(namespace).items()))
+        return out.getvalue().encode("utf-8-sig")
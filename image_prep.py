@@ -0,0 +1,45 @@
+import io
+import os
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageOps
+
+# ----------------------------
+# Geminiへ送る前の画像の縮小・再圧縮
+# ----------------------------
+
+IMAGE_MAX_EDGE = int(os.environ.get("RUNWITH_IMAGE_MAX_EDGE", "1600"))
+IMAGE_JPEG_QUALITY = int(os.environ.get("RUNWITH_IMAGE_JPEG_QUALITY", "80"))
+IMAGE_WORKERS = int(os.environ.get("RUNWITH_IMAGE_WORKERS", "4"))
+
+
+def flatten_alpha(img: Image.Image) -> Image.Image:
+    """透過部分を白で塗る（そのまま RGB にすると透明な背景が黒くなり、文字が読めなくなる）"""
+    if img.mode in ("RGBA", "LA", "PA") or (img.mode == "P" and "transparency" in img.info):
+        img = img.convert("RGBA")
+        return Image.alpha_composite(Image.new("RGBA", img.size, "white"), img)
+    return img
+
+
+def preprocess_image(data: bytes, mime_type: str, max_edge: int = IMAGE_MAX_EDGE,
+                     quality: int = IMAGE_JPEG_QUALITY, grayscale: bool = False) -> tuple[bytes, str]:
+    """EXIFの向きを反映し、長辺 max_edge 以下のJPEGに変換（読めない画像はそのまま返す）"""
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            img = flatten_alpha(ImageOps.exif_transpose(img))
+            img = img.convert("L" if grayscale else "RGB")
+            img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+            out = io.BytesIO()
+            img.save(out, "JPEG", quality=quality, optimize=True)
+    except Exception:
+        return data, mime_type
+    return out.getvalue(), "image/jpeg"
+
+
+def preprocess_images(images: list[tuple[bytes, str]], max_edge: int = IMAGE_MAX_EDGE,
+                      quality: int = IMAGE_JPEG_QUALITY, grayscale: bool = False,
+                      max_workers: int = IMAGE_WORKERS) -> list[tuple[bytes, str]]:
+    """複数ページをスレッドプールで並列に前処理（順序は保持）"""
+    if not images:
+        return []
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(images))) as pool:
+        return list(pool.map(lambda item: preprocess_image(item[0], item[1], max_edge, quality, grayscale), images))
@@ -0,0 +1,291 @@
+import os
+import json
+import time
+import uuid
+import pickle
+import logging
+import sqlite3
+import threading
+
+# ----------------------------
+# 生成ジョブのキュー（SQLiteに状態を保存し、決まった数のワーカースレッドで順に処理）
+# ----------------------------
+
+JOB_DB_PATH = os.environ.get("RUNWITH_JOB_DB", "jobs.sqlite3")
+JOB_WORKERS = int(os.environ.get("RUNWITH_JOB_WORKERS", "2"))
+# 完了・失敗したジョブの記録を残す期間
+JOB_RETENTION_SEC = int(os.environ.get("RUNWITH_JOB_RETENTION_SEC", str(24 * 3600)))
+# 進捗の書き込みはこの間隔より細かくしない
+PROGRESS_WRITE_INTERVAL_SEC = 0.5
+# 実行中のジョブの担当期限。担当のプロセスはこの 1/3 ごとに延長し、切れたものだけを他が引き取る
+JOB_LEASE_SEC = float(os.environ.get("RUNWITH_JOB_LEASE_SEC", "60"))
+
+# データベースが一時的に使えない（ロック中など）ときの再試行間隔。続けて失敗するたびに倍にする
+JOB_DB_RETRY_SEC = 0.5
+JOB_DB_RETRY_MAX_SEC = 30.0
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, DONE, FAILED = "queued", "running", "done", "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    label TEXT NOT NULL DEFAULT '',
+    status TEXT NOT NULL,
+    progress REAL NOT NULL DEFAULT 0,
+    notices TEXT NOT NULL DEFAULT '[]',
+    payload BLOB,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    worker TEXT,
+    lease_until REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+"""
+
+
+class JobStore:
+    """ジョブの状態を保存するSQLiteデータベース（スレッド間・プロセス間で共有）
+
+    実行中のジョブには担当（worker_id）と担当期限（lease_until）を記録する。
+    worker_id はインスタンスごとに異なるため、同じプロセスで作り直した場合も別の担当として扱う。
+    """
+
+    def __init__(self, db_path: str = JOB_DB_PATH, lease_sec: float = JOB_LEASE_SEC):
+        self.db_path = db_path
+        self.lease_sec = lease_sec
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:12]}"
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        # 担当の列がない古いデータベースには列を追加する
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+        for column, sql_type in (("worker", "TEXT"), ("lease_until", "REAL")):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {sql_type}")
+
+    def _execute(self, sql: str, params=()) -> sqlite3.Cursor:
+        with self._lock:
+            return self._conn.execute(sql, params)
+
+    def create(self, owner: str, payload, label: str = "") -> str:
+        job_id = uuid.uuid4().hex
+        self._execute(
+            "INSERT INTO jobs (id, owner, label, status, payload, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (job_id, owner, label, QUEUED, pickle.dumps(payload), time.time()),
+        )
+        return job_id
+
+    def claim_next(self) -> tuple[str, object] | None:
+        """一番古い待機中のジョブを実行中にして (id, payload) を返す"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT id, payload FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (QUEUED,)
+                ).fetchone()
+                if row:
+                    now = time.time()
+                    self._conn.execute("UPDATE jobs SET status = ?, started_at = ?, worker = ?, lease_until = ? WHERE id = ?",
+                                       (RUNNING, now, self.worker_id, now + self.lease_sec, row["id"]))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return (row["id"], pickle.loads(row["payload"])) if row else None
+
+    def renew_leases(self, job_ids) -> int:
+        """担当中のジョブの期限を延ばす（他の担当に引き取られたものは延ばさない）"""
+        job_ids = list(job_ids)
+        if not job_ids:
+            return 0
+        cur = self._execute(
+            f"UPDATE jobs SET lease_until = ? WHERE status = ? AND worker = ? AND id IN ({','.join('?' * len(job_ids))})",
+            (time.time() + self.lease_sec, RUNNING, self.worker_id, *job_ids),
+        )
+        return cur.rowcount
+
+    def set_progress(self, job_id: str, progress: float):
+        self._execute("UPDATE jobs SET progress = ? WHERE id = ?", (progress, job_id))
+
+    def add_notice(self, job_id: str, level: str, message: str):
+        with self._lock:
+            row = self._conn.execute("SELECT notices FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row:
+                notices = json.loads(row["notices"]) + [[level, message]]
+                self._conn.execute("UPDATE jobs SET notices = ? WHERE id = ?", (json.dumps(notices, ensure_ascii=False), job_id))
+
+    def finish(self, job_id: str, result: dict) -> bool:
+        """完了を記録する。担当期限が切れて他に引き取られていた場合は何もせず False を返す"""
+        # 入力（画像など）は不要になるので消しておく
+        cur = self._execute(
+            "UPDATE jobs SET status = ?, progress = 1, result = ?, payload = NULL, finished_at = ?, lease_until = NULL "
+            "WHERE id = ? AND status = ? AND worker = ?",
+            (DONE, json.dumps(result, ensure_ascii=False), time.time(), job_id, RUNNING, self.worker_id),
+        )
+        return cur.rowcount > 0
+
+    def fail(self, job_id: str, error: str) -> bool:
+        cur = self._execute(
+            "UPDATE jobs SET status = ?, error = ?, payload = NULL, finished_at = ?, lease_until = NULL "
+            "WHERE id = ? AND status = ? AND worker = ?",
+            (FAILED, error, time.time(), job_id, RUNNING, self.worker_id),
+        )
+        return cur.rowcount > 0
+
+    def get(self, job_id: str) -> dict | None:
+        row = self._execute(
+            "SELECT id, owner, label, status, progress, notices, result, error, created_at, started_at, finished_at "
+            "FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["notices"] = json.loads(job["notices"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def queue_position(self, job_id: str) -> int:
+        """待機中なら前に並んでいるジョブ数（実行中・完了なら 0）"""
+        row = self._execute(
+            "SELECT COUNT(*) FROM jobs WHERE status = ? AND created_at < "
+            "(SELECT created_at FROM jobs WHERE id = ? AND status = ?)", (QUEUED, job_id, QUEUED)
+        ).fetchone()
+        return row[0]
+
+    def counts(self) -> dict:
+        rows = self._execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        counts = {QUEUED: 0, RUNNING: 0, DONE: 0, FAILED: 0}
+        counts.update({status: n for status, n in rows})
+        return counts
+
+    def requeue_interrupted(self) -> int:
+        """担当期限が切れた（担当のプロセスが止まった）実行中のジョブを待機中に戻す
+
+        期限を延ばし続けているジョブは、別のプロセスのものでも戻さない。
+        """
+        cur = self._execute(
+            "UPDATE jobs SET status = ?, progress = 0, started_at = NULL, worker = NULL, lease_until = NULL "
+            "WHERE status = ? AND (lease_until IS NULL OR lease_until < ?)",
+            (QUEUED, RUNNING, time.time()),
+        )
+        return cur.rowcount
+
+    def purge(self, max_age_sec: int = JOB_RETENTION_SEC) -> int:
+        cur = self._execute("DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?",
+                            (DONE, FAILED, time.time() - max_age_sec))
+        return cur.rowcount
+
+
+class JobProgress:
+    """progress_bar.progress(value) と同じ呼び方で、進捗をデータベースに書き込む"""
+
+    def __init__(self, store: JobStore, job_id: str, on_update=None):
+        self.store = store
+        self.job_id = job_id
+        self.on_update = on_update
+        self._last_write = 0.0
+
+    def progress(self, value: float):
+        now = time.monotonic()
+        if value < 1 and now - self._last_write < PROGRESS_WRITE_INTERVAL_SEC:
+            return
+        self._last_write = now
+        self.store.set_progress(self.job_id, float(value))
+        if self.on_update:
+            self.on_update()
+
+
+class JobRunner:
+    """待機中のジョブを workers 本のスレッドで取り出して handler に渡す
+
+    handler(job_id, payload, progress, notify) は結果の辞書（JSONにできるもの）を返す。
+    """
+
+    def __init__(self, store: JobStore, handler, workers: int = JOB_WORKERS):
+        self.store = store
+        self.handler = handler
+        self.workers = max(1, workers)
+        self._wakeup = threading.Condition()
+        self._stop_event = threading.Event()
+        self._threads: list[threading.Thread] = []
+        # このランナーが実行中のジョブ（担当期限を延ばす対象）
+        self._active: set[str] = set()
+        self._active_lock = threading.Lock()
+
+    def start(self):
+        self.store.requeue_interrupted()
+        self.store.purge()
+        for i in range(self.workers):
+            t = threading.Thread(target=self._loop, name=f"runwith-job-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        t = threading.Thread(target=self._heartbeat, name="runwith-job-heartbeat", daemon=True)
+        t.start()
+        self._threads.append(t)
+
+    def _heartbeat(self):
+        while not self._stop_event.wait(self.store.lease_sec / 3):
+            with self._active_lock:
+                active = list(self._active)
+            try:
+                self.store.renew_leases(active)
+            except sqlite3.Error:
+                pass
+
+    def stop(self):
+        self._stop_event.set()
+        with self._wakeup:
+            self._wakeup.notify_all()
+
+    def submit(self, owner: str, payload, label: str = "") -> str:
+        job_id = self.store.create(owner, payload, label)
+        with self._wakeup:
+            self._wakeup.notify()
+        return job_id
+
+    def _loop(self):
+        db_failures = 0
+        while not self._stop_event.is_set():
+            try:
+                claimed = self.store.claim_next()
+                if claimed is None:
+                    with self._wakeup:
+                        # 他プロセスからの投入にも気づけるよう、通知がなくても定期的に確認する
+                        self._wakeup.wait(timeout=5)
+                    # 止まったプロセスが担当していたジョブもここで引き取る
+                    self.store.requeue_interrupted()
+                    db_failures = 0
+                    continue
+            except sqlite3.Error:
+                # 一時的なロックなどでワーカーを終わらせると、以降のジョブが待機中のまま残る
+                delay = min(JOB_DB_RETRY_MAX_SEC, JOB_DB_RETRY_SEC * 2 ** db_failures)
+                db_failures += 1
+                logger.exception("ジョブの取り出しに失敗しました（%.1f秒後に再試行）", delay)
+                self._stop_event.wait(delay)
+                continue
+            db_failures = 0
+            job_id, payload = claimed
+            with self._active_lock:
+                self._active.add(job_id)
+            progress = JobProgress(self.store, job_id)
+            try:
+                result = self.handler(job_id, payload, progress,
+                                      lambda level, message: self.store.add_notice(job_id, level, message))
+                self.store.finish(job_id, result)
+            except Exception as e:
+                try:
+                    self.store.fail(job_id, str(e))
+                except sqlite3.Error:
+                    # 書き込めなくても担当期限が切れれば他のワーカーが引き取る
+                    logger.exception("ジョブ %s の結果を保存できませんでした", job_id)
+            finally:
+                with self._active_lock:
+                    self._active.discard(job_id)
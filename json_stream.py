@@ -0,0 +1,75 @@
+import json
+
+# ----------------------------
+# ストリーミング応答用のインクリメンタルJSON配列パーサー
+# ----------------------------
+
+
+class IncrementalJSONArrayParser:
+    """断片的に届くテキストから、トップレベル配列の要素（オブジェクト）を完成した順に取り出す"""
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = 0
+        self._started = False
+        self._finished = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._obj_start = None
+
+    def feed(self, text: str) -> list[dict]:
+        """テキスト断片を追加し、新たに完成したオブジェクトを返す"""
+        if self._finished:
+            return []
+        self._buffer += text
+        completed = []
+        buf = self._buffer
+        i = self._pos
+        while i < len(buf):
+            ch = buf[i]
+            if not self._started:
+                # ```json などの前置きは読み飛ばし、最初の [ から解析を始める
+                if ch == "[":
+                    self._started = True
+                i += 1
+                continue
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == "\\":
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                if self._depth == 0:
+                    self._obj_start = i
+                self._depth += 1
+            elif ch == "]" and self._depth == 0:
+                # 配列の終わり以降（説明文など）は無視する
+                self._finished = True
+                i += 1
+                break
+            elif ch == "}" and self._depth > 0:
+                self._depth -= 1
+                if self._depth == 0 and self._obj_start is not None:
+                    try:
+                        completed.append(json.loads(buf[self._obj_start:i + 1]))
+                    except json.JSONDecodeError:
+                        pass
+                    self._obj_start = None
+            i += 1
+
+        # 解析済みの部分は捨て、未完成のオブジェクトだけを保持する
+        keep_from = self._obj_start if self._obj_start is not None else i
+        self._buffer = buf[keep_from:]
+        if self._obj_start is not None:
+            self._obj_start = 0
+        self._pos = i - keep_from
+        return completed
+
+    @property
+    def finished(self) -> bool:
+        return self._finished
@@ -0,0 +1,148 @@
+import io
+import os
+import json
+import time
+import hashlib
+import threading
+import uuid
+from PIL import Image, ImageOps
+
+# ----------------------------
+# 画像の知覚ハッシュによる重複除去と、解析結果（menu_data）のキャッシュ
+# ----------------------------
+# 近いハッシュを同じページとみなすのは1回の投稿の中（二重撮影の除去）だけで、
+# 解析結果のキャッシュは画像の内容が完全に一致したときにだけ使う（値段だけ変えたメニューを取り違えない）
+
+MENU_CACHE_DIR = os.environ.get("RUNWITH_MENU_CACHE_DIR", "menu_cache")
+MENU_CACHE_MAX_ENTRIES = int(os.environ.get("RUNWITH_MENU_CACHE_MAX_ENTRIES", "500"))
+# 256ビットのハッシュで何ビットまでの差を「同じページ」とみなすか
+HASH_SIZE = 16
+HASH_DISTANCE = int(os.environ.get("RUNWITH_IMAGE_HASH_DISTANCE", "8"))
+
+
+def dhash(data: bytes, hash_size: int = HASH_SIZE) -> str | None:
+    """差分ハッシュ（dHash）を16進文字列で返す（画像として読めなければ None）"""
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            img = ImageOps.exif_transpose(img).convert("L")
+            img = img.resize((hash_size + 1, hash_size), Image.LANCZOS)
+            px = list(img.getdata())
+    except Exception:
+        return None
+    bits = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = px[row * (hash_size + 1) + col]
+            right = px[row * (hash_size + 1) + col + 1]
+            bits = (bits << 1) | (1 if left > right else 0)
+    return f"{bits:0{hash_size * hash_size // 4}x}"
+
+
+def hamming(a: str, b: str) -> int:
+    return bin(int(a, 16) ^ int(b, 16)).count("1")
+
+
+def content_hash(data: bytes) -> str:
+    """画像の内容そのもののハッシュ（解析結果キャッシュのキー）"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def dedupe_images(images: list[tuple[bytes, str]], max_distance: int = HASH_DISTANCE):
+    """ほぼ同じページ（撮り直し・二重撮影）を除き、(残した画像, その内容ハッシュ, 除いた枚数) を返す
+
+    近さの判定には dHash を使い、返すのは残した画像の content_hash。
+    """
+    kept, page_hashes, seen = [], [], []
+    dropped = 0
+    for data, mime_type in images:
+        digest = content_hash(data)
+        h = dhash(data) or digest
+        if any(len(h) == len(k) and hamming(h, k) <= max_distance for k in seen):
+            dropped += 1
+            continue
+        kept.append((data, mime_type))
+        page_hashes.append(digest)
+        seen.append(h)
+    return kept, page_hashes, dropped
+
+
+def make_context_key(reading_mode: str, model_name: str) -> str:
+    """画像以外で解析結果に影響する条件（モード・モデル）のキー
+
+    読み方辞書は解析後の音声合成で適用するため、辞書を変えても解析結果は再利用できる。
+    """
+    payload = json.dumps([reading_mode, model_name], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _pages_match(query: list[str], stored: list[str]) -> bool:
+    """ページ順に関係なく、同じ内容ハッシュの組み合わせか"""
+    return sorted(query) == sorted(stored)
+
+
+class MenuResultCache:
+    """ページの内容ハッシュ＋条件キーから menu_data を引けるディスクキャッシュ
+
+    1件ごとに <キー>.json へ保存し、最終利用時刻はそのファイルの mtime で管理する（tts_cache と同じ）。
+    ヒットしたときは mtime を更新するだけで、ファイルは書き直さない。
+    """
+
+    def __init__(self, cache_dir: str = MENU_CACHE_DIR, max_entries: int = MENU_CACHE_MAX_ENTRIES):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _key(self, page_hashes: list[str], context_key: str) -> str:
+        """ページ順に関係なく同じ組み合わせなら同じキー"""
+        payload = json.dumps([context_key, sorted(page_hashes)])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def lookup(self, page_hashes: list[str], context_key: str) -> list[dict] | None:
+        path = self._path(self._key(page_hashes, context_key))
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            entry = None
+        hit = entry is not None and entry["context"] == context_key and _pages_match(page_hashes, entry["pages"])
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return entry["menu_data"] if hit else None
+
+    def store(self, page_hashes: list[str], context_key: str, menu_data: list[dict]):
+        path = self._path(self._key(page_hashes, context_key))
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"pages": page_hashes, "context": context_key, "menu_data": menu_data,
+                       "created_at": time.time()}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._evict_locked()
+
+    def _evict_locked(self):
+        """件数が上限を超えたら、最終利用時刻（mtime）の古いものから削除する"""
+        found = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".json") or name == "index.json":
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                found.append((os.stat(path).st_mtime, path))
+            except OSError:
+                continue
+        found.sort()
+        for _, path in found[:max(0, len(found) - self.max_entries)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
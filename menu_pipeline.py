@@ -0,0 +1,780 @@
+import os
+import re
+import shutil
+import json
+import time
+import base64
+import hashlib
+import io
+import asyncio
+import contextvars
+import zipfile
+from dataclasses import dataclass, field, asdict
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from gtts import gTTS
+import google.generativeai as genai
+import edge_tts
+from tts_cache import TTSCache, make_cache_key
+from tts_scheduler import TTSScheduler, SchedulerConfig
+from mp3_frames import concat_mp3
+from json_stream import IncrementalJSONArrayParser
+from image_prep import IMAGE_MAX_EDGE, IMAGE_JPEG_QUALITY, preprocess_images
+from web_fetch import MAX_TEXT_CHARS, fetch_menu_text
+from menu_cache import MenuResultCache, dedupe_images, make_context_key
+from reading_dict import ReadingDictionary
+from stage_metrics import stage, recording_run
+from audio_post import AudioProfile, ffmpeg_available, postprocess_tracks
+from player_template import load_template
+from audio_segments import CONTENT_HASH_CHARS, write_segmented_track
+
+# Streamlit に依存しない生成パイプライン（app.py と batch_cli.py から利用）
+
+# ----------------------------
+# 共通関数
+# ----------------------------
+
+VOICE_OPTIONS = {"👩 女性": "ja-JP-NanamiNeural", "👨 男性": "ja-JP-KeitaNeural"}
+READING_MODES = ("💬 シンプル (商品名と価格)", "🌟 詳細 (説明・イメージ付き)")
+
+def sanitize_filename(name: str) -> str:
+    """ファイル名に使えない文字を安全な形に整形"""
+    return re.sub(r'[\\/*?:"<>|]', "", name).replace(" ", "_").replace("　", "_")
+
+# 文単位で分割して並列合成するチャプターの長さ（文字数）
+CHUNK_THRESHOLD_CHARS = 150
+CHUNK_MAX_CHARS = 120
+
+def split_sentences(text: str, max_chars: int = CHUNK_MAX_CHARS) -> list[str]:
+    """。！？ と改行で文に区切り、max_chars 以内の塊にまとめる"""
+    sentences = [s.strip() for s in re.findall(r'[^。！？!?\n]+[。！？!?]*|[。！？!?]+', text) if s.strip()]
+    chunks = []
+    current = []
+    for sentence in sentences:
+        if current and sum(map(len, current)) + len(sentence) > max_chars:
+            chunks.append("\n".join(current))
+            current = []
+        current.append(sentence)
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+def fetch_text_from_url(url: str, follow_links: bool = False) -> str | None:
+    """URLから本文テキストを取得（follow_links 時はリンク先のメニューページも取得）"""
+    with stage("fetch_url", mode="follow_links" if follow_links else "single") as info:
+        try:
+            return fetch_menu_text(url, follow_links=follow_links)
+        except Exception:
+            info["outcome"] = "error"
+            return None
+
+# ----------------------------
+# 音声生成
+# ----------------------------
+
+async def generate_single_track_fast(text: str, filename: str, voice_code: str, rate_value: str, cache: TTSCache | None = None, scheduler: TTSScheduler | None = None,
+                                     fallback: bool = True) -> bool:
+    """edge-tts で音声生成。失敗時は gTTS にフォールバック（キャッシュがあれば再利用）
+
+    fallback=False のときは gTTS を使わずに False を返す（章の一部分だけを作る場合）。
+    """
+    scheduler = scheduler or TTSScheduler()
+    edge_key = make_cache_key(text, voice_code, rate_value, "edge-tts")
+    if cache:
+        hit = cache.fetch(edge_key, filename)
+        # 同時に動く他のジョブと混ざらないよう、この生成処理のスケジューラで数える
+        scheduler.record_cache(hit)
+        if hit:
+            return True
+
+    for attempt in range(scheduler.config.max_attempts):
+        try:
+            await scheduler.throttle()
+            with stage("tts_attempt", engine="edge-tts") as info:
+                comm = edge_tts.Communicate(text, voice_code, rate=rate_value)
+                await comm.save(filename)
+                if not (os.path.exists(filename) and os.path.getsize(filename) > 0):
+                    info["outcome"] = "empty"
+            if os.path.exists(filename) and os.path.getsize(filename) > 0:
+                if cache: cache.store(edge_key, filename)
+                return True
+        except Exception:
+            pass
+        if attempt < scheduler.config.max_attempts - 1:
+            await scheduler.backoff(attempt)
+
+    if not fallback:
+        return False
+    return await generate_gtts_track(text, filename, cache, scheduler)
+
+async def generate_gtts_track(text: str, filename: str, cache: TTSCache | None, scheduler: TTSScheduler) -> bool:
+    """gTTS で音声生成（edge-tts が使えなかったときの代替）"""
+    # gTTS は声・速度を指定できないため、キーには言語のみを含める。
+    # このトラックのミスは edge-tts の確認で数えたので、ここでは件数に含めない
+    gtts_key = make_cache_key(text, "ja", "", "gtts")
+    if cache and cache.fetch(gtts_key, filename, count=False):
+        return True
+
+    scheduler.record_fallback()
+    try:
+        def gtts_task():
+            tts = gTTS(text=text, lang='ja')
+            tts.save(filename)
+        with stage("tts_attempt", engine="gtts"):
+            await asyncio.to_thread(gtts_task)
+        if cache: cache.store(gtts_key, filename)
+        return True
+    except Exception:
+        return False
+
+async def synthesize_chapter(text: str, filename: str, voice_code: str, rate_value: str, cache: TTSCache | None, scheduler: TTSScheduler) -> bool:
+    """長いチャプターは文ごとに並列合成し、フレーム単位で1つのMP3に連結
+
+    部分は edge-tts だけで作り、1つでも失敗したら章全体を gTTS で作り直す
+    （声やビットレートの異なる部分をつながないため）。
+    """
+    chunks = split_sentences(text) if len(text) > CHUNK_THRESHOLD_CHARS else [text]
+    if len(chunks) <= 1:
+        return await scheduler.run(lambda: generate_single_track_fast(text, filename, voice_code, rate_value, cache, scheduler))
+
+    base, _ = os.path.splitext(filename)
+    part_paths = [f"{base}.part{n:03}.mp3" for n in range(len(chunks))]
+    results = await asyncio.gather(*[
+        scheduler.run(lambda t=chunk, p=path: generate_single_track_fast(t, p, voice_code, rate_value, cache, scheduler, fallback=False))
+        for chunk, path in zip(chunks, part_paths)
+    ])
+    try:
+        if all(results):
+            concat_mp3(part_paths, filename)
+            return True
+    finally:
+        for path in part_paths:
+            if os.path.exists(path): os.remove(path)
+    return await scheduler.run(lambda: generate_gtts_track(text, filename, cache, scheduler))
+
+def track_job(i: int, track: dict, output_dir: str, readings: ReadingDictionary | None = None) -> tuple[str, str]:
+    """i番目のトラックの読み上げテキストと保存先パスを返す（0番は目次・readings があれば読み方を置換）"""
+    safe_title = sanitize_filename(track['title'])
+    filename = f"{i:02}_{safe_title}.mp3"
+    save_path = os.path.join(output_dir, filename)
+    speech_text = track['text']
+    
+    if i > 0:
+        speech_text = f"{i}、{track['title']}。\n{track['text']}"
+    if readings:
+        speech_text = readings.apply(speech_text)
+    return speech_text, save_path
+
+def build_intro_text(store_name: str, menu_title: str, chapters: list[dict]) -> str:
+    """はじめに・目次トラックの読み上げテキスト"""
+    intro_t = f"こんにちは、{store_name}です。"
+    if menu_title: intro_t += f"ただいまより{menu_title}をご紹介します。"
+    intro_t += "このプレイヤーは、スクリーンリーダーでの操作に対応しています。"
+    intro_t += f"このメニューは、全部で{len(chapters)}つのカテゴリーに分かれています。まずは目次です。"
+    
+    for i, tr in enumerate(chapters): 
+        intro_t += f"{i+1}、{tr['title']}。"
+        
+    intro_t += "それではどうぞ。"
+    return intro_t
+
+async def process_all_tracks_fast(menu_data, output_dir, voice_code, rate_value, progress_bar, cache=None, scheduler_config=None, indices=None, readings=None):
+    """チャプター音声を、同時実行数の上限付きで並列生成（indices を指定するとその番号だけ生成）"""
+    scheduler = TTSScheduler(scheduler_config)
+    tasks = []
+    track_info_list = []
+    
+    for i, track in enumerate(menu_data):
+        speech_text, save_path = track_job(i, track, output_dir, readings)
+        if indices is None or i in indices:
+            tasks.append(synthesize_chapter(speech_text, save_path, voice_code, rate_value, cache, scheduler))
+        track_info_list.append({"title": track['title'], "path": save_path})
+    
+    total = len(tasks)
+    completed = 0
+    for task in asyncio.as_completed(tasks):
+        await task
+        completed += 1
+        if progress_bar: progress_bar.progress(completed / total)
+    return track_info_list, scheduler.metrics.snapshot()
+
+def stream_chunk_text(chunk) -> str:
+    """ストリームの断片のテキスト（終了理由や安全性の判定だけでテキストのない断片は空文字）"""
+    try:
+        return chunk.text
+    except ValueError:
+        return ""
+
+async def stream_all_tracks_fast(model, inputs, store_name, menu_title, output_dir, voice_code, rate_value, progress_bar, cache=None, scheduler_config=None, readings=None):
+    """Geminiのストリーミング応答からチャプターが1つ完成するたびに音声合成を開始し、最後に目次を合成"""
+    scheduler = TTSScheduler(scheduler_config)
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+
+    def produce():
+        parser = IncrementalJSONArrayParser()
+        try:
+            with stage("generate_content", mode="stream"):
+                for chunk in model.generate_content(inputs, stream=True):
+                    for obj in parser.feed(stream_chunk_text(chunk)):
+                        if isinstance(obj, dict) and 'title' in obj and 'text' in obj:
+                            loop.call_soon_threadsafe(queue.put_nowait, obj)
+                    if parser.finished:
+                        break
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, None)
+
+    producer = asyncio.create_task(asyncio.to_thread(produce))
+    chapters = []
+    tasks = []
+    completed = 0
+
+    def on_done(_):
+        nonlocal completed
+        completed += 1
+        if progress_bar: progress_bar.progress(completed / (len(chapters) + 1))
+
+    try:
+        while (track := await queue.get()) is not None:
+            chapters.append(track)
+            speech_text, save_path = track_job(len(chapters), track, output_dir, readings)
+            task = asyncio.create_task(synthesize_chapter(speech_text, save_path, voice_code, rate_value, cache, scheduler))
+            task.add_done_callback(on_done)
+            tasks.append(task)
+        await producer
+        if not chapters: raise Exception("AIからの応答がJSON形式ではありませんでした。")
+
+        # 目次はチャプター数とタイトルが確定してから合成する
+        intro = {"title": "はじめに・目次", "text": build_intro_text(store_name, menu_title, chapters)}
+        speech_text, save_path = track_job(0, intro, output_dir, readings)
+        intro_task = asyncio.create_task(synthesize_chapter(speech_text, save_path, voice_code, rate_value, cache, scheduler))
+        intro_task.add_done_callback(on_done)
+        await asyncio.gather(intro_task, *tasks)
+    except BaseException:
+        for task in tasks: task.cancel()
+        raise
+
+    menu_data = [intro] + chapters
+    track_info_list = [{"title": tr['title'], "path": track_job(i, tr, output_dir)[1]} for i, tr in enumerate(menu_data)]
+    return menu_data, track_info_list, scheduler.metrics.snapshot()
+
+# ----------------------------
+# プロンプト生成・メニュー解析
+# ----------------------------
+
+def build_menu_prompt(reading_mode: str) -> str:
+    """メニュー全体を5〜8チャプターのJSONにまとめるためのプロンプト
+
+    読み方辞書はプロンプトに含めず、音声合成の直前に ReadingDictionary で置換する。
+    """
+
+    # ★変更点3-C：モードに応じたプロンプトの切り替え
+    mode_instruction = ""
+    if "シンプル" in reading_mode:
+        mode_instruction = """
+        - 商品名と価格だけを簡潔に読み上げてください。
+        - 「美味しそうです」などの形容詞や説明は一切省いてください。
+        - 挨拶や余計な言葉は不要です。淡々と情報を伝えてください。
+        """
+    else:
+        mode_instruction = """
+        - 写真から「美味しそうな特徴（赤くて辛そう、ボリュームがある等）」が分かれば、一言添えて魅力を伝えてください。
+        - ユーザーが料理のイメージができるような丁寧なガイドを心がけてください。
+        """
+
+    prompt = f"""
+    役割設定:
+    あなたは視覚障害者の外食をサポートするパートナー「Runwith Menu AI」です。
+    メニュー画像を解析し、ユーザーが料理を選びやすいように整理してガイドしてください。
+
+    重要ミッション:
+    1. メニュー全体を【5つ〜8つ程度の論理的なチャプター（カテゴリー）】に分けてください。
+       （悪い例：各商品を1つのチャプターにする）
+       （良い例：「前菜」「メイン」「ドリンク」のようにまとめる）
+    
+    2. 読み上げ原稿のルール:
+       - 商品名ははっきりと。価格は必ず「円」をつけて読む。
+       - アレルギー情報や注意事項は絶対に省略しない。
+       {mode_instruction}
+
+    出力フォーマット（JSONのみ）:
+    [
+      {{"title": "カテゴリー名（例：おすすめ・フェア）", "text": "読み上げテキスト..."}},
+      {{"title": "カテゴリー名（例：メイン料理）", "text": "読み上げテキスト..."}}
+    ]
+    """
+    return prompt
+
+def build_page_prompt(reading_mode: str) -> str:
+    """1ページ（または数ページ）分の内容をもれなく書き出すためのプロンプト"""
+    detail = "料理の見た目の特徴も一言添えてください。" if "詳細" in reading_mode else "説明や形容詞は不要です。"
+    return f"""
+    これは飲食店のメニューの一部のページです。
+    載っている商品名・価格・カテゴリー見出し・アレルギー情報・注意事項を、省略せずすべて書き出してください。
+    {detail}
+    並び順はページ上の順番のままにし、見出しがあれば「■見出し」の形で残してください。
+    """
+
+# ページごと並列解析の既定値
+PAGE_PARALLELISM = 4
+PAGE_MAX_ATTEMPTS = 3
+
+def extract_pages_parallel(model, page_prompt: str, images: list[tuple[bytes, str]], pages_per_request: int = 1, max_workers: int = PAGE_PARALLELISM, max_attempts: int = PAGE_MAX_ATTEMPTS) -> tuple[list[str], int]:
+    """ページ（またはページのまとまり）ごとに並列でGeminiに書き出させる。失敗したページだけ再試行し、(書き出し結果, 失敗ページ数) を返す"""
+    starts = range(0, len(images), pages_per_request)
+
+    def extract(start):
+        group = images[start:start + pages_per_request]
+        last_error = None
+        for attempt in range(max_attempts):
+            try:
+                with stage("generate_content", mode="page"):
+                    resp = model.generate_content([page_prompt] + [{"mime_type": m, "data": d} for d, m in group])
+                if resp.text.strip():
+                    label = f"{start + 1}枚目" if len(group) == 1 else f"{start + 1}〜{start + len(group)}枚目"
+                    return f"【{label}】\n{resp.text}"
+            except Exception as e:
+                last_error = e
+            if attempt < max_attempts - 1:
+                time.sleep(2 ** attempt)
+        raise Exception(f"ページの解析に失敗しました: {last_error}")
+
+    texts = []
+    failed_pages = 0
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(starts)))) as pool:
+        # 計測中の実行（recording_run）にページごとの記録も含めるため、コンテキストを引き継ぐ
+        futures = [(start, pool.submit(contextvars.copy_context().run, extract, start)) for start in starts]
+        for start, fut in futures:
+            try:
+                texts.append(fut.result())
+            except Exception:
+                failed_pages += len(images[start:start + pages_per_request])
+    if not texts:
+        raise Exception("すべてのページの解析に失敗しました。")
+    return texts, failed_pages
+
+# ----------------------------
+# HTMLプレイヤー生成（JS埋め込み完全版・シークバー機能付き）
+# ----------------------------
+
+# base64は3バイト単位で区切れるため、この大きさずつ読み込んで書き出す
+B64_CHUNK_BYTES = 3 * 64 * 1024
+
+def write_standalone_html_player(fp, store_name, menu_data, map_url=""):
+    """店舗向け配布用のスタンドアロンHTMLプレイヤー（音声をすべて埋め込んだ1ファイル版）を fp に書き出す"""
+    tracks = [{"title": t['title'], "path": t['path']} for t in menu_data if os.path.exists(t['path'])]
+    write_player_html(fp, store_name, tracks, map_url, embed_audio=True)
+
+def create_standalone_html_player(store_name, menu_data, map_url=""):
+    """店舗向け配布用のスタンドアロンHTMLプレイヤーを文字列で生成"""
+    buf = io.BytesIO()
+    write_standalone_html_player(buf, store_name, menu_data, map_url)
+    return buf.getvalue().decode("utf-8")
+
+def create_multifile_player_zip(zip_path, store_name, menu_data, map_url="", offline=False, segmented=False):
+    """index.html・playlist.json・tracks/*.mp3 に分けたZIPを作成（再生中の曲だけを読み込む軽量版）
+
+    offline=True のときはサービスワーカーとマニフェストも入れ、2回目以降は通信なしで開けるようにする。
+    segmented=True のときは各章を tracks/NN/*.mp3 の短い区切りと tracks/NN.m3u8 に分け、
+    長い章でも最初の区切りを読み込んだ時点で再生を始められるようにする。
+    音声のファイル名には内容のハッシュを入れる（内容が変わればURLも変わるため、配信側で長期間キャッシュできる）。
+    """
+    playlist_js = []
+    track_hashes = []
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for i, track in enumerate(menu_data):
+            file_path = track['path']
+            if not os.path.exists(file_path):
+                continue
+            track_hash = file_sha256(file_path)
+            track_hashes.append(track_hash)
+            if segmented:
+                entry = write_segmented_track(zf, file_path, f"tracks/{i:02}")
+            else:
+                entry = {"src": f"tracks/{i:02}.{track_hash[:CONTENT_HASH_CHARS]}.mp3"}
+                # MP3は圧縮済みのため無圧縮で格納
+                zf.write(file_path, entry["src"], compress_type=zipfile.ZIP_STORED)
+            playlist_js.append({"title": track['title'], **entry, "bytes": os.path.getsize(file_path)})
+        manifest = {"store_name": store_name, "map_url": map_url, "tracks": playlist_js}
+        zf.writestr("playlist.json", json.dumps(manifest, ensure_ascii=False, indent=2))
+        # file:// で開いても動くよう、プレイリストはHTMLにも埋め込む（音声を含まないため小さい）
+        index_html = io.BytesIO()
+        write_player_html(index_html, store_name, playlist_js, map_url, pwa=offline)
+        zf.writestr("index.html", index_html.getvalue())
+        if offline:
+            content_hashes = [hashlib.sha256(index_html.getvalue()).hexdigest()] + track_hashes
+            write_pwa_files(zf, store_name, manifest, content_hashes)
+
+def write_playlist_json(fp, playlist_js, embed_audio):
+    """プレイリストJSONを書き出す。embed_audio 時は各 path の音声をbase64で少しずつ埋め込む"""
+    if not embed_audio:
+        fp.write(json.dumps(playlist_js, ensure_ascii=False).encode("utf-8"))
+        return
+    fp.write(b"[")
+    for n, track in enumerate(playlist_js):
+        if n: fp.write(b",")
+        fp.write(b'{"title": ' + json.dumps(track['title'], ensure_ascii=False).encode("utf-8"))
+        fp.write(b', "src": "data:audio/mp3;base64,')
+        with open(track['path'], "rb") as f:
+            while chunk := f.read(B64_CHUNK_BYTES):
+                fp.write(base64.b64encode(chunk))
+        fp.write(b'"}')
+    fp.write(b"]")
+
+def write_player_html(fp, store_name, playlist_js, map_url="", embed_audio=False, pwa=False):
+    """プレイリスト（相対URL、または embed_audio 時は音声ファイルのパス）からプレイヤーHTMLを fp に書き出す
+
+    pwa=True のときはマニフェストとサービスワーカーの登録を入れる。
+    """
+    map_button_html = ""
+    if map_url:
+        map_button_html = (
+            f'<div style="text-align:center; margin-bottom: 20px;">'
+            f'<a href="{map_url}" target="_blank" role="button" '
+            f'aria-label="Googleマップを開く（{store_name}の場所）" class="map-btn">🗺️ 地図を開く</a></div>'
+        )
+
+    load_template("player.html").render(fp, {
+        "STORE_NAME": store_name,
+        "MAP_BUTTON": map_button_html,
+        "PWA_HEAD": PWA_HEAD if pwa else "",
+        "PWA_SCRIPT": PWA_SCRIPT if pwa else "",
+        "PLAYLIST_JSON": lambda out: write_playlist_json(out, playlist_js, embed_audio),
+    })
+
+
+# ----------------------------
+# オフライン対応版（サービスワーカー・Webアプリマニフェスト）
+# ----------------------------
+
+PWA_THEME_COLOR = "#001F3F"
+PWA_SHELL_FILES = ["./", "index.html", "playlist.json", "manifest.webmanifest", "icon.svg"]
+PWA_HEAD = (f'<link rel="manifest" href="manifest.webmanifest"><meta name="theme-color" content="{PWA_THEME_COLOR}">'
+            '<link rel="icon" href="icon.svg" type="image/svg+xml">')
+# サービスワーカーは http(s) で配信されたときだけ使える（file:// で開いた場合は登録しない）。
+# 有効になってから音声の保存を頼むため、最初の再生は保存の完了を待たない
+PWA_SCRIPT = ('<script>if("serviceWorker" in navigator && location.protocol.startsWith("http"))'
+              '{navigator.serviceWorker.register("sw.js");'
+              'navigator.serviceWorker.ready.then((r)=>{if(r.active){r.active.postMessage("cache-tracks");}});}</script>')
+PWA_ICON_SVG = (f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 512 512"><rect width="512" height="512" rx="96" '
+                f'fill="{PWA_THEME_COLOR}"/><text x="256" y="330" font-size="260" text-anchor="middle">🎧</text></svg>')
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(B64_CHUNK_BYTES):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def write_pwa_files(zf, store_name, manifest, content_hashes):
+    """sw.js・manifest.webmanifest・icon.svg を ZIP に追加する
+
+    キャッシュ名はプレイリスト・index.html・音声の内容から決めるため、
+    作り直した版を置くと新しいキャッシュに入れ替わり、古いものは削除される。
+    """
+    version = hashlib.sha256(
+        json.dumps([manifest, content_hashes], ensure_ascii=False, sort_keys=True).encode("utf-8")
+    ).hexdigest()[:16]
+    sw = io.BytesIO()
+    load_template("sw.js").render(sw, {
+        "CACHE_NAME": f"runwith-{version}",
+        "SHELL_URLS": json.dumps(PWA_SHELL_FILES),
+        "TRACK_URLS": json.dumps([url for t in manifest["tracks"] for url in [t["src"]] + [s[0] for s in t.get("segs", [])]]),
+    })
+    zf.writestr("sw.js", sw.getvalue())
+    zf.writestr("manifest.webmanifest", json.dumps({
+        "name": f"{store_name} 音声メニュー",
+        "short_name": store_name,
+        "start_url": "./",
+        "scope": "./",
+        "display": "standalone",
+        "background_color": PWA_THEME_COLOR,
+        "theme_color": PWA_THEME_COLOR,
+        "lang": "ja",
+        "icons": [{"src": "icon.svg", "sizes": "any", "type": "image/svg+xml", "purpose": "any"}],
+    }, ensure_ascii=False, indent=2))
+    zf.writestr("icon.svg", PWA_ICON_SVG)
+
+
+# ----------------------------
+# パイプライン全体の実行（画像/URL → Gemini → 目次 → 音声 → HTML → ZIP）
+# ----------------------------
+
+@dataclass
+class MenuJob:
+    """1店舗分の生成条件"""
+    store_name: str
+    menu_title: str = ""
+    map_url: str = ""
+    images: list[tuple[bytes, str]] = field(default_factory=list)
+    url: str | None = None
+    follow_links: bool = False
+    voice_code: str = VOICE_OPTIONS["👩 女性"]
+    rate_value: str = "+10%"
+    reading_mode: str = READING_MODES[0]
+    split_export: bool = True
+    # 分割版にサービスワーカーとマニフェストを加える（2回目以降は通信なしで開ける）
+    offline_export: bool = False
+    # 分割版の各章を短い区切りに分ける（長い章でも再生開始までの待ち時間が変わらない）
+    segmented_export: bool = False
+    stream_mode: bool = True
+    page_parallel: bool = True
+    page_workers: int = PAGE_PARALLELISM
+    pages_per_request: int = 1
+    image_max_edge: int = IMAGE_MAX_EDGE
+    image_quality: int = IMAGE_JPEG_QUALITY
+    scheduler_config: SchedulerConfig | None = None
+    # None のときは音声の仕上げ（正規化・無音削除・再圧縮）を行わない
+    audio_profile: AudioProfile | None = None
+    # 保存済みの解析結果を使わず、画像を読み直す（結果は新しいものでキャッシュを置き換える）
+    force_reanalyze: bool = False
+
+def create_model(api_key: str, model_name: str):
+    genai.configure(api_key=api_key)
+    return genai.GenerativeModel(model_name)
+
+def parse_menu_json(text_resp: str) -> list[dict]:
+    match = re.search(r'\[.*\]', text_resp, re.DOTALL)
+    if not match: raise Exception("AIからの応答がJSON形式ではありませんでした。")
+    return json.loads(match.group())
+
+def finish_tracks(paths: list[str], profile: AudioProfile | None, timings: dict, notify=None) -> dict | None:
+    """音声の仕上げを行い、結果（トラック数・処理前後のバイト数）を返す（profile が None なら何もしない）"""
+    if profile is None:
+        return None
+    if not ffmpeg_available():
+        if notify: notify("warning", "ffmpeg が見つからないため、音声の仕上げを省略しました。")
+        return None
+    t = time.perf_counter()
+    with stage("audio_post"):
+        result = postprocess_tracks(paths, profile)
+    timings["audio_post"] = round(time.perf_counter() - t, 3)
+    return result
+
+def export_player(store_name: str, tracks: list[dict], map_url: str, export_dir: str, split_export: bool, timings: dict,
+                  offline_export: bool = False, segmented_export: bool = False) -> dict:
+    """HTMLプレイヤーとZIPを export_dir に書き出してパスを返す（所要時間は timings に記録）"""
+    t = time.perf_counter()
+    date_str = datetime.now().strftime('%Y%m%d')
+    safe_name = sanitize_filename(store_name)
+    html_name = f"{safe_name}_player.html"
+    html_path = os.path.join(export_dir, html_name)
+    with stage("html", mode="standalone"), open(html_path, "wb") as f:
+        write_standalone_html_player(f, store_name, tracks, map_url)
+    timings["html"] = round(time.perf_counter() - t, 3)
+
+    t = time.perf_counter()
+    zip_name = f"Runwith_{safe_name}_{date_str}.zip"
+    zip_path = os.path.join(export_dir, zip_name)
+    offline_export = offline_export and split_export
+    with stage("zip", mode="offline" if offline_export else "split" if split_export else "single"):
+        if split_export:
+            create_multifile_player_zip(zip_path, store_name, tracks, map_url, offline=offline_export,
+                                        segmented=segmented_export)
+        else:
+            with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zf:
+                zf.write(html_path, "index.html")
+    timings["zip"] = round(time.perf_counter() - t, 3)
+    return {"html_path": html_path, "html_name": html_name, "zip_path": zip_path, "zip_name": zip_name}
+
+def run_menu_pipeline(job: MenuJob, model, model_name: str, output_dir: str, export_dir: str, readings: ReadingDictionary | None,
+                      tts_cache: TTSCache | None = None, menu_cache: MenuResultCache | None = None,
+                      progress_bar=None, notify=None) -> dict:
+    """1店舗分の音声メニューを生成し、成果物のパスと各段階の所要時間を返す
+
+    notify(level, message) には "info" / "warning" の通知が渡される。
+    """
+    with recording_run() as run:
+        notify = notify or (lambda level, message: None)
+        timings = {}
+        started = time.perf_counter()
+
+        def lap(stage, since):
+            now = time.perf_counter()
+            timings[stage] = round(now - since, 3)
+            return now
+
+        os.makedirs(output_dir, exist_ok=True)
+        os.makedirs(export_dir, exist_ok=True)
+        prompt = build_menu_prompt(job.reading_mode)
+
+        inputs = [prompt]
+        page_hashes = None
+        t = time.perf_counter()
+        if job.images:
+            # 向き補正・縮小・再圧縮してから送信（ページごとに並列処理）
+            with stage("image_preprocess"):
+                prepared = preprocess_images(job.images, job.image_max_edge, job.image_quality, grayscale="シンプル" in job.reading_mode)
+            # 二重撮影などでほぼ同じページは1枚にまとめる
+            prepared, page_hashes, dropped_pages = dedupe_images(prepared)
+            if dropped_pages:
+                notify("info", f"同じページが {dropped_pages} 枚あったため、除いて解析します。")
+            for data, mime_type in prepared:
+                inputs.append({"mime_type": mime_type, "data": data})
+        elif job.url:
+            web_text = fetch_text_from_url(job.url, job.follow_links)
+            inputs.append(web_text[:MAX_TEXT_CHARS] if web_text else "")
+        t = lap("input", t)
+
+        # 同じ画像・条件の解析結果があればGeminiを呼ばない
+        context_key = make_context_key(job.reading_mode, model_name)
+        use_cache = menu_cache and page_hashes and not job.force_reanalyze
+        cached_menu = menu_cache.lookup(page_hashes, context_key) if use_cache else None
+
+        failed_pages = 0
+        if not cached_menu and job.page_parallel and page_hashes and len(page_hashes) > 1:
+            # ページごとに並列で書き出し、その結果を1回の統合リクエストでチャプターに分類する
+            page_texts, failed_pages = extract_pages_parallel(model, build_page_prompt(job.reading_mode), prepared, job.pages_per_request, job.page_workers)
+            if failed_pages:
+                notify("warning", f"{failed_pages} 枚のページを読み取れなかったため、残りのページで作成します。")
+            inputs = [prompt, "以下は、メニューの各ページから書き出した内容です。\n\n" + "\n\n".join(page_texts)]
+            t = lap("pages", t)
+
+        if cached_menu:
+            notify("info", "以前と同じメニュー画像のため、保存済みの解析結果を使います。")
+            menu_data = cached_menu
+            menu_data.insert(0, {"title": "はじめに・目次", "text": build_intro_text(job.store_name, job.menu_title, cached_menu)})
+            generated_tracks, tts_metrics = asyncio.run(process_all_tracks_fast(menu_data, output_dir, job.voice_code, job.rate_value, progress_bar, tts_cache, job.scheduler_config, readings=readings))
+            lap("tts", t)
+        elif job.stream_mode:
+            # 解析と音声合成が重なるため、まとめて1つの段階として計測する
+            menu_data, generated_tracks, tts_metrics = asyncio.run(stream_all_tracks_fast(
+                model, inputs, job.store_name, job.menu_title, output_dir, job.voice_code, job.rate_value, progress_bar, tts_cache, job.scheduler_config, readings
+            ))
+            lap("analysis+tts", t)
+        else:
+            with stage("generate_content", mode="full"):
+                resp = model.generate_content(inputs)
+            menu_data = parse_menu_json(resp.text)
+            menu_data.insert(0, {"title": "はじめに・目次", "text": build_intro_text(job.store_name, job.menu_title, menu_data)})
+            t = lap("analysis", t)
+            generated_tracks, tts_metrics = asyncio.run(process_all_tracks_fast(menu_data, output_dir, job.voice_code, job.rate_value, progress_bar, tts_cache, job.scheduler_config, readings=readings))
+            lap("tts", t)
+        audio_post = finish_tracks([tr['path'] for tr in generated_tracks], job.audio_profile, timings, notify)
+        # 読み取れなかったページがある結果は保存しない（次回は全ページを読み直す）
+        if menu_cache and page_hashes and not cached_menu and not failed_pages:
+            menu_cache.store(page_hashes, context_key, menu_data[1:])
+
+        # 成果物は export_dir へ直接書き出し、メモリには保持しない
+        exported = export_player(job.store_name, generated_tracks, job.map_url, export_dir, job.split_export, timings,
+                                 job.offline_export, job.segmented_export)
+        timings["total"] = round(time.perf_counter() - started, 3)
+
+        return {
+            "menu_data": menu_data,
+            "tracks": generated_tracks,
+            **exported,
+            "store_name": job.store_name,
+            "menu_title": job.menu_title,
+            "map_url": job.map_url,
+            "voice_code": job.voice_code,
+            "rate_value": job.rate_value,
+            "split_export": job.split_export,
+            "offline_export": job.offline_export,
+            "segmented_export": job.segmented_export,
+            "readings_fingerprint": readings.fingerprint if readings else "",
+            "audio_profile": asdict(job.audio_profile) if job.audio_profile else None,
+            "audio_post": audio_post,
+            "used_cached_menu": bool(cached_menu),
+            "tts_metrics": tts_metrics,
+            "tts_cache_hits": tts_metrics["cache_hits"],
+            "tts_cache_misses": tts_metrics["cache_misses"],
+            "timings": timings,
+            "stage_summary": run.summary(),
+        }
+
+# ----------------------------
+# 修正内容だけの再生成
+# ----------------------------
+
+def diff_chapters(old_data: list[dict], new_data: list[dict]) -> list[int]:
+    """読み上げ内容が変わったトラック番号（0 は目次）を返す
+
+    各チャプターの読み上げには番号とタイトルが含まれるため、
+    並びが変わったチャプターも作り直しの対象になる。
+    """
+    changed = []
+    for i, track in enumerate(new_data):
+        if i >= len(old_data) or track_job(i, track, "")[0] != track_job(i, old_data[i], "")[0]:
+            changed.append(i)
+    return changed
+
+def reuse_track_file(src: str, dest: str):
+    """前回の音声を dest に置く（可能ならハードリンク）。src がなければ FileNotFoundError"""
+    if os.path.exists(dest):
+        if os.path.samefile(src, dest):
+            return
+        # 作り直しの出力先が前回と同じフォルダの場合など、既にあるファイルは置き換える
+        os.remove(dest)
+    try:
+        os.link(src, dest)
+    except FileNotFoundError:
+        raise
+    except OSError:
+        # 別のファイルシステムなどリンクできない場合
+        shutil.copyfile(src, dest)
+
+def run_menu_update(previous: dict, chapters: list[dict], output_dir: str, export_dir: str,
+                    tts_cache: TTSCache | None = None, scheduler_config: SchedulerConfig | None = None,
+                    progress_bar=None, readings: ReadingDictionary | None = None) -> dict:
+    """前回の結果（run_menu_pipeline の戻り値）を元に、変更されたチャプターの音声だけを作り直す
+
+    目次はタイトルかチャプター数が変わったときだけ作り直し、それ以外の音声は前回のファイルを使う。
+    読み方辞書が前回から変わっていれば、すべてのトラックを作り直す（内容が同じトラックは音声キャッシュから取り出される）。
+    """
+    with recording_run() as run:
+        timings = {}
+        started = time.perf_counter()
+        os.makedirs(output_dir, exist_ok=True)
+        os.makedirs(export_dir, exist_ok=True)
+
+        old_data = previous["menu_data"]
+        if [tr['title'] for tr in chapters] == [tr['title'] for tr in old_data[1:]]:
+            intro = old_data[0]
+        else:
+            intro = {"title": "はじめに・目次", "text": build_intro_text(previous["store_name"], previous.get("menu_title", ""), chapters)}
+        menu_data = [intro] + chapters
+
+        fingerprint = readings.fingerprint if readings else ""
+        if fingerprint != previous.get("readings_fingerprint", ""):
+            changed = list(range(len(menu_data)))
+        else:
+            changed = diff_chapters(old_data, menu_data)
+        for i, track in enumerate(menu_data):
+            if i in changed:
+                continue
+            old_path, new_path = previous["tracks"][i]["path"], track_job(i, track, output_dir)[1]
+            try:
+                reuse_track_file(old_path, new_path)
+            except FileNotFoundError:
+                # 前回の音声が削除済みなら作り直す
+                changed.append(i)
+
+        t = time.perf_counter()
+        generated_tracks, tts_metrics = asyncio.run(process_all_tracks_fast(
+            menu_data, output_dir, previous["voice_code"], previous["rate_value"], progress_bar, tts_cache, scheduler_config, set(changed), readings
+        ))
+        timings["tts"] = round(time.perf_counter() - t, 3)
+        # 前回と同じ設定で、作り直したトラックだけを仕上げる（再利用したトラックは仕上げ済み）
+        profile = AudioProfile(**previous["audio_profile"]) if previous.get("audio_profile") else None
+        audio_post = finish_tracks([generated_tracks[i]['path'] for i in sorted(changed)], profile, timings)
+        exported = export_player(previous["store_name"], generated_tracks, previous.get("map_url", ""), export_dir,
+                                 previous.get("split_export", True), timings, previous.get("offline_export", False),
+                                 previous.get("segmented_export", False))
+        timings["total"] = round(time.perf_counter() - started, 3)
+
+        return {
+            **previous,
+            **exported,
+            "menu_data": menu_data,
+            "tracks": generated_tracks,
+            "changed_tracks": sorted(changed),
+            "readings_fingerprint": fingerprint,
+            "audio_post": audio_post,
+            "used_cached_menu": False,
+            "tts_metrics": tts_metrics,
+            "tts_cache_hits": tts_metrics["cache_hits"],
+            "tts_cache_misses": tts_metrics["cache_misses"],
+            "timings": timings,
+            "stage_summary": run.summary(),
+        }
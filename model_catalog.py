@@ -0,0 +1,90 @@
+import os
+import time
+import hashlib
+import threading
+import requests
+
+# ----------------------------
+# Geminiモデル一覧のキャッシュ（APIキーごと・全セッション共有）
+# ----------------------------
+
+MODELS_ENDPOINT = "https://generativelanguage.googleapis.com/v1beta/models"
+MODEL_LIST_TTL_SEC = int(os.environ.get("RUNWITH_MODEL_LIST_TTL_SEC", "3600"))
+# 取得に失敗したときは、この間は再試行しない（一覧がなければオフライン候補、あれば保持中の一覧を返す）
+FAILURE_RETRY_SEC = 60
+OFFLINE_MODELS = [
+    "models/gemini-2.5-flash",
+    "models/gemini-2.0-flash",
+    "models/gemini-1.5-flash",
+    "models/gemini-1.5-pro",
+]
+
+
+def fetch_generate_models(api_key: str) -> list[str]:
+    """generateContent に対応したモデル名の一覧をREST APIで取得"""
+    names = []
+    params = {"key": api_key, "pageSize": 1000}
+    while True:
+        resp = requests.get(MODELS_ENDPOINT, params=params, timeout=10)
+        resp.raise_for_status()
+        body = resp.json()
+        for m in body.get("models", []):
+            if "generateContent" in m.get("supportedGenerationMethods", []):
+                names.append(m["name"])
+        if not body.get("nextPageToken"):
+            return names
+        params["pageToken"] = body["nextPageToken"]
+
+
+class ModelCatalog:
+    """TTL付きでモデル一覧を保持し、期限切れ時はバックグラウンドで更新する"""
+
+    def __init__(self, ttl_sec: int = MODEL_LIST_TTL_SEC, fetcher=fetch_generate_models):
+        self.ttl_sec = ttl_sec
+        self.fetcher = fetcher
+        self._lock = threading.Lock()
+        # キー -> {"models", "fetched_at", "error", "failed_at", "refreshing"}
+        self._entries: dict[str, dict] = {}
+
+    @staticmethod
+    def _key(api_key: str) -> str:
+        return hashlib.sha256(api_key.encode("utf-8")).hexdigest()
+
+    def _refresh(self, api_key: str):
+        key = self._key(api_key)
+        try:
+            models = self.fetcher(api_key)
+            update = {"models": models, "fetched_at": time.time(), "error": None}
+        except Exception as e:
+            # 保持中の一覧は残し、失敗した時刻だけ記録する（次の更新はこの時刻から数える）
+            update = {"error": str(e), "failed_at": time.time()}
+        with self._lock:
+            entry = self._entries.setdefault(key, {})
+            entry.update(update)
+            entry["refreshing"] = False
+
+    def models(self, api_key: str) -> tuple[list[str], str, str | None]:
+        """(モデル一覧, 取得元 "live"/"cache"/"offline", エラー内容) を返す"""
+        key = self._key(api_key)
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None or ("models" not in entry and time.time() - entry.get("failed_at", 0) > FAILURE_RETRY_SEC):
+            # 初回だけは同期的に取得する
+            self._refresh(api_key)
+            with self._lock:
+                entry = dict(self._entries[key])
+            if entry.get("models"):
+                return entry["models"], "live", None
+            return OFFLINE_MODELS, "offline", entry.get("error")
+
+        if "models" not in entry:
+            return OFFLINE_MODELS, "offline", entry.get("error")
+
+        with self._lock:
+            now = time.time()
+            stale = now - entry["fetched_at"] > self.ttl_sec
+            backing_off = now - entry.get("failed_at", 0) <= FAILURE_RETRY_SEC
+            if stale and not backing_off and not entry.get("refreshing"):
+                entry["refreshing"] = True
+                threading.Thread(target=self._refresh, args=(api_key,), daemon=True).start()
+        return entry["models"], "cache", None
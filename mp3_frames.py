@@ -0,0 +1,138 @@
+import os
+from typing import Iterator, NamedTuple
+
+# ----------------------------
+# MP3フレーム操作（再エンコードなしの結合・解析）
+# ----------------------------
+
+_BITRATES = {
+    # (MPEG1か, レイヤー) -> kbps テーブル（index 1〜14）
+    (True, 1): [32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (True, 2): [32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (True, 3): [32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (False, 1): [32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (False, 2): [8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (False, 3): [8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+_SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+
+
+class MP3Frame(NamedTuple):
+    offset: int
+    size: int
+    sample_rate: int
+    samples: int
+
+    @property
+    def duration(self) -> float:
+        return self.samples / self.sample_rate
+
+
+def _parse_header(data: bytes, pos: int) -> MP3Frame | None:
+    """pos の位置にあるフレームヘッダを解析（不正なら None）"""
+    if pos + 4 > len(data) or data[pos] != 0xFF or (data[pos + 1] & 0xE0) != 0xE0:
+        return None
+    version = (data[pos + 1] >> 3) & 0x03
+    layer = 4 - ((data[pos + 1] >> 1) & 0x03)
+    bitrate_idx = (data[pos + 2] >> 4) & 0x0F
+    rate_idx = (data[pos + 2] >> 2) & 0x03
+    padding = (data[pos + 2] >> 1) & 0x01
+    if version == 1 or layer == 4 or bitrate_idx in (0, 15) or rate_idx == 3:
+        return None
+    mpeg1 = version == 3
+    bitrate = _BITRATES[(mpeg1, layer)][bitrate_idx - 1] * 1000
+    sample_rate = _SAMPLE_RATES[version][rate_idx]
+    if layer == 1:
+        return MP3Frame(pos, (12 * bitrate // sample_rate + padding) * 4, sample_rate, 384)
+    if layer == 2 or mpeg1:
+        return MP3Frame(pos, 144 * bitrate // sample_rate + padding, sample_rate, 1152)
+    return MP3Frame(pos, 72 * bitrate // sample_rate + padding, sample_rate, 576)
+
+
+def strip_id3(data: bytes) -> tuple[int, int]:
+    """ID3v2（先頭）と ID3v1（末尾）を除いた音声部分の範囲 (start, end) を返す"""
+    start, end = 0, len(data)
+    if data[:3] == b"ID3" and len(data) >= 10:
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        start = 10 + size + (10 if data[5] & 0x10 else 0)
+    if end - start >= 128 and data[end - 128:end - 125] == b"TAG":
+        end -= 128
+    return start, end
+
+
+def iter_frames(data: bytes) -> Iterator[MP3Frame]:
+    """音声フレームを順に列挙（壊れた箇所は次の同期ワードまで読み飛ばす）"""
+    pos, end = strip_id3(data)
+    while pos + 4 <= end:
+        frame = _parse_header(data, pos)
+        if frame is None or frame.size <= 4 or pos + frame.size > end:
+            nxt = data.find(b"\xff", pos + 1, end)
+            if nxt < 0:
+                break
+            pos = nxt
+            continue
+        yield frame
+        pos += frame.size
+
+
+def _is_info_frame(data: bytes, frame: MP3Frame) -> bool:
+    """Xing/Info/VBRI のメタ情報フレーム（無音扱い）かどうか"""
+    body = data[frame.offset:frame.offset + frame.size]
+    return b"Xing" in body or b"Info" in body or b"VBRI" in body
+
+
+def audio_frames(data: bytes) -> list[MP3Frame]:
+    """メタ情報フレームを除いた実際の音声フレーム一覧"""
+    frames = list(iter_frames(data))
+    if frames and _is_info_frame(data, frames[0]):
+        frames = frames[1:]
+    return frames
+
+
+def mp3_duration(path: str) -> float:
+    """MP3ファイルの再生時間（秒）"""
+    with open(path, "rb") as f:
+        data = f.read()
+    return sum(fr.duration for fr in audio_frames(data))
+
+
+def concat_mp3(paths: list[str], dest: str):
+    """複数のMP3をフレーム単位で連結（タグとメタ情報フレームは除去）"""
+    tmp_path = f"{dest}.tmp"
+    with open(tmp_path, "wb") as out:
+        for path in paths:
+            with open(path, "rb") as f:
+                data = f.read()
+            frames = audio_frames(data)
+            if not frames:
+                continue
+            # 連続したフレームはまとめて書き出す
+            run_start = frames[0].offset
+            run_end = run_start
+            for fr in frames:
+                if fr.offset != run_end:
+                    out.write(data[run_start:run_end])
+                    run_start = fr.offset
+                run_end = fr.offset + fr.size
+            out.write(data[run_start:run_end])
+    os.replace(tmp_path, dest)
+
+
+def split_frames(data: bytes, segment_sec: float) -> list[tuple[bytes, float]]:
+    """フレーム境界で約 segment_sec 秒ずつに区切った (音声データ, 秒) の一覧（タグとメタ情報フレームは除去）"""
+    segments = []
+    chunk, duration = [], 0.0
+    for fr in audio_frames(data):
+        chunk.append(data[fr.offset:fr.offset + fr.size])
+        duration += fr.duration
+        if duration >= segment_sec:
+            segments.append((b"".join(chunk), duration))
+            chunk, duration = [], 0.0
+    if chunk:
+        # 短すぎる最後の区切りは直前の区切りにまとめる
+        if segments and duration < segment_sec / 4:
+            prev_data, prev_duration = segments.pop()
+            segments.append((prev_data + b"".join(chunk), prev_duration + duration))
+        else:
+            segments.append((b"".join(chunk), duration))
+    return segments
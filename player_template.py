@@ -0,0 +1,71 @@
+import os
+import re
+from functools import lru_cache
+
+# ----------------------------
+# プレイヤーHTMLのテンプレート（読み込み・圧縮・分割は1回だけ行い、出力先へ順に書き出す）
+# ----------------------------
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+# __STORE_NAME__ のような差し込み位置
+PLACEHOLDER_RE = re.compile(r"__([A-Z][A-Z_]*[A-Z])__")
+_BLOCK_COMMENT_RE = re.compile(r"/\*.*?\*/", re.S)
+# コメントを取り除くのは <script> と <style> の中だけ（本文の「/*」や「//」で始まる行はそのまま残す）
+_CODE_BLOCK_RE = re.compile(r"(<(script|style)\b[^>]*>)(.*?)(</\2\s*>)", re.S | re.I)
+
+
+def _strip_lines(text: str) -> str:
+    return "\n".join(line.strip() for line in text.splitlines() if line.strip())
+
+
+def minify_script(code: str, line_comments: bool = True) -> str:
+    """/* */ コメント・行全体の // コメント（line_comments のとき）・行頭行末の空白・空行を取り除く
+
+    行の区切りは残すため、セミコロンを省いた JS もそのまま動く。
+    """
+    code = _BLOCK_COMMENT_RE.sub("", code)
+    lines = _strip_lines(code).split("\n")
+    return "\n".join(line for line in lines if not (line_comments and line.startswith("//")))
+
+
+def minify_html(text: str) -> str:
+    """<script>・<style> の中のコメントと、文書全体の行頭行末の空白・空行を取り除く"""
+    text = _CODE_BLOCK_RE.sub(
+        lambda m: "\n".join([m.group(1), minify_script(m.group(3), line_comments=m.group(2).lower() == "script"), m.group(4)]),
+        text)
+    return _strip_lines(text)
+
+
+class CompiledTemplate:
+    """固定部分をバイト列にしておき、差し込み値と交互に fp へ書き出すテンプレート
+
+    値には文字列・バイト列のほか、fp を受け取って自分で書き出す関数も渡せる
+    （大きなプレイリストを文字列にまとめずに書き出すため）。
+    """
+
+    def __init__(self, text: str):
+        pieces = PLACEHOLDER_RE.split(text)
+        # split の結果は 固定部分, 名前, 固定部分, 名前, ... の順になる
+        self.parts: list[bytes] = [p.encode("utf-8") for p in pieces[0::2]]
+        self.names: list[str] = pieces[1::2]
+
+    def render(self, fp, values: dict):
+        missing = set(self.names) - set(values)
+        if missing:
+            raise KeyError(f"テンプレートの値が足りません: {', '.join(sorted(missing))}")
+        for part, name in zip(self.parts, self.names):
+            fp.write(part)
+            value = values[name]
+            if callable(value):
+                value(fp)
+            else:
+                fp.write(value if isinstance(value, bytes) else str(value).encode("utf-8"))
+        fp.write(self.parts[-1])
+
+
+@lru_cache(maxsize=None)
+def load_template(name: str) -> CompiledTemplate:
+    """templates/<name> を読み込んで圧縮・分割したものを返す（プロセス内で1回だけ）"""
+    with open(os.path.join(TEMPLATE_DIR, name), "r", encoding="utf-8") as f:
+        text = f.read()
+    return CompiledTemplate(minify_script(text) if name.endswith(".js") else minify_html(text))
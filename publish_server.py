@@ -0,0 +1,391 @@
+import os
+import re
+import gzip
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import argparse
+import threading
+import mimetypes
+import unicodedata
+import zipfile
+from urllib.parse import quote, unquote, urlsplit
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# ----------------------------
+# 公開サーバー（店舗ごとに生成したメニューを保存し、プレイヤーと音声を配信する）
+# ----------------------------
+
+PUBLISH_ROOT = os.environ.get("RUNWITH_PUBLISH_ROOT", "published")
+# 0 のときはサーバーを起動しない
+PUBLISH_PORT = int(os.environ.get("RUNWITH_PUBLISH_PORT", "0"))
+# QRコードに入れる公開URLの先頭（例: https://menu.example.com）。空なら画面のホスト名とポートから作る
+PUBLISH_BASE_URL = os.environ.get("RUNWITH_PUBLISH_BASE_URL", "").rstrip("/")
+# 差し替え後も残しておく古い版の数（開いたままの画面が古い音声を読み込めるように）
+PUBLISH_KEEP_VERSIONS = 2
+# この大きさ以上のテキストは圧縮版（.gz / .br）を用意しておく
+COMPRESS_MIN_BYTES = 512
+COMPRESSIBLE_EXTS = (".html", ".js", ".json", ".webmanifest", ".m3u8", ".svg", ".css")
+# ファイル名に内容のハッシュが入っているもの（tracks/00.<ハッシュ>.mp3 など）は内容が変わらない
+HASHED_NAME_RE = re.compile(r"\.[0-9a-f]{10}\.[A-Za-z0-9]+$")
+STORE_ID_RE = re.compile(r"[\w\-]{1,64}")
+SEND_CHUNK_BYTES = 256 * 1024
+
+CURRENT_FILE = "CURRENT"
+FILES_DIR = "files"
+ETAGS_FILE = "etags.json"
+
+mimetypes.add_type("audio/mpeg", ".mp3")
+mimetypes.add_type("application/vnd.apple.mpegurl", ".m3u8")
+mimetypes.add_type("application/manifest+json", ".webmanifest")
+mimetypes.add_type("text/javascript", ".js")
+
+
+def make_store_id(name: str) -> str:
+    """店舗名から URL に使える公開ID を作る（日本語はそのまま残す）"""
+    text = unicodedata.normalize("NFKC", name).strip().lower()
+    text = re.sub(r"[^\w\-]+", "-", text).strip("-_")
+    return text[:64] or "store"
+
+
+def _encodings():
+    encodings = [("gzip", ".gz", lambda data: gzip.compress(data, 9, mtime=0))]
+    if brotli:
+        encodings.insert(0, ("br", ".br", lambda data: brotli.compress(data, quality=11)))
+    return encodings
+
+
+class PublishStore:
+    """<root>/<公開ID>/<版>/files/ に展開したメニューと、公開中の版（CURRENT）を管理する
+
+    版は ZIP の内容のハッシュで、差し替えは CURRENT の置き換え1回で行う（配信中でも途中の状態は見えない）。
+    """
+
+    def __init__(self, root: str = PUBLISH_ROOT, keep_versions: int = PUBLISH_KEEP_VERSIONS):
+        self.root = root
+        self.keep_versions = keep_versions
+        self._lock = threading.Lock()
+        # 公開ID -> (CURRENT の更新時刻, 版)
+        self._current: dict[str, tuple[int, str]] = {}
+        # (公開ID, 版) -> {パス: ETag}
+        self._etags: dict[tuple[str, str], dict] = {}
+        os.makedirs(root, exist_ok=True)
+
+    def _store_dir(self, store_id: str) -> str:
+        if not STORE_ID_RE.fullmatch(store_id):
+            raise ValueError(f"公開IDに使えない文字が含まれています: {store_id}")
+        return os.path.join(self.root, store_id)
+
+    def publish(self, store_id: str, zip_path: str) -> str:
+        """ZIP（分割版・1ファイル版のどちらでも）を展開して公開し、版を返す"""
+        store_dir = self._store_dir(store_id)
+        digest = hashlib.sha256()
+        with open(zip_path, "rb") as f:
+            while chunk := f.read(SEND_CHUNK_BYTES):
+                digest.update(chunk)
+        version = digest.hexdigest()[:16]
+        version_dir = os.path.join(store_dir, version)
+        if not os.path.isdir(version_dir):
+            tmp_dir = os.path.join(store_dir, f".{version}.{uuid.uuid4().hex}.tmp")
+            try:
+                self._extract(zip_path, tmp_dir)
+                os.replace(tmp_dir, version_dir)
+            except OSError:
+                if not os.path.isdir(version_dir):
+                    raise
+            finally:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+        # 同じ内容を公開し直した場合も「最後に公開した版」として扱う
+        os.utime(version_dir)
+        self._set_current(store_dir, version)
+        self._prune(store_dir, version)
+        return version
+
+    def _extract(self, zip_path: str, dest: str):
+        files_dir = os.path.join(dest, FILES_DIR)
+        etags = {}
+        with zipfile.ZipFile(zip_path) as zf:
+            if "index.html" not in zf.namelist():
+                raise ValueError("ZIP に index.html がありません")
+            for info in zf.infolist():
+                name = info.filename
+                if info.is_dir() or name.startswith("/") or ".." in name.split("/"):
+                    continue
+                path = os.path.join(files_dir, *name.split("/"))
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                data = zf.read(info)
+                with open(path, "wb") as f:
+                    f.write(data)
+                etags[name] = hashlib.sha256(data).hexdigest()[:20]
+                # テキストは配信時に圧縮しないよう、ここで最高圧縮の版を作っておく
+                if name.endswith(COMPRESSIBLE_EXTS) and len(data) >= COMPRESS_MIN_BYTES:
+                    for _, suffix, compress in _encodings():
+                        packed = compress(data)
+                        if len(packed) < len(data):
+                            with open(path + suffix, "wb") as f:
+                                f.write(packed)
+        with open(os.path.join(dest, ETAGS_FILE), "w", encoding="utf-8") as f:
+            json.dump(etags, f)
+
+    def _set_current(self, store_dir: str, version: str):
+        tmp_path = os.path.join(store_dir, f".{CURRENT_FILE}.{uuid.uuid4().hex}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(version)
+        os.replace(tmp_path, os.path.join(store_dir, CURRENT_FILE))
+
+    @staticmethod
+    def _older_versions(store_dir: str, current: str) -> list[str]:
+        """公開中以外の版を、最後に公開した順（新しい順）に並べる"""
+        return sorted(
+            (d for d in os.listdir(store_dir) if not d.startswith(".") and d != current
+             and os.path.isdir(os.path.join(store_dir, d))),
+            key=lambda d: os.path.getmtime(os.path.join(store_dir, d)), reverse=True,
+        )
+
+    def _prune(self, store_dir: str, current: str):
+        for old in self._older_versions(store_dir, current)[self.keep_versions:]:
+            shutil.rmtree(os.path.join(store_dir, old), ignore_errors=True)
+
+    def current_version(self, store_id: str) -> str | None:
+        """公開中の版（CURRENT が変わるまではファイルを読み直さない）"""
+        try:
+            path = os.path.join(self._store_dir(store_id), CURRENT_FILE)
+            mtime = os.stat(path).st_mtime_ns
+        except (ValueError, OSError):
+            return None
+        cached = self._current.get(store_id)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        with open(path, "r", encoding="utf-8") as f:
+            version = f.read().strip()
+        with self._lock:
+            self._current[store_id] = (mtime, version)
+        return version
+
+    def versions(self, store_id: str) -> list[str]:
+        """公開中の版を先頭に、残してある古い版を新しい順に並べる"""
+        current = self.current_version(store_id)
+        if not current:
+            return []
+        return [current] + self._older_versions(self._store_dir(store_id), current)
+
+    def etags(self, store_id: str, version: str) -> dict:
+        key = (store_id, version)
+        etags = self._etags.get(key)
+        if etags is None:
+            with open(os.path.join(self._store_dir(store_id), version, ETAGS_FILE), "r", encoding="utf-8") as f:
+                etags = json.load(f)
+            with self._lock:
+                self._etags[key] = etags
+        return etags
+
+    def resolve(self, store_id: str, rel_path: str) -> tuple[str, str] | None:
+        """公開中の版からファイルを探し、(ファイルのパス, ETag) を返す
+
+        ハッシュ入りの名前は古い版も探す（差し替え直後も、開いたままの画面が前の音声を読み込めるように）。
+        """
+        current = self.current_version(store_id)
+        if not current:
+            return None
+        found = self._lookup(store_id, current, rel_path)
+        if found is None and HASHED_NAME_RE.search(rel_path):
+            # 公開中の版に無いときだけ古い版を調べる
+            for version in self.versions(store_id)[1:]:
+                found = self._lookup(store_id, version, rel_path)
+                if found:
+                    break
+        return found
+
+    def _lookup(self, store_id: str, version: str, rel_path: str) -> tuple[str, str] | None:
+        try:
+            etag = self.etags(store_id, version).get(rel_path)
+        except OSError:
+            return None
+        if etag:
+            return os.path.join(self.root, store_id, version, FILES_DIR, *rel_path.split("/")), etag
+        return None
+
+    def stores(self) -> list[str]:
+        return sorted(d for d in os.listdir(self.root) if self.current_version(d))
+
+
+def public_url(store_id: str, base_url: str) -> str:
+    """店頭用POPのQRコードに入れる固定URL（版が変わっても同じ）"""
+    return f"{base_url.rstrip('/')}/{quote(store_id)}/"
+
+
+def default_base_url(page_url: str = "", port: int = PUBLISH_PORT) -> str:
+    """RUNWITH_PUBLISH_BASE_URL が無ければ、アプリを開いているホスト名と公開サーバーのポートから作る"""
+    if PUBLISH_BASE_URL:
+        return PUBLISH_BASE_URL
+    host = urlsplit(page_url).hostname or "localhost"
+    return f"http://{host}:{port}"
+
+
+def _parse_range(header: str, size: int) -> tuple[int, int] | None:
+    """"bytes=開始-終了" を (開始, 終了) にする（複数範囲は扱わず全体を返す）。範囲外なら (-1, -1)"""
+    m = re.fullmatch(r"bytes=(\d*)-(\d*)", header.strip())
+    if not m or (not m.group(1) and not m.group(2)):
+        return None
+    if m.group(1):
+        start = int(m.group(1))
+        end = min(int(m.group(2)), size - 1) if m.group(2) else size - 1
+    else:
+        start = max(0, size - int(m.group(2)))
+        end = size - 1
+    if start >= size or start > end:
+        return -1, -1
+    return start, end
+
+
+class _PublishHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "RunwithPublish"
+    # 応答の遅い端末に接続を占有され続けないように
+    timeout = 30
+    store: PublishStore = None
+
+    def do_HEAD(self):
+        self._serve(head=True)
+
+    def do_GET(self):
+        self._serve(head=False)
+
+    def _send_empty(self, status: int, headers: dict | None = None):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def _serve(self, head: bool):
+        path = unquote(urlsplit(self.path).path)
+        parts = path.lstrip("/").split("/", 1)
+        store_id = parts[0]
+        if not store_id or not self.store.current_version(store_id):
+            self._send_empty(404)
+            return
+        if len(parts) == 1:
+            # 相対URLで音声を読み込むため、末尾の / をつけたURLに移す
+            self._send_empty(301, {"Location": f"/{quote(store_id)}/"})
+            return
+        rel_path = parts[1] or "index.html"
+        found = None if ".." in rel_path.split("/") else self.store.resolve(store_id, rel_path)
+        if found is None:
+            self._send_empty(404)
+            return
+        file_path, etag = found
+        immutable = bool(HASHED_NAME_RE.search(rel_path))
+        headers = {
+            "Cache-Control": "public, max-age=31536000, immutable" if immutable else "no-cache",
+            "Content-Type": mimetypes.guess_type(rel_path)[0] or "application/octet-stream",
+            "X-Content-Type-Options": "nosniff",
+            "Accept-Ranges": "bytes",
+        }
+
+        # 圧縮版があれば、端末が受け付ける形式で返す（範囲指定の要求には元のファイルを返す）
+        range_header = self.headers.get("Range")
+        if not range_header:
+            accepted = self.headers.get("Accept-Encoding", "")
+            for encoding, suffix, _ in _encodings():
+                if encoding in accepted and os.path.exists(file_path + suffix):
+                    file_path += suffix
+                    etag = f"{etag}-{encoding}"
+                    headers["Content-Encoding"] = encoding
+                    break
+        if file_path.endswith(COMPRESSIBLE_EXTS) or "Content-Encoding" in headers:
+            headers["Vary"] = "Accept-Encoding"
+        headers["ETag"] = f'"{etag}"'
+
+        if_none_match = self.headers.get("If-None-Match", "")
+        if f'"{etag}"' in if_none_match or if_none_match.strip() == "*":
+            self._send_empty(304, {k: v for k, v in headers.items() if k in ("Cache-Control", "ETag", "Vary")})
+            return
+
+        try:
+            size = os.path.getsize(file_path)
+        except OSError:
+            # 古い版が削除された直後など
+            self._send_empty(404)
+            return
+        start, end, status = 0, size - 1, 200
+        if range_header and self.headers.get("If-Range", f'"{etag}"') == f'"{etag}"':
+            requested = _parse_range(range_header, size)
+            if requested == (-1, -1):
+                self._send_empty(416, {"Content-Range": f"bytes */{size}"})
+                return
+            if requested:
+                start, end = requested
+                status = 206
+                headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(end - start + 1 if size else 0))
+        self.end_headers()
+        if head or not size:
+            return
+        with open(file_path, "rb") as f:
+            try:
+                # カーネル内でそのまま送る（使えない環境では少しずつ読み書きする）
+                self.wfile.flush()
+                self.connection.sendfile(f, start, end - start + 1)
+            except (AttributeError, OSError, ValueError):
+                f.seek(start)
+                remaining = end - start + 1
+                while remaining > 0 and (chunk := f.read(min(SEND_CHUNK_BYTES, remaining))):
+                    self.wfile.write(chunk)
+                    remaining -= len(chunk)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _PublishHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+def start_publish_server(port: int = PUBLISH_PORT, store: PublishStore | None = None) -> ThreadingHTTPServer | None:
+    """公開サーバーを別スレッドで起動する（port が 0 なら何もしない）"""
+    if not port:
+        return None
+    handler = type("PublishHandler", (_PublishHandler,), {"store": store or PublishStore()})
+    server = _PublishHTTPServer(("0.0.0.0", port), handler)
+    threading.Thread(target=server.serve_forever, name="runwith-publish", daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="生成したメニューを店舗ごとに公開・配信する")
+    parser.add_argument("--root", default=PUBLISH_ROOT, help="公開データの保存先")
+    parser.add_argument("--port", type=int, default=PUBLISH_PORT or 8080, help="待ち受けるポート")
+    parser.add_argument("--publish", nargs=2, action="append", metavar=("公開ID", "ZIP"), default=[],
+                        help="ZIP を公開してから起動する（複数指定可）")
+    parser.add_argument("--no-serve", action="store_true", help="--publish だけ行い、サーバーは起動しない")
+    args = parser.parse_args(argv)
+
+    store = PublishStore(args.root)
+    for store_id, zip_path in args.publish:
+        print(f"公開しました: /{store_id}/ (版 {store.publish(store_id, zip_path)})")
+    if args.no_serve:
+        return
+    server = start_publish_server(args.port, store)
+    print(f"http://0.0.0.0:{args.port}/<公開ID>/ で配信中（{len(store.stores())} 店舗）")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+import json
+import hashlib
+from collections import deque
+
+# ----------------------------
+# 読み方辞書の置換エンジン（Aho-Corasick法で全単語を1回の走査で探す）
+# ----------------------------
+
+
+class ReadingDictionary:
+    """単語 -> 読み の辞書をオートマトンに変換し、読み上げテキストを決定的に置き換える
+
+    同じ位置から始まる単語が複数あれば長い方を優先し、左から順に重ならないように置換する。
+    """
+
+    def __init__(self, entries: dict):
+        self.entries = {word: reading for word, reading in entries.items() if word}
+        self.fingerprint = hashlib.sha256(
+            json.dumps(sorted(self.entries.items()), ensure_ascii=False).encode("utf-8")
+        ).hexdigest()
+        # 各ノード: 遷移表・失敗リンク・そのノードで終わる単語の長さ
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        self._out: list[tuple[int, ...]] = [()]
+        self._build()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _build(self):
+        for word in self.entries:
+            node = 0
+            for ch in word:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][ch] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(())
+                node = nxt
+            self._out[node] = (len(word),)
+
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                f = self._fail[node]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(ch, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def _longest_from(self, text: str) -> dict[int, int]:
+        """開始位置 -> その位置から始まる最長一致の終了位置"""
+        longest = {}
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(ch, 0)
+            for length in self._out[node]:
+                start = i - length + 1
+                if longest.get(start, -1) < i + 1:
+                    longest[start] = i + 1
+        return longest
+
+    def apply(self, text: str) -> str:
+        if not self.entries or not text:
+            return text
+        longest = self._longest_from(text)
+        if not longest:
+            return text
+        parts = []
+        pos = 0
+        for start in sorted(longest):
+            if start < pos:
+                continue
+            end = longest[start]
+            parts.append(text[pos:start])
+            parts.append(self.entries[text[start:end]])
+            pos = end
+        parts.append(text[pos:])
+        return "".join(parts)
@@ -0,0 +1,164 @@
+import os
+import json
+import time
+import uuid
+import threading
+import contextvars
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ----------------------------
+# 処理段階ごとの所要時間の記録（JSON Lines のログ・Prometheus 形式のファイル／エンドポイント）
+# ----------------------------
+
+METRICS_DIR = os.environ.get("RUNWITH_METRICS_DIR", "metrics")
+METRICS_LOG = os.path.join(METRICS_DIR, "timings.jsonl")
+METRICS_PROM_FILE = os.path.join(METRICS_DIR, "runwith.prom")
+# 0 のときはエンドポイントを開かない（ファイルへの書き出しのみ）
+METRICS_PORT = int(os.environ.get("RUNWITH_METRICS_PORT", "0"))
+# Prometheus 側のラベルにするキー（値の種類が少ないものだけ）
+PROM_LABELS = ("engine", "mode", "outcome")
+
+_current_run: contextvars.ContextVar = contextvars.ContextVar("runwith_metrics_run", default=None)
+_lock = threading.Lock()
+# (段階, ラベル) -> [回数, 合計秒, 最大秒]
+_totals: dict[tuple, list] = {}
+
+
+class RunRecorder:
+    """1回の生成で記録された段階をまとめる"""
+
+    def __init__(self, run_id: str | None = None):
+        self.run_id = run_id or uuid.uuid4().hex
+        self.events: list[dict] = []
+        self._lock = threading.Lock()
+
+    def add(self, event: dict):
+        with self._lock:
+            self.events.append(event)
+
+    def summary(self) -> list[dict]:
+        """段階（とエンジン・種類）ごとの回数・合計・最大を、合計の大きい順に返す"""
+        rows = {}
+        with self._lock:
+            events = list(self.events)
+        for e in events:
+            key = (e["stage"], e.get("engine", ""), e.get("mode", ""), e["outcome"])
+            row = rows.setdefault(key, {"stage": e["stage"], "engine": e.get("engine", ""), "mode": e.get("mode", ""),
+                                        "outcome": e["outcome"], "count": 0, "total_sec": 0.0, "max_sec": 0.0})
+            row["count"] += 1
+            row["total_sec"] = round(row["total_sec"] + e["seconds"], 3)
+            row["max_sec"] = max(row["max_sec"], e["seconds"])
+        return sorted(rows.values(), key=lambda r: -r["total_sec"])
+
+
+def _append_log(event: dict):
+    os.makedirs(METRICS_DIR, exist_ok=True)
+    line = json.dumps(event, ensure_ascii=False) + "\n"
+    with _lock, open(METRICS_LOG, "a", encoding="utf-8") as f:
+        f.write(line)
+
+
+def record(stage: str, seconds: float, outcome: str = "ok", **labels):
+    """段階の所要時間を1件記録する（実行中の RunRecorder があればそこにも追加）"""
+    run = _current_run.get()
+    event = {"ts": round(time.time(), 3), "run": run.run_id if run else None, "stage": stage,
+             "seconds": round(seconds, 4), "outcome": outcome, **labels}
+    if run:
+        run.add(event)
+    merged = {**labels, "outcome": outcome}
+    key = (stage, tuple((k, str(merged.get(k, ""))) for k in PROM_LABELS))
+    with _lock:
+        total = _totals.setdefault(key, [0, 0.0, 0.0])
+        total[0] += 1
+        total[1] += seconds
+        total[2] = max(total[2], seconds)
+    try:
+        _append_log(event)
+    except OSError:
+        pass
+
+
+@contextmanager
+def stage(name: str, **labels):
+    """with stage("tts_attempt", engine="edge-tts") as info: ... のように囲んだ区間を記録する
+
+    info は辞書で、区間内でラベル（実際に使ったエンジンなど）や outcome を書き換えられる。
+    例外が出たときは outcome="error" として記録し、例外はそのまま送出する。
+    """
+    info = dict(labels)
+    started = time.perf_counter()
+    try:
+        yield info
+    except BaseException:
+        info["outcome"] = "error"
+        raise
+    finally:
+        outcome = info.pop("outcome", "ok")
+        record(name, time.perf_counter() - started, outcome, **info)
+
+
+@contextmanager
+def recording_run(run_id: str | None = None):
+    """この中で記録された段階を RunRecorder に集め、終了時に Prometheus 形式のファイルを更新する"""
+    run = RunRecorder(run_id)
+    token = _current_run.set(run)
+    try:
+        yield run
+    finally:
+        _current_run.reset(token)
+        try:
+            write_prometheus_file()
+        except OSError:
+            pass
+
+
+def render_prometheus() -> str:
+    lines = [
+        "# HELP runwith_stage_seconds Time spent in each pipeline stage.",
+        "# TYPE runwith_stage_seconds summary",
+    ]
+    maxima = ["# HELP runwith_stage_seconds_max Longest single run of each pipeline stage.",
+              "# TYPE runwith_stage_seconds_max gauge"]
+    with _lock:
+        items = sorted(_totals.items())
+    for (stage_name, labels), (count, total, longest) in items:
+        label_str = ",".join([f'stage="{stage_name}"'] + [f'{k}="{v}"' for k, v in labels if v])
+        lines.append(f"runwith_stage_seconds_count{{{label_str}}} {count}")
+        lines.append(f"runwith_stage_seconds_sum{{{label_str}}} {total:.4f}")
+        maxima.append(f"runwith_stage_seconds_max{{{label_str}}} {longest:.4f}")
+    return "\n".join(lines + maxima) + "\n"
+
+
+def write_prometheus_file(path: str = METRICS_PROM_FILE):
+    """node_exporter の textfile collector などで読めるよう、置き換え方式で書き出す"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(render_prometheus())
+    os.replace(tmp_path, path)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") not in ("", "/metrics"):
+            self.send_error(404)
+            return
+        body = render_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port: int = METRICS_PORT) -> ThreadingHTTPServer | None:
+    """/metrics を返すHTTPサーバーを別スレッドで起動する（port が 0 なら何もしない）"""
+    if not port:
+        return None
+    server = ThreadingHTTPServer(("0.0.0.0", port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="runwith-metrics", daemon=True).start()
+    return server
@@ -0,0 +1,68 @@
+// Runwith 音声メニューのサービスワーカー（キャッシュ名はプレイリストの内容から決まる）
+const CACHE = "__CACHE_NAME__";
+const SHELL = __SHELL_URLS__;
+const TRACKS = __TRACK_URLS__;
+const abs = (u) => new URL(u, self.registration.scope).href;
+
+self.addEventListener("install", (e) => {
+    // プレイヤー本体はインストール時に必ず保存する
+    e.waitUntil(caches.open(CACHE).then((c) => c.addAll(SHELL.map(abs))).then(() => self.skipWaiting()));
+});
+
+self.addEventListener("activate", (e) => {
+    // 有効化を待つ間はページからの読み込みも待たされるため、ここでは古いキャッシュの削除だけを行う
+    e.waitUntil((async () => {
+        const names = await caches.keys();
+        await Promise.all(names.filter((n) => n.startsWith("runwith-") && n !== CACHE).map((n) => caches.delete(n)));
+        await self.clients.claim();
+    })());
+});
+
+// 音声は有効になった後、ページからの合図（"cache-tracks"）を受けて1曲ずつ保存する
+async function cacheTracks() {
+    const c = await caches.open(CACHE);
+    for (const u of TRACKS.map(abs)) {
+        if (await c.match(u)) continue;
+        try { const r = await fetch(u); if (r.ok) await c.put(u, r); } catch (err) { break; }
+    }
+}
+
+self.addEventListener("message", (e) => {
+    if (e.data === "cache-tracks") e.waitUntil(cacheTracks());
+});
+
+// audio 要素の Range 要求に、保存済みの音声から 206 で応える
+async function ranged(req, res) {
+    const m = /bytes=(\d*)-(\d*)/.exec(req.headers.get("range") || "");
+    if (!m) return res;
+    const buf = await res.arrayBuffer();
+    const size = buf.byteLength;
+    let start = m[1] === "" ? Math.max(0, size - Number(m[2])) : Number(m[1]);
+    let end = m[1] !== "" && m[2] !== "" ? Math.min(Number(m[2]), size - 1) : size - 1;
+    if (start >= size) return new Response(null, {status: 416, headers: {"Content-Range": "bytes */" + size}});
+    return new Response(buf.slice(start, end + 1), {status: 206, headers: {
+        "Content-Type": res.headers.get("Content-Type") || "audio/mpeg",
+        "Content-Range": "bytes " + start + "-" + end + "/" + size,
+        "Content-Length": String(end - start + 1),
+        "Accept-Ranges": "bytes",
+    }});
+}
+
+self.addEventListener("fetch", (e) => {
+    const req = e.request;
+    if (req.method !== "GET" || !req.url.startsWith(self.registration.scope)) return;
+    e.respondWith((async () => {
+        const c = await caches.open(CACHE);
+        const url = req.mode === "navigate" ? abs("./") : req.url.split("#")[0];
+        const hit = await c.match(url, {ignoreSearch: true});
+        if (hit) return req.headers.has("range") ? ranged(req, hit) : hit;
+        if (req.headers.has("range")) {
+            // 途中から読む要求はそのまま通し、ファイル全体は裏で保存する
+            e.waitUntil(fetch(url).then((r) => r.ok ? c.put(url, r) : null).catch(() => null));
+            return fetch(req);
+        }
+        const res = await fetch(req);
+        if (res.ok && res.type === "basic") e.waitUntil(c.put(url, res.clone()));
+        return res;
+    })());
+});
@@ -0,0 +1,37 @@
+import os
+import sys
+import random
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(autouse=True)
+def isolated_metrics(tmp_path, monkeypatch):
+    """段階の記録（timings.jsonl・runwith.prom）をテストごとの一時フォルダに書き出す"""
+    import stage_metrics
+    metrics_dir = tmp_path / "metrics"
+    write_file = stage_metrics.write_prometheus_file
+    monkeypatch.setattr(stage_metrics, "METRICS_DIR", str(metrics_dir))
+    monkeypatch.setattr(stage_metrics, "METRICS_LOG", str(metrics_dir / "timings.jsonl"))
+    monkeypatch.setattr(stage_metrics, "write_prometheus_file",
+                        lambda path=str(metrics_dir / "runwith.prom"): write_file(path))
+    # プロセス全体の集計もテストごとに空から始める
+    monkeypatch.setattr(stage_metrics, "_totals", {})
+    return metrics_dir
+
+
+@pytest.fixture
+def fake_tts(monkeypatch):
+    """edge-tts と gTTS を、遅延・失敗のない代用品（benchmark.py のもの）に差し替える"""
+    import benchmark
+    import menu_pipeline
+    profile = benchmark.BackendProfile(gemini_latency=0, tts_latency=0, tts_failure_rate=0, gtts_latency=0)
+    monkeypatch.setattr(benchmark.FakeCommunicate, "profile", profile)
+    monkeypatch.setattr(benchmark.FakeCommunicate, "rng", random.Random(0))
+    monkeypatch.setattr(benchmark.FakeGTTS, "profile", profile)
+    monkeypatch.setattr(benchmark.FakeGTTS, "rng", random.Random(1))
+    monkeypatch.setattr(menu_pipeline.edge_tts, "Communicate", benchmark.FakeCommunicate)
+    monkeypatch.setattr(menu_pipeline, "gTTS", benchmark.FakeGTTS)
+    return profile
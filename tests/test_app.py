@@ -0,0 +1,55 @@
+import ast
+import builtins
+import os
+
+import pytest
+from streamlit.testing.v1 import AppTest
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+
+
+@pytest.fixture
+def result_app(tmp_path, monkeypatch):
+    """生成結果（Step 4）を表示した状態のアプリ"""
+    monkeypatch.chdir(tmp_path)
+    html_path, zip_path = tmp_path / "menu.html", tmp_path / "menu.zip"
+    html_path.write_bytes(b"<html></html>")
+    zip_path.write_bytes(b"PK\x05\x06" + b"\0" * 18)
+    at = AppTest.from_file(APP_PATH, default_timeout=60)
+    at.secrets["GEMINI_API_KEY"] = "dummy"
+    at.session_state.generated_result = {
+        "job_id": None, "tracks": [], "preview_playlist": None,
+        "html_path": str(html_path), "html_name": "menu.html",
+        "zip_path": str(zip_path), "zip_name": "menu.zip",
+        "store_name": "テスト食堂", "menu_data": [{"title": "はじめに・目次", "text": ""}],
+    }
+    return at, str(html_path), str(zip_path)
+
+
+def test_downloads_are_not_read_on_rerun(result_app, monkeypatch):
+    at, html_path, zip_path = result_app
+    opened = []
+    real_open = builtins.open
+
+    def recording_open(file, *args, **kwargs):
+        opened.append(os.fspath(file) if isinstance(file, (str, os.PathLike)) else file)
+        return real_open(file, *args, **kwargs)
+
+    monkeypatch.setattr(builtins, "open", recording_open)
+    at.run()
+    assert not at.exception
+    assert html_path not in opened
+    assert zip_path not in opened
+
+
+def test_script_does_not_rebind_imported_names():
+    """スクリプトは再実行のたびに上から実行されるため、取り込んだ関数を変数名で上書きしない"""
+    with open(APP_PATH, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    imported = {alias.asname or alias.name.split(".")[0]
+                for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))
+                for alias in node.names}
+    assigned = {target.id for node in ast.walk(tree) if isinstance(node, (ast.Assign, ast.AnnAssign, ast.AugAssign))
+                for target in (node.targets if isinstance(node, ast.Assign) else [node.target])
+                if isinstance(target, ast.Name)}
+    assert imported & assigned == set()
@@ -0,0 +1,56 @@
+import os
+import stat
+
+import audio_post
+from audio_post import AudioProfile, build_filter, postprocess_track, postprocess_tracks
+
+
+def test_filter_trims_both_ends_then_normalizes():
+    audio_filter = build_filter(AudioProfile(loudness_lufs=-18.0, keep_silence_sec=0.2))
+    steps = audio_filter.split(",")
+    assert [s.split("=")[0] for s in steps] == ["silenceremove", "areverse", "silenceremove", "areverse", "loudnorm"]
+    assert "start_threshold=-50dB" in steps[0] and "start_silence=0.2" in steps[0]
+    assert steps[-1] == "loudnorm=I=-18.0:TP=-1.5:LRA=11"
+
+
+def test_filter_steps_can_be_turned_off():
+    assert build_filter(AudioProfile(trim_silence=False)).startswith("loudnorm=")
+    assert "loudnorm" not in build_filter(AudioProfile(normalize=False))
+    assert build_filter(AudioProfile(trim_silence=False, normalize=False)) == ""
+
+
+def fake_ffmpeg(tmp_path, output: bytes, exit_code: int = 0) -> str:
+    """最後の引数（出力先）に output を書き出すだけの ffmpeg"""
+    script = tmp_path / "ffmpeg"
+    script.write_text(f'#!/bin/sh\nfor last; do :; done\nprintf \'{output.decode()}\' > "$last"\nexit {exit_code}\n')
+    script.chmod(script.stat().st_mode | stat.S_IEXEC)
+    return str(script)
+
+
+def test_processed_track_is_kept_even_if_larger(tmp_path, monkeypatch):
+    track = tmp_path / "01.mp3"
+    track.write_bytes(b"orig")
+    monkeypatch.setattr(audio_post, "FFMPEG", fake_ffmpeg(tmp_path, b"normalized-and-larger"))
+    assert postprocess_track(str(track), AudioProfile()) == (4, 21)
+    assert track.read_bytes() == b"normalized-and-larger"
+    assert set(os.listdir(tmp_path)) == {"01.mp3", "ffmpeg"}
+
+
+def test_failed_or_empty_output_keeps_the_original(tmp_path, monkeypatch):
+    track = tmp_path / "01.mp3"
+    track.write_bytes(b"orig")
+    monkeypatch.setattr(audio_post, "FFMPEG", fake_ffmpeg(tmp_path, b"partial", exit_code=1))
+    assert postprocess_track(str(track), AudioProfile()) == (4, 4)
+    monkeypatch.setattr(audio_post, "FFMPEG", fake_ffmpeg(tmp_path, b""))
+    assert postprocess_track(str(track), AudioProfile()) == (4, 4)
+    assert track.read_bytes() == b"orig"
+    assert set(os.listdir(tmp_path)) == {"01.mp3", "ffmpeg"}
+
+
+def test_without_ffmpeg_tracks_are_left_alone(tmp_path, monkeypatch):
+    track = tmp_path / "01.mp3"
+    track.write_bytes(b"orig")
+    monkeypatch.setattr(audio_post, "FFMPEG", str(tmp_path / "missing-ffmpeg"))
+    assert postprocess_tracks([str(track)], AudioProfile()) == {"tracks": 0, "bytes_before": 0, "bytes_after": 0}
+    assert postprocess_track(str(track), AudioProfile()) == (4, 4)
+    assert track.read_bytes() == b"orig"
@@ -0,0 +1,50 @@
+import io
+import struct
+import zipfile
+
+import pytest
+
+from audio_segments import HLS_TIMESTAMP_OWNER, build_m3u8, timestamp_tag, write_segmented_track
+from mp3_frames import audio_frames
+
+# MPEG1 Layer III・128kbps・44.1kHz の1フレーム（約0.026秒）
+FRAME = b"\xff\xfb\x90\x00" + b"\0" * 413
+
+
+def test_timestamp_tag_carries_start_in_90khz_units():
+    tag = timestamp_tag(2.5)
+    assert tag.startswith(b"ID3\x04")
+    assert tag[10:14] == b"PRIV"
+    assert HLS_TIMESTAMP_OWNER in tag
+    assert struct.unpack(">Q", tag[-8:])[0] == 225000
+
+
+def test_m3u8_lists_segments_in_order():
+    text = build_m3u8([("01/000.a.mp3", 4.02), ("01/001.b.mp3", 1.5)])
+    lines = text.splitlines()
+    assert lines[0] == "#EXTM3U"
+    assert "#EXT-X-TARGETDURATION:5" in lines
+    assert lines[-5:] == ["#EXTINF:4.020,", "01/000.a.mp3", "#EXTINF:1.500,", "01/001.b.mp3", "#EXT-X-ENDLIST"]
+
+
+def test_segmented_track_is_written_with_hashed_names(tmp_path):
+    path = tmp_path / "01.mp3"
+    path.write_bytes(FRAME * 100)
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        item = write_segmented_track(zf, str(path), "tracks/01", segment_sec=1.0)
+    with zipfile.ZipFile(buf) as zf:
+        names = set(zf.namelist())
+        playlist = zf.read(item["src"]).decode("utf-8")
+        bodies = [zf.read(name) for name, _ in item["segs"]]
+
+    assert item["src"].startswith("tracks/01.") and item["src"].endswith(".m3u8")
+    assert names == {item["src"]} | {name for name, _ in item["segs"]}
+    assert [name.split("/")[-1].split(".")[0] for name, _ in item["segs"]] == ["000", "001", "002"]
+    assert item["dur"] == pytest.approx(sum(d for _, d in item["segs"]), abs=0.01)
+    # プレイリストは .m3u8 の場所からの相対パスで区切りを指す
+    assert [line for line in playlist.splitlines() if not line.startswith("#")] == [
+        "01/" + name.split("/")[-1] for name, _ in item["segs"]]
+    # 各区切りは開始時刻のタグで始まり、音声フレームは元のまま
+    assert all(body.startswith(b"ID3") for body in bodies)
+    assert sum(len(audio_frames(body)) for body in bodies) == 100
@@ -0,0 +1,100 @@
+import csv
+import json
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import batch_cli
+from menu_pipeline import sanitize_filename
+
+
+def test_load_manifest_csv_defaults_id_from_store_name(tmp_path):
+    path = tmp_path / "stores.csv"
+    path.write_text("store_name,menu_title,images,id\n"
+                    " 喫茶 ランウィズ/本店 ,ランチ,a.jpg,\n"
+                    ",空行,,\n"
+                    "食堂,夜,b/*.png,shokudo\n", encoding="utf-8-sig")
+    stores = batch_cli.load_manifest(str(path))
+    assert [row["store_name"] for row in stores] == ["喫茶 ランウィズ/本店", "食堂"]
+    assert stores[0]["id"] == sanitize_filename("喫茶 ランウィズ/本店")
+    assert stores[1]["id"] == "shokudo"
+    assert all(row["base_dir"] == str(tmp_path) for row in stores)
+
+
+def test_load_manifest_json(tmp_path):
+    path = tmp_path / "stores.json"
+    path.write_text(json.dumps([
+        {"store_name": "食堂", "images": ["a.jpg", "b.jpg"], "mode": "detail"},
+        {"menu_title": "店名なし"},
+    ], ensure_ascii=False), encoding="utf-8")
+    stores = batch_cli.load_manifest(str(path))
+    assert len(stores) == 1
+    assert stores[0]["id"] == sanitize_filename("食堂")
+    assert stores[0]["images"] == ["a.jpg", "b.jpg"]
+
+
+def test_read_images_expands_patterns_relative_to_manifest(tmp_path):
+    (tmp_path / "menu").mkdir()
+    (tmp_path / "menu" / "2.png").write_bytes(b"png2")
+    (tmp_path / "menu" / "1.png").write_bytes(b"png1")
+    (tmp_path / "cover.jpg").write_bytes(b"jpg")
+    images = batch_cli.read_images("cover.jpg; menu/*.png;missing.jpg", str(tmp_path))
+    assert images == [(b"jpg", "image/jpeg"), (b"png1", "image/png"), (b"png2", "image/png")]
+    assert batch_cli.read_images([str(tmp_path / "cover.jpg")], "/nowhere") == [(b"jpg", "image/jpeg")]
+    assert batch_cli.read_images("", str(tmp_path)) == []
+
+
+def write_manifest(tmp_path) -> str:
+    path = tmp_path / "stores.csv"
+    path.write_text("store_name,id\n食堂,a\n喫茶,b\n", encoding="utf-8")
+    return str(path)
+
+
+def run_main(monkeypatch, tmp_path, run_store, *args) -> tuple[int, list[str]]:
+    calls = []
+
+    def fake_run_store(row, options):
+        calls.append(row["id"])
+        return run_store(row, options)
+
+    monkeypatch.setattr(batch_cli, "ProcessPoolExecutor", ThreadPoolExecutor)
+    monkeypatch.setattr(batch_cli, "run_store", fake_run_store)
+    out = tmp_path / "out"
+    code = batch_cli.main([write_manifest(tmp_path), "--out", str(out), "--api-key", "dummy", *args])
+    return code, sorted(calls)
+
+
+def finished(row, options):
+    summary = {"id": row["id"], "store_name": row["store_name"], "status": "ok",
+               "zip_path": "menu.zip", "timings": {"total": 1.0}}
+    batch_cli.write_result(options["out"], summary)
+    return summary
+
+
+def test_completed_stores_are_skipped_unless_forced(monkeypatch, tmp_path):
+    out = str(tmp_path / "out")
+    batch_cli.write_result(out, {"id": "a", "store_name": "食堂", "status": "ok"})
+    batch_cli.write_result(out, {"id": "b", "store_name": "喫茶", "status": "error", "error": "x"})
+    assert batch_cli.is_done(out, "a")
+    assert not batch_cli.is_done(out, "b")
+    assert not batch_cli.is_done(out, "c")
+
+    assert run_main(monkeypatch, tmp_path, finished) == (0, ["b"])
+    assert run_main(monkeypatch, tmp_path, finished) == (0, [])
+    assert run_main(monkeypatch, tmp_path, finished, "--force") == (0, ["a", "b"])
+
+
+def test_crashed_worker_is_reported_and_the_batch_continues(monkeypatch, tmp_path):
+    def crash_on_b(row, options):
+        if row["id"] == "b":
+            raise BrokenProcessPool("worker died")
+        return finished(row, options)
+
+    code, calls = run_main(monkeypatch, tmp_path, crash_on_b)
+    assert (code, calls) == (1, ["a", "b"])
+    out = tmp_path / "out"
+    with open(out / "report.csv", encoding="utf-8-sig", newline="") as f:
+        report = {row["id"]: row for row in csv.DictReader(f)}
+    assert report["a"]["status"] == "ok"
+    assert report["b"]["status"] == "error"
+    assert "worker died" in report["b"]["error"]
+    assert not batch_cli.is_done(str(out), "b")
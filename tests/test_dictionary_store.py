@@ -0,0 +1,83 @@
+import json
+
+import pytest
+
+from dictionary_store import GLOBAL_NAMESPACE, DictionaryStore
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "dictionary.sqlite3")
+
+
+def test_every_write_bumps_the_namespace_version(db_path):
+    store = DictionaryStore(db_path, legacy_file="")
+    assert store.version() == 0
+    store.put("辛口", "からくち")
+    store.put_many([("並", "なみ"), ("大盛", "おおもり")])
+    store.delete("並")
+    assert store.version() == 3
+    assert store.version("テスト食堂") == 0
+    # 空の単語・読みしかない書き込みは変更として数えない
+    assert store.put_many([("", "x"), ("y", " ")]) == 0
+    assert store.version() == 3
+
+
+def test_save_from_another_process_is_seen_on_next_read(db_path):
+    ui, worker = DictionaryStore(db_path, legacy_file=""), DictionaryStore(db_path, legacy_file="")
+    ui.put("辛口", "からくち")
+    assert worker.readings().apply("辛口カレー") == "からくちカレー"
+    # 別の接続で書き換えると変更番号が上がり、保持していた変換済み辞書は使われない
+    ui.put("辛口", "からぐち")
+    ui.put("カレー", "かれー")
+    assert worker.readings().apply("辛口カレー") == "からぐちかれー"
+    assert worker.entries() == {"辛口": "からぐち", "カレー": "かれー"}
+
+
+def test_failed_save_changes_nothing(db_path):
+    store = DictionaryStore(db_path, legacy_file="")
+    store.put("辛口", "からくち")
+    with pytest.raises(Exception):
+        store._write(GLOBAL_NAMESPACE, [
+            ("INSERT INTO entries (namespace, word, reading, updated_at) VALUES ('', '並', 'なみ', 0)", ()),
+            ("INSERT INTO missing_table VALUES (1)", ()),
+        ])
+    assert store.version() == 1
+    assert store.entries() == {"辛口": "からくち"}
+
+
+def test_store_entries_override_common_ones(db_path):
+    store = DictionaryStore(db_path, legacy_file="")
+    store.put_many([("辛口", "からくち"), ("並", "なみ")])
+    store.put("辛口", "からさ控えめ", "テスト食堂")
+    store.put("特製", "とくせい", "別の店")
+    assert store.readings().apply("辛口の並と特製") == "からくちのなみと特製"
+    assert store.readings("テスト食堂").apply("辛口の並と特製") == "からさ控えめのなみと特製"
+    assert store.readings("別の店").apply("辛口の並と特製") == "からくちのなみととくせい"
+
+
+def test_store_name_is_normalized(db_path):
+    store = DictionaryStore(db_path, legacy_file="")
+    store.put("辛口", "からさ控えめ", "テスト食堂")
+    assert store.readings(" テスト食堂　").apply("辛口") == "からさ控えめ"
+
+
+def test_csv_round_trip(db_path):
+    store = DictionaryStore(db_path, legacy_file="")
+    store.put_many([("辛口", "からくち"), ("並, 大", "なみ、だい"), ('"特製"', "とくせい")])
+    data = store.export_csv()
+    assert data.startswith(b"\xef\xbb\xbf")
+
+    other = DictionaryStore(db_path.replace("dictionary", "other"), legacy_file="")
+    assert other.import_csv(data, "テスト食堂") == 3
+    assert other.entries("テスト食堂") == store.entries()
+    assert other.import_csv("単語,読み\n 並 , なみ \n壊れた行\n", GLOBAL_NAMESPACE) == 1
+    assert other.entries() == {"並": "なみ"}
+
+
+def test_legacy_json_is_imported_once(db_path, tmp_path):
+    legacy = tmp_path / "my_dictionary.json"
+    legacy.write_text(json.dumps({"辛口": "からくち"}, ensure_ascii=False), encoding="utf-8")
+    assert DictionaryStore(db_path, legacy_file=str(legacy)).entries() == {"辛口": "からくち"}
+    legacy.write_text(json.dumps({"並": "なみ"}, ensure_ascii=False), encoding="utf-8")
+    assert DictionaryStore(db_path, legacy_file=str(legacy)).entries() == {"辛口": "からくち"}
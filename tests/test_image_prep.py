@@ -0,0 +1,32 @@
+import io
+
+import pytest
+from PIL import Image
+
+from image_prep import preprocess_image
+
+
+def png(img: Image.Image) -> bytes:
+    buf = io.BytesIO()
+    img.save(buf, "PNG")
+    return buf.getvalue()
+
+
+@pytest.mark.parametrize("mode", ["RGBA", "LA", "P"])
+@pytest.mark.parametrize("grayscale", [False, True])
+def test_transparent_background_becomes_white(mode, grayscale):
+    # 透明な背景に黒い文字（四角）だけを描いたページ
+    img = Image.new("RGBA", (100, 100), (0, 0, 0, 0))
+    img.paste((0, 0, 0, 255), (40, 40, 60, 60))
+    if mode == "P":
+        img = img.convert("P")
+        img.info["transparency"] = img.getpixel((0, 0))
+    else:
+        img = img.convert(mode)
+
+    data, mime_type = preprocess_image(png(img), "image/png", grayscale=grayscale)
+    assert mime_type == "image/jpeg"
+    with Image.open(io.BytesIO(data)) as out:
+        out = out.convert("L")
+        assert out.getpixel((5, 5)) > 240
+        assert out.getpixel((50, 50)) < 20
@@ -0,0 +1,132 @@
+import sqlite3
+import threading
+import time
+
+import job_queue
+from job_queue import DONE, FAILED, QUEUED, RUNNING, JobRunner, JobStore
+
+
+def test_claim_next_takes_oldest_queued_job(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    first = store.create("a", {"n": 1})
+    second = store.create("a", {"n": 2})
+    assert store.queue_position(second) == 1
+    assert store.claim_next() == (first, {"n": 1})
+    assert store.get(first)["status"] == RUNNING
+    assert store.claim_next() == (second, {"n": 2})
+    assert store.claim_next() is None
+
+
+def test_finish_and_fail_record_result(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"))
+    ok, ng = store.create("a", 1), store.create("a", 2)
+    store.claim_next(), store.claim_next()
+    assert store.finish(ok, {"zip_path": "x.zip"})
+    assert store.fail(ng, "boom")
+    assert store.get(ok)["status"] == DONE and store.get(ok)["result"] == {"zip_path": "x.zip"}
+    assert store.get(ng)["status"] == FAILED and store.get(ng)["error"] == "boom"
+    assert store.counts() == {QUEUED: 0, RUNNING: 0, DONE: 1, FAILED: 1}
+
+
+def test_requeue_skips_jobs_with_live_lease_from_other_process(tmp_path):
+    db = str(tmp_path / "jobs.sqlite3")
+    running = JobStore(db)
+    job_id = running.create("a", 1)
+    running.claim_next()
+    # 別のプロセス（または作り直したランナー）が起動しても、実行中のジョブは戻さない
+    assert JobStore(db).requeue_interrupted() == 0
+    assert running.get(job_id)["status"] == RUNNING
+
+
+def test_requeue_takes_over_expired_lease(tmp_path):
+    db = str(tmp_path / "jobs.sqlite3")
+    crashed = JobStore(db, lease_sec=0.01)
+    job_id = crashed.create("a", 1)
+    crashed.claim_next()
+    time.sleep(0.05)
+    other = JobStore(db)
+    assert other.requeue_interrupted() == 1
+    assert other.claim_next() == (job_id, 1)
+    # 期限切れ後に引き取られたジョブは、元の担当が完了を書き込んでも上書きしない
+    assert not crashed.finish(job_id, {"stale": True})
+    assert other.finish(job_id, {"fresh": True})
+    assert other.get(job_id)["result"] == {"fresh": True}
+
+
+def test_renew_leases_keeps_job_from_expiring(tmp_path):
+    db = str(tmp_path / "jobs.sqlite3")
+    store = JobStore(db, lease_sec=0.2)
+    job_id = store.create("a", 1)
+    store.claim_next()
+    for _ in range(3):
+        time.sleep(0.1)
+        assert store.renew_leases([job_id]) == 1
+    assert JobStore(db).requeue_interrupted() == 0
+
+
+def test_runner_processes_jobs_and_renews_lease(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite3"), lease_sec=0.15)
+    release = threading.Event()
+
+    def handler(job_id, payload, progress, notify):
+        notify("info", "started")
+        release.wait(2)
+        return {"double": payload * 2}
+
+    runner = JobRunner(store, handler, workers=1)
+    runner.start()
+    try:
+        job_id = runner.submit("a", 21)
+        # 担当期限の数倍の時間がたっても、実行中である限り他からは引き取れない
+        time.sleep(0.5)
+        assert JobStore(store.db_path).requeue_interrupted() == 0
+        release.set()
+        deadline = time.time() + 5
+        while store.get(job_id)["status"] != DONE and time.time() < deadline:
+            time.sleep(0.02)
+        job = store.get(job_id)
+        assert job["result"] == {"double": 42}
+        assert job["notices"] == [["info", "started"]]
+    finally:
+        runner.stop()
+
+
+class LockedOnceStore(JobStore):
+    """最初の取り出しと引き取りだけ「database is locked」で失敗する"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.locked = {"claim_next": 1, "requeue_interrupted": 1}
+
+    def _maybe_lock(self, name):
+        if self.locked[name]:
+            self.locked[name] -= 1
+            raise sqlite3.OperationalError("database is locked")
+
+    def claim_next(self):
+        self._maybe_lock("claim_next")
+        return super().claim_next()
+
+    def requeue_interrupted(self):
+        self._maybe_lock("requeue_interrupted")
+        return super().requeue_interrupted()
+
+
+def test_runner_survives_transient_database_errors(tmp_path, monkeypatch, caplog):
+    monkeypatch.setattr(job_queue, "JOB_DB_RETRY_SEC", 0.01)
+    store = LockedOnceStore(str(tmp_path / "jobs.sqlite3"))
+    # 起動時の引き取りは成功させ、ワーカーのループの中で失敗させる
+    store.locked["requeue_interrupted"] = 0
+    runner = JobRunner(store, lambda job_id, payload, progress, notify: {"n": payload}, workers=1)
+    runner.start()
+    try:
+        store.locked["requeue_interrupted"] = 1
+        job_id = runner.submit("a", 1)
+        deadline = time.time() + 5
+        while store.get(job_id)["status"] != DONE and time.time() < deadline:
+            time.sleep(0.02)
+        assert store.get(job_id)["result"] == {"n": 1}
+        assert all(t.is_alive() for t in runner._threads)
+        assert "database is locked" in caplog.text
+    finally:
+        runner.stop()
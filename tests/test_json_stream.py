@@ -0,0 +1,49 @@
+import json
+
+import pytest
+
+from json_stream import IncrementalJSONArrayParser
+
+CHAPTERS = [
+    {"title": "定食", "text": "唐揚げ定食、800円。"},
+    {"title": "記号", "text": "\"引用\" と {波かっこ} と [角かっこ] と \\ を含む。"},
+    {"title": "入れ子", "text": "大盛り", "options": {"price": 100, "tags": ["a", "b"]}},
+]
+
+
+def feed_all(text: str, size: int) -> tuple[list[dict], IncrementalJSONArrayParser]:
+    parser = IncrementalJSONArrayParser()
+    items = []
+    for start in range(0, len(text), size):
+        items.extend(parser.feed(text[start:start + size]))
+    return items, parser
+
+
+@pytest.mark.parametrize("size", [1, 2, 7, 10_000])
+def test_objects_are_returned_whatever_the_chunk_size(size):
+    text = "```json\n" + json.dumps(CHAPTERS, ensure_ascii=False, indent=2) + "\n```"
+    items, parser = feed_all(text, size)
+    assert items == CHAPTERS
+    assert parser.finished
+
+
+def test_each_object_is_returned_as_soon_as_it_closes():
+    parser = IncrementalJSONArrayParser()
+    assert parser.feed('前置き [{"title": "定食", "text": "唐揚') == []
+    assert parser.feed('げ"}, {"title"') == [{"title": "定食", "text": "唐揚げ"}]
+    assert parser.feed(': "飲み物", "text": "お茶"}') == [{"title": "飲み物", "text": "お茶"}]
+    assert not parser.finished
+
+
+def test_text_after_the_array_is_ignored():
+    parser = IncrementalJSONArrayParser()
+    items = parser.feed('[{"title": "定食", "text": "a"}] 補足: {"title": "x"}')
+    assert items == [{"title": "定食", "text": "a"}]
+    assert parser.finished
+    assert parser.feed('{"title": "y", "text": "b"}') == []
+
+
+def test_broken_object_is_skipped():
+    items, parser = feed_all('[{"title": "定食", "text": "a",}, {"title": "飲み物", "text": "b"}]', 3)
+    assert items == [{"title": "飲み物", "text": "b"}]
+    assert parser.finished
@@ -0,0 +1,72 @@
+import io
+import os
+
+from PIL import Image, ImageDraw
+
+from menu_cache import MenuResultCache, content_hash, dedupe_images
+
+
+def menu_page(price: str) -> bytes:
+    """値段の部分だけが異なるメニュー画像"""
+    img = Image.new("RGB", (400, 300), "white")
+    draw = ImageDraw.Draw(img)
+    draw.rectangle((20, 20, 380, 80), fill="black")
+    draw.text((40, 150), f"karaage {price}", fill="black")
+    buf = io.BytesIO()
+    img.save(buf, "PNG")
+    return buf.getvalue()
+
+
+def test_dedupe_drops_near_duplicates_within_one_submission():
+    first, retake = menu_page("800"), menu_page("850")
+    kept, hashes, dropped = dedupe_images([(first, "image/png"), (retake, "image/png")])
+    assert dropped == 1
+    assert kept == [(first, "image/png")]
+    assert hashes == [content_hash(first)]
+
+
+def test_near_duplicate_page_is_not_a_cache_hit(tmp_path):
+    cache = MenuResultCache(str(tmp_path))
+    _, stored, _ = dedupe_images([(menu_page("800"), "image/png")])
+    _, updated, _ = dedupe_images([(menu_page("850"), "image/png")])
+    cache.store(stored, "ctx", [{"title": "定食", "text": "唐揚げ 800円"}])
+    assert cache.lookup(updated, "ctx") is None
+    assert (cache.hits, cache.misses) == (0, 1)
+
+
+def test_exact_pages_hit_in_any_order(tmp_path):
+    cache = MenuResultCache(str(tmp_path))
+    a, b = content_hash(menu_page("800")), content_hash(menu_page("900"))
+    cache.store([a, b], "ctx", [{"title": "定食", "text": "唐揚げ 800円"}])
+    assert cache.lookup([b, a], "ctx") == [{"title": "定食", "text": "唐揚げ 800円"}]
+    assert cache.lookup([a, b], "other") is None
+    assert cache.lookup([a], "ctx") is None
+
+
+def test_hit_touches_only_its_own_entry(tmp_path):
+    cache = MenuResultCache(str(tmp_path), max_entries=2)
+    cache.store(["a"], "ctx", [{"title": "A", "text": "a"}])
+    cache.store(["b"], "ctx", [{"title": "B", "text": "b"}])
+    for name in os.listdir(tmp_path):
+        os.utime(tmp_path / name, (1000, 1000))
+    before = {name: (tmp_path / name).read_bytes() for name in os.listdir(tmp_path)}
+
+    assert cache.lookup(["a"], "ctx") == [{"title": "A", "text": "a"}]
+    assert {name: (tmp_path / name).read_bytes() for name in os.listdir(tmp_path)} == before
+    touched = [name for name in before if os.stat(tmp_path / name).st_mtime > 1000]
+    assert touched == [cache._key(["a"], "ctx") + ".json"]
+
+
+def test_least_recently_used_entry_is_evicted(tmp_path):
+    cache = MenuResultCache(str(tmp_path), max_entries=2)
+    cache.store(["a"], "ctx", [{"title": "A", "text": "a"}])
+    cache.store(["b"], "ctx", [{"title": "B", "text": "b"}])
+    os.utime(cache._path(cache._key(["a"], "ctx")), (1000, 1000))
+    os.utime(cache._path(cache._key(["b"], "ctx")), (2000, 2000))
+    assert cache.lookup(["a"], "ctx") is not None
+
+    cache.store(["c"], "ctx", [{"title": "C", "text": "c"}])
+    assert cache.lookup(["b"], "ctx") is None
+    assert cache.lookup(["a"], "ctx") is not None
+    assert cache.lookup(["c"], "ctx") is not None
+    assert len(os.listdir(tmp_path)) == 2
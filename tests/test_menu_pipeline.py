@@ -0,0 +1,172 @@
+import asyncio
+import io
+import json
+import os
+import random
+
+from PIL import Image, ImageStat
+
+import benchmark
+import menu_pipeline
+from menu_cache import MenuResultCache
+from menu_pipeline import MenuJob, diff_chapters, run_menu_pipeline, run_menu_update, stream_all_tracks_fast
+
+CHAPTERS = [{"title": "定食", "text": "唐揚げ定食、800円。"}, {"title": "飲み物", "text": "烏龍茶、200円。"}]
+
+
+def noise_page(brightness: int, seed: int) -> bytes:
+    """明るさの異なる、互いに似ていないページ画像"""
+    rng = random.Random(seed)
+    img = Image.new("L", (64, 64))
+    img.putdata([min(255, max(0, brightness + rng.randrange(-40, 40))) for _ in range(64 * 64)])
+    buf = io.BytesIO()
+    img.convert("RGB").save(buf, "JPEG")
+    return buf.getvalue()
+
+
+class PageModel(benchmark.FakeModel):
+    """ページごとの書き出しでは、暗いページだけ失敗させる（fail_dark=True のとき）"""
+
+    def __init__(self, fail_dark: bool):
+        super().__init__(CHAPTERS, benchmark.BackendProfile(gemini_latency=0))
+        self.fail_dark = fail_dark
+        self.calls = 0
+
+    def generate_content(self, inputs, stream=False):
+        self.calls += 1
+        if len(inputs) > 1 and isinstance(inputs[1], dict):
+            with Image.open(io.BytesIO(inputs[1]["data"])) as img:
+                if self.fail_dark and ImageStat.Stat(img.convert("L")).mean[0] < 100:
+                    raise ConnectionError("fake page failure")
+            return benchmark.FakeResponse("■定食\n唐揚げ定食 800円")
+        return super().generate_content(inputs, stream)
+
+
+def run_pages(tmp_path, monkeypatch, fail_dark: bool, force_reanalyze: bool = False, model=None):
+    monkeypatch.setattr(menu_pipeline.time, "sleep", lambda sec: None)
+    cache = MenuResultCache(str(tmp_path / "menu_cache"))
+    job = MenuJob(store_name="テスト食堂", images=[(noise_page(60, 1), "image/jpeg"), (noise_page(200, 2), "image/jpeg")],
+                  force_reanalyze=force_reanalyze)
+    notices = []
+    (tmp_path / "audio").mkdir(exist_ok=True)
+    (tmp_path / "export").mkdir(exist_ok=True)
+    result = run_menu_pipeline(job, model or PageModel(fail_dark), "fake", str(tmp_path / "audio"), str(tmp_path / "export"),
+                               None, menu_cache=cache, notify=lambda level, message: notices.append(level))
+    return cache, result, notices
+
+
+def cached_menus(cache: MenuResultCache) -> list[list[dict]]:
+    menus = []
+    for name in sorted(os.listdir(cache.cache_dir)):
+        with open(os.path.join(cache.cache_dir, name), encoding="utf-8") as f:
+            menus.append(json.load(f)["menu_data"])
+    return menus
+
+
+def test_menu_with_failed_pages_is_not_cached(tmp_path, monkeypatch, fake_tts):
+    cache, result, notices = run_pages(tmp_path, monkeypatch, fail_dark=True)
+    assert "warning" in notices
+    assert len(result["tracks"]) == len(CHAPTERS) + 1
+    assert cached_menus(cache) == []
+
+
+def test_menu_with_all_pages_read_is_cached(tmp_path, monkeypatch, fake_tts):
+    cache, _, _ = run_pages(tmp_path, monkeypatch, fail_dark=False)
+    assert cached_menus(cache) == [CHAPTERS]
+
+
+def test_cached_menu_is_reused(tmp_path, monkeypatch, fake_tts):
+    run_pages(tmp_path, monkeypatch, fail_dark=False)
+    model = PageModel(fail_dark=False)
+    cache, result, _ = run_pages(tmp_path, monkeypatch, fail_dark=False, model=model)
+    assert cache.hits == 1
+    assert model.calls == 0
+    assert result["menu_data"][1:] == CHAPTERS
+
+
+def test_force_reanalyze_skips_cached_menu(tmp_path, monkeypatch, fake_tts):
+    run_pages(tmp_path, monkeypatch, fail_dark=False)
+    model = PageModel(fail_dark=False)
+    cache, _, _ = run_pages(tmp_path, monkeypatch, fail_dark=False, force_reanalyze=True, model=model)
+    assert (cache.hits, cache.misses) == (0, 0)
+    assert model.calls > 0
+    assert len(cached_menus(cache)) == 1
+
+
+INTRO = {"title": "はじめに・目次", "text": "目次"}
+
+
+def test_diff_chapters_finds_edited_added_and_moved_chapters():
+    old = [INTRO] + CHAPTERS
+    assert diff_chapters(old, old) == []
+    assert diff_chapters(old, [INTRO, CHAPTERS[0], {"title": "飲み物", "text": "烏龍茶、250円。"}]) == [2]
+    assert diff_chapters(old, old + [{"title": "デザート", "text": "杏仁豆腐、300円。"}]) == [3]
+    # 番号が読み上げに含まれるため、入れ替えた章はどちらも作り直す
+    assert diff_chapters(old, [INTRO, CHAPTERS[1], CHAPTERS[0]]) == [1, 2]
+    assert diff_chapters(old, [{"title": "はじめに・目次", "text": "新しい目次"}] + CHAPTERS) == [0]
+    assert diff_chapters(old, [INTRO]) == []
+
+
+def test_update_resynthesizes_only_changed_chapters(tmp_path, monkeypatch, fake_tts):
+    _, previous, _ = run_pages(tmp_path, monkeypatch, fail_dark=False)
+    edited = [CHAPTERS[0], {"title": "飲み物", "text": "烏龍茶、250円。"}]
+    result = run_menu_update(previous, edited, str(tmp_path / "audio2"), str(tmp_path / "export2"))
+    assert result["changed_tracks"] == [2]
+    assert result["menu_data"][1:] == edited
+    # 変えていない音声は前回のファイルをそのまま使う
+    for i in (0, 1):
+        with open(previous["tracks"][i]["path"], "rb") as old, open(result["tracks"][i]["path"], "rb") as new:
+            assert old.read() == new.read()
+    assert os.path.exists(result["zip_path"])
+
+
+class NoTextChunk:
+    """終了理由・安全性の判定だけの断片（.text を読むと ValueError になる）"""
+
+    @property
+    def text(self):
+        raise ValueError("The `response.text` quick accessor only works when the response contains a valid `Part`")
+
+
+class ChunkedModel:
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def generate_content(self, inputs, stream=False):
+        return iter(self.chunks)
+
+
+def test_stream_skips_chunks_without_text(tmp_path, fake_tts):
+    body = json.dumps(CHAPTERS, ensure_ascii=False)
+    half = len(body) // 2
+    model = ChunkedModel([benchmark.FakeResponse(body[:half]), NoTextChunk(),
+                          benchmark.FakeResponse(body[half:-1]), NoTextChunk()])
+    menu_data, tracks, _ = asyncio.run(stream_all_tracks_fast(
+        model, ["prompt"], "テスト食堂", "", str(tmp_path), "ja-JP-NanamiNeural", "+10%", None))
+    assert menu_data[1:] == CHAPTERS
+    assert all(os.path.getsize(track["path"]) > 0 for track in tracks)
+
+
+def test_update_reuses_tracks_already_in_place(tmp_path, monkeypatch, fake_tts):
+    _, previous, _ = run_pages(tmp_path, monkeypatch, fail_dark=False)
+    edited = [CHAPTERS[0], {"title": "飲み物", "text": "烏龍茶、250円。"}]
+    # 前回と同じフォルダ（同じファイル）に作り直しても、変えていない音声はそのまま使う
+    result = run_menu_update(previous, edited, str(tmp_path / "audio"), str(tmp_path / "export2"))
+    assert result["changed_tracks"] == [2]
+
+    # 出力先に別の古いファイルが残っていても置き換えて使う
+    (tmp_path / "audio3").mkdir()
+    stale = tmp_path / "audio3" / os.path.basename(previous["tracks"][1]["path"])
+    stale.write_bytes(b"stale")
+    result = run_menu_update(previous, edited, str(tmp_path / "audio3"), str(tmp_path / "export3"))
+    assert result["changed_tracks"] == [2]
+    with open(previous["tracks"][1]["path"], "rb") as old:
+        assert stale.read_bytes() == old.read()
+
+
+def test_update_resynthesizes_tracks_whose_audio_was_deleted(tmp_path, monkeypatch, fake_tts):
+    _, previous, _ = run_pages(tmp_path, monkeypatch, fail_dark=False)
+    os.remove(previous["tracks"][1]["path"])
+    result = run_menu_update(previous, CHAPTERS, str(tmp_path / "audio2"), str(tmp_path / "export2"))
+    assert result["changed_tracks"] == [1]
+    assert os.path.getsize(result["tracks"][1]["path"]) > 0
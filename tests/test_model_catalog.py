@@ -0,0 +1,58 @@
+from time import monotonic, sleep
+
+import model_catalog
+from model_catalog import FAILURE_RETRY_SEC, ModelCatalog
+
+
+class FlakyFetcher:
+    """最初の1回だけ成功し、以降は失敗する"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, api_key):
+        self.calls += 1
+        if self.calls == 1:
+            return ["models/gemini-2.5-flash"]
+        raise ConnectionError("fake outage")
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+def refresh_in_background(catalog):
+    """期限切れの一覧を返させ、起動したバックグラウンド更新の終了を待つ"""
+    models, source, _ = catalog.models("key")
+    entry = catalog._entries[catalog._key("key")]
+    deadline = monotonic() + 5
+    while entry.get("refreshing") and monotonic() < deadline:
+        sleep(0.01)
+    return models, source
+
+
+def test_failed_background_refresh_backs_off(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(model_catalog.time, "time", clock.time)
+    fetcher = FlakyFetcher()
+    catalog = ModelCatalog(ttl_sec=10, fetcher=fetcher)
+    assert catalog.models("key") == (["models/gemini-2.5-flash"], "live", None)
+
+    clock.now += 11
+    models, source = refresh_in_background(catalog)
+    assert (models, source) == (["models/gemini-2.5-flash"], "cache")
+    assert fetcher.calls == 2
+    assert catalog._entries[catalog._key("key")]["failed_at"] == clock.now
+
+    # 失敗から FAILURE_RETRY_SEC が経つまでは、一覧が古くても取り直さない
+    clock.now += FAILURE_RETRY_SEC - 1
+    assert catalog.models("key")[1] == "cache"
+    assert fetcher.calls == 2
+
+    clock.now += 2
+    refresh_in_background(catalog)
+    assert fetcher.calls == 3
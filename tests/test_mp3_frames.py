@@ -0,0 +1,76 @@
+import pytest
+
+from mp3_frames import audio_frames, concat_mp3, iter_frames, mp3_duration, split_frames, strip_id3
+
+# MPEG1 Layer III・128kbps・44.1kHz・パディングなし: 417バイト、1152サンプル
+MPEG1_HEADER = b"\xff\xfb\x90\x00"
+MPEG1_SIZE = 417
+# MPEG2 Layer III・32kbps・24kHz: 96バイト、576サンプル
+MPEG2_HEADER = b"\xff\xf3\x44\x00"
+MPEG2_SIZE = 96
+
+
+def frame(header: bytes = MPEG1_HEADER, size: int = MPEG1_SIZE, body: bytes = b"") -> bytes:
+    return header + body + b"\0" * (size - len(header) - len(body))
+
+
+def id3v2(payload_size: int) -> bytes:
+    size = bytes([(payload_size >> shift) & 0x7F for shift in (21, 14, 7, 0)])
+    return b"ID3\x04\x00\x00" + size + b"\0" * payload_size
+
+
+def test_headers_are_parsed():
+    frames = list(iter_frames(frame() + frame(MPEG2_HEADER, MPEG2_SIZE)))
+    assert [(f.offset, f.size, f.sample_rate, f.samples) for f in frames] == [
+        (0, MPEG1_SIZE, 44100, 1152), (MPEG1_SIZE, MPEG2_SIZE, 24000, 576)]
+    assert frames[1].duration == pytest.approx(0.024)
+
+
+def test_tags_are_skipped():
+    data = id3v2(20) + frame() + b"TAG" + b"\0" * 125
+    assert strip_id3(data) == (30, 30 + MPEG1_SIZE)
+    assert [f.offset for f in iter_frames(data)] == [30]
+
+
+def test_garbage_is_skipped_until_the_next_sync_word():
+    data = frame() + b"\x00\xff\x00junk" + frame()
+    assert [f.offset for f in iter_frames(data)] == [0, MPEG1_SIZE + 7]
+
+
+def test_truncated_last_frame_is_dropped():
+    assert len(list(iter_frames(frame() + frame()[:100]))) == 1
+
+
+def test_info_frame_is_not_audio():
+    data = frame(body=b"\0" * 32 + b"Info") + frame() + frame()
+    assert len(list(iter_frames(data))) == 3
+    assert [f.offset for f in audio_frames(data)] == [MPEG1_SIZE, 2 * MPEG1_SIZE]
+
+
+def test_concat_keeps_only_audio_frames(tmp_path):
+    first, second, dest = tmp_path / "a.mp3", tmp_path / "b.mp3", tmp_path / "out.mp3"
+    first.write_bytes(id3v2(10) + frame(body=b"\0" * 32 + b"Xing") + frame(body=b"\x01") * 2)
+    second.write_bytes(frame(body=b"\x02") * 3)
+    concat_mp3([str(first), str(second)], str(dest))
+    assert dest.read_bytes() == frame(body=b"\x01") * 2 + frame(body=b"\x02") * 3
+    assert mp3_duration(str(dest)) == pytest.approx(5 * 1152 / 44100)
+
+
+def test_split_frames_cuts_on_frame_boundaries():
+    frames = [frame(body=bytes([n])) for n in range(100)]
+    frame_sec = 1152 / 44100
+    segments = split_frames(id3v2(10) + b"".join(frames), 1.0)
+    # 1秒 = 39フレーム弱のため、39フレームずつ区切られ、残り22フレームが最後の区切りになる
+    assert [len(data) // MPEG1_SIZE for data, _ in segments] == [39, 39, 22]
+    assert b"".join(data for data, _ in segments) == b"".join(frames)
+    assert [d for _, d in segments] == pytest.approx([39 * frame_sec, 39 * frame_sec, 22 * frame_sec])
+
+
+def test_short_last_segment_is_merged_into_the_previous_one():
+    segments = split_frames(frame() * 45, 1.0)
+    assert [len(data) // MPEG1_SIZE for data, _ in segments] == [45]
+
+
+def test_split_frames_of_silence_is_empty():
+    assert split_frames(b"", 1.0) == []
+    assert split_frames(id3v2(10), 1.0) == []
@@ -0,0 +1,61 @@
+import io
+
+import pytest
+
+from player_template import CompiledTemplate, load_template, minify_html
+
+PAGE = """
+<html>
+  <head>
+    <style>
+      /* 見出し */
+      h1 { color: navy; }
+    </style>
+  </head>
+  <body>
+    <h1>__STORE_NAME__</h1>
+    <p>限定 /* 数量 */ メニュー</p>
+    // 区切り線のつもりの本文
+    <a href="//cdn.example/menu.pdf">PDF</a>
+    <script>
+      // 再生の準備
+      const pl = __PLAYLIST__; /* 曲一覧 */
+      const url = "https://shop.example/";
+    </script>
+  </body>
+</html>
+"""
+
+
+def render(template: CompiledTemplate, values: dict) -> str:
+    out = io.BytesIO()
+    template.render(out, values)
+    return out.getvalue().decode("utf-8")
+
+
+def test_comments_are_removed_only_inside_script_and_style():
+    html = render(CompiledTemplate(minify_html(PAGE)), {"STORE_NAME": "食堂 /* 本店 */", "PLAYLIST": "[]"})
+    assert "見出し" not in html and "再生の準備" not in html and "曲一覧" not in html
+    assert "<p>限定 /* 数量 */ メニュー</p>" in html
+    assert "// 区切り線のつもりの本文" in html
+    assert '<a href="//cdn.example/menu.pdf">PDF</a>' in html
+    assert 'const url = "https://shop.example/";' in html
+    assert "<h1>食堂 /* 本店 */</h1>" in html
+    assert "\n\n" not in html and "  <" not in html
+
+
+def test_missing_value_is_an_error():
+    with pytest.raises(KeyError):
+        render(CompiledTemplate("<p>__STORE_NAME__ __MAP_BUTTON__</p>"), {"STORE_NAME": "食堂"})
+
+
+def test_values_can_be_written_by_a_function():
+    template = CompiledTemplate("<script>const pl=__PLAYLIST__;</script>")
+    assert render(template, {"PLAYLIST": lambda fp: fp.write(b"[1, 2]")}) == "<script>const pl=[1, 2];</script>"
+
+
+def test_service_worker_template_is_minified_as_script():
+    template = load_template("sw.js")
+    code = b"".join(template.parts).decode("utf-8")
+    assert set(template.names) == {"CACHE_NAME", "SHELL_URLS", "TRACK_URLS"}
+    assert not any(line.startswith("//") for line in code.splitlines())
@@ -0,0 +1,94 @@
+import gzip
+import socket
+import zipfile
+from http.client import HTTPConnection
+
+import pytest
+
+from publish_server import PublishStore, _parse_range, public_url, start_publish_server
+
+SIZE = 1000
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=900-", (900, 999)),
+    ("bytes=900-5000", (900, 999)),
+    ("bytes=-100", (900, 999)),
+    ("bytes=-5000", (0, 999)),
+    (" bytes=10-10 ", (10, 10)),
+    ("bytes=1000-", (-1, -1)),
+    ("bytes=-0", (-1, -1)),
+    ("bytes=50-10", (-1, -1)),
+    ("bytes=-", None),
+    ("bytes=0-1,5-9", None),
+    ("items=0-9", None),
+    ("", None),
+])
+def test_parse_range(header, expected):
+    assert _parse_range(header, SIZE) == expected
+
+
+def menu_zip(path, text: str) -> str:
+    with zipfile.ZipFile(path, "w") as zf:
+        zf.writestr("index.html", f"<html>{text}</html>" + " " * 600)
+        zf.writestr("tracks/01.0123456789.mp3", bytes(range(256)) * 4)
+    return str(path)
+
+
+@pytest.fixture
+def server(tmp_path):
+    store = PublishStore(str(tmp_path / "published"))
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    httpd = start_publish_server(port, store)
+    yield store, port
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def get(port, path, headers=None):
+    conn = HTTPConnection("127.0.0.1", port, timeout=5)
+    conn.request("GET", path, headers=headers or {})
+    resp = conn.getresponse()
+    body = resp.read()
+    conn.close()
+    return resp, body
+
+
+def test_republishing_keeps_the_url(tmp_path, server):
+    store, port = server
+    store.publish("shop-1", menu_zip(tmp_path / "v1.zip", "first"))
+    assert public_url("shop-1", f"http://127.0.0.1:{port}") == f"http://127.0.0.1:{port}/shop-1/"
+    resp, _ = get(port, "/shop-1")
+    assert (resp.status, resp.getheader("Location")) == (301, "/shop-1/")
+    resp, body = get(port, "/shop-1/")
+    assert resp.status == 200 and b"first" in body
+    assert resp.getheader("Cache-Control") == "no-cache"
+
+    store.publish("shop-1", menu_zip(tmp_path / "v2.zip", "second"))
+    resp, body = get(port, "/shop-1/", {"If-None-Match": resp.getheader("ETag")})
+    assert resp.status == 200 and b"second" in body
+    assert get(port, "/shop-1/", {"If-None-Match": resp.getheader("ETag")})[0].status == 304
+    assert get(port, "/other/")[0].status == 404
+
+
+def test_tracks_are_served_in_ranges(tmp_path, server):
+    store, port = server
+    store.publish("shop-1", menu_zip(tmp_path / "v1.zip", "first"))
+    resp, body = get(port, "/shop-1/tracks/01.0123456789.mp3", {"Range": "bytes=256-511"})
+    assert resp.status == 206
+    assert resp.getheader("Content-Range") == "bytes 256-511/1024"
+    assert body == bytes(range(256))
+    assert "immutable" in resp.getheader("Cache-Control")
+    resp, _ = get(port, "/shop-1/tracks/01.0123456789.mp3", {"Range": "bytes=2000-"})
+    assert (resp.status, resp.getheader("Content-Range")) == (416, "bytes */1024")
+
+
+def test_text_is_sent_precompressed(tmp_path, server):
+    store, port = server
+    store.publish("shop-1", menu_zip(tmp_path / "v1.zip", "first"))
+    resp, body = get(port, "/shop-1/", {"Accept-Encoding": "gzip"})
+    assert resp.getheader("Content-Encoding") == "gzip"
+    assert b"first" in gzip.decompress(body)
@@ -0,0 +1,39 @@
+from reading_dict import ReadingDictionary
+
+
+def test_longest_word_wins_at_the_same_position():
+    readings = ReadingDictionary({"辛口": "からくち", "辛口カレー": "からくちかれー"})
+    assert readings.apply("辛口カレーと辛口ソース") == "からくちかれーとからくちソース"
+
+
+def test_leftmost_match_wins_over_a_later_overlapping_one():
+    # 「生ビール」と「ビール瓶」は重なるため、左から始まる方だけを置き換える
+    readings = ReadingDictionary({"生ビール": "なまびーる", "ビール瓶": "びーるびん"})
+    assert readings.apply("生ビール瓶") == "なまびーる瓶"
+    assert readings.apply("ビール瓶") == "びーるびん"
+
+
+def test_word_found_through_a_failure_link():
+    readings = ReadingDictionary({"abcd": "X", "bc": "Y"})
+    assert readings.apply("abce") == "aYe"
+    assert readings.apply("abcd") == "X"
+
+
+def test_replacement_is_not_replaced_again():
+    readings = ReadingDictionary({"豚": "ぶた", "ぶた": "とん"})
+    assert readings.apply("豚汁") == "ぶた汁"
+
+
+def test_empty_words_and_texts_are_left_alone():
+    readings = ReadingDictionary({"": "から", "並": "なみ"})
+    assert len(readings) == 1
+    assert readings.apply("") == ""
+    assert readings.apply("大盛り") == "大盛り"
+    assert ReadingDictionary({}).apply("並盛り") == "並盛り"
+
+
+def test_fingerprint_depends_on_entries_not_order():
+    a = ReadingDictionary({"辛口": "からくち", "並": "なみ"})
+    b = ReadingDictionary({"並": "なみ", "辛口": "からくち"})
+    assert a.fingerprint == b.fingerprint
+    assert a.fingerprint != ReadingDictionary({"辛口": "からくち"}).fingerprint
@@ -0,0 +1,65 @@
+import io
+import json
+import shutil
+import subprocess
+import zipfile
+
+import pytest
+
+from menu_pipeline import write_pwa_files
+
+# sw.js を Node で動かし、install / activate / message の各段階でどの URL を取得したかを調べる
+HARNESS = r"""
+const fs = require("fs");
+const src = fs.readFileSync(0, "utf-8");
+const fetched = [];
+const store = new Map();
+const cache = {
+    addAll: async (urls) => { for (const u of urls) { fetched.push(u); store.set(u, "x"); } },
+    match: async (u) => store.get(u),
+    put: async (u) => { store.set(u, "x"); },
+};
+const listeners = {};
+const self = {
+    registration: {scope: "https://example.test/menu/"},
+    clients: {claim: async () => {}},
+    skipWaiting: () => {},
+    addEventListener: (name, fn) => { listeners[name] = fn; },
+};
+globalThis.self = self;
+globalThis.caches = {open: async () => cache, keys: async () => [], delete: async () => true};
+globalThis.fetch = async (u) => { fetched.push(String(u)); return {ok: true}; };
+new Function(src)();
+async function dispatch(name, data) {
+    const waits = [];
+    listeners[name]({data, waitUntil: (p) => waits.push(p)});
+    await Promise.all(waits);
+}
+(async () => {
+    const log = {};
+    await dispatch("install");
+    log.install = fetched.splice(0);
+    await dispatch("activate");
+    log.activate = fetched.splice(0);
+    await dispatch("message", "cache-tracks");
+    log.message = fetched.splice(0);
+    console.log(JSON.stringify(log));
+})();
+"""
+
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="node が必要")
+def test_tracks_are_cached_after_activation_not_during_it():
+    manifest = {"tracks": [{"src": "tracks/01.abc.mp3", "title": "a", "dur": 1.0}]}
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        write_pwa_files(zf, "テスト店", manifest, {"tracks/01.abc.mp3": "abc"})
+    with zipfile.ZipFile(buf) as zf:
+        sw = zf.read("sw.js").decode("utf-8")
+
+    out = subprocess.run(["node", "-e", HARNESS], input=sw, capture_output=True, text=True, check=True)
+    log = json.loads(out.stdout)
+    track = "https://example.test/menu/tracks/01.abc.mp3"
+    assert track not in log["install"]
+    assert log["activate"] == []
+    assert log["message"] == [track]
@@ -0,0 +1,54 @@
+import json
+
+import pytest
+
+import stage_metrics
+from stage_metrics import recording_run, render_prometheus, stage
+
+
+def read_log(metrics_dir) -> list[dict]:
+    with open(metrics_dir / "timings.jsonl", encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_exception_is_recorded_as_error_and_reraised(isolated_metrics):
+    with recording_run("run-1") as run:
+        with pytest.raises(ConnectionError):
+            with stage("tts_attempt", engine="edge-tts"):
+                raise ConnectionError("boom")
+        with stage("tts_attempt", engine="gtts"):
+            pass
+    events = read_log(isolated_metrics)
+    assert [(e["run"], e["engine"], e["outcome"]) for e in events] == [
+        ("run-1", "edge-tts", "error"), ("run-1", "gtts", "ok")]
+    assert {(r["engine"], r["outcome"], r["count"]) for r in run.summary()} == {("edge-tts", "error", 1), ("gtts", "ok", 1)}
+
+
+def test_labels_and_outcome_can_be_set_inside_the_stage(isolated_metrics):
+    with stage("tts_attempt", engine="edge-tts") as info:
+        info["outcome"] = "empty"
+    assert read_log(isolated_metrics)[0]["outcome"] == "empty"
+
+
+def test_prometheus_text(isolated_metrics, monkeypatch):
+    seconds = iter([10.0, 10.5, 20.0, 21.5, 30.0, 30.25])
+    monkeypatch.setattr(stage_metrics.time, "perf_counter", lambda: next(seconds))
+    with recording_run():
+        for _ in range(2):
+            with stage("tts_attempt", engine="edge-tts"):
+                pass
+        with stage("generate_content", mode="stream"):
+            pass
+
+    text = render_prometheus()
+    assert text.endswith("\n")
+    lines = text.splitlines()
+    assert lines[:2] == ["# HELP runwith_stage_seconds Time spent in each pipeline stage.",
+                         "# TYPE runwith_stage_seconds summary"]
+    assert 'runwith_stage_seconds_count{stage="generate_content",mode="stream",outcome="ok"} 1' in lines
+    assert 'runwith_stage_seconds_count{stage="tts_attempt",engine="edge-tts",outcome="ok"} 2' in lines
+    assert 'runwith_stage_seconds_sum{stage="tts_attempt",engine="edge-tts",outcome="ok"} 2.0000' in lines
+    assert 'runwith_stage_seconds_max{stage="tts_attempt",engine="edge-tts",outcome="ok"} 1.5000' in lines
+    assert lines.index("# TYPE runwith_stage_seconds_max gauge") > lines.index("# TYPE runwith_stage_seconds summary")
+    # 実行の終わりに同じ内容がファイルにも書き出される
+    assert (isolated_metrics / "runwith.prom").read_text(encoding="utf-8") == text
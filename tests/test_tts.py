@@ -0,0 +1,82 @@
+import asyncio
+import dataclasses
+import os
+import threading
+
+import benchmark
+import menu_pipeline
+from menu_pipeline import generate_single_track_fast, process_all_tracks_fast, split_sentences, synthesize_chapter
+from tts_cache import TTSCache
+from tts_scheduler import SchedulerConfig, TTSScheduler
+
+
+def test_fallback_counts_one_miss_per_track(tmp_path, monkeypatch, fake_tts):
+    # edge-tts は常に失敗させ、gTTS の代替だけで音声を作る
+    monkeypatch.setattr(benchmark.FakeCommunicate, "profile", dataclasses.replace(fake_tts, tts_failure_rate=1.0))
+    cache = TTSCache(str(tmp_path / "tts_cache"))
+    scheduler = TTSScheduler(SchedulerConfig(max_attempts=1))
+
+    async def make(name):
+        return await generate_single_track_fast("唐揚げ定食、800円。", str(tmp_path / name), "ja-JP-NanamiNeural", "+10%", cache, scheduler)
+
+    assert asyncio.run(make("first.mp3"))
+    assert (cache.hits, cache.misses) == (0, 1)
+    assert scheduler.metrics.fallbacks == 1
+
+    # 2回目は保存済みの gTTS 音声を使うが、トラックあたりのミスは1件のまま
+    assert asyncio.run(make("second.mp3"))
+    assert (cache.hits, cache.misses) == (0, 2)
+    assert scheduler.metrics.fallbacks == 1
+
+
+def test_chapter_falls_back_to_gtts_as_a_whole_when_a_part_fails(tmp_path, monkeypatch, fake_tts):
+    class FailingPart(benchmark.FakeCommunicate):
+        async def save(self, filename):
+            if "杏仁豆腐" in self.text:
+                raise ConnectionError("fake edge-tts failure")
+            await super().save(filename)
+
+    gtts_texts = []
+
+    class RecordingGTTS(benchmark.FakeGTTS):
+        def save(self, filename):
+            gtts_texts.append(self.text)
+            super().save(filename)
+
+    monkeypatch.setattr(menu_pipeline.edge_tts, "Communicate", FailingPart)
+    monkeypatch.setattr(menu_pipeline, "gTTS", RecordingGTTS)
+    text = "".join(f"{name}、{price}円。" * 6 for name, price in [("唐揚げ定食", 800), ("杏仁豆腐", 300), ("烏龍茶", 200)])
+    assert len(split_sentences(text)) > 1
+    dest = tmp_path / "01.mp3"
+    scheduler = TTSScheduler(SchedulerConfig(max_attempts=1))
+
+    assert asyncio.run(synthesize_chapter(text, str(dest), "ja-JP-NanamiNeural", "+10%", None, scheduler))
+    assert gtts_texts == [text]
+    assert dest.read_bytes() == benchmark.fake_mp3(text)
+    assert scheduler.metrics.fallbacks == 1
+    assert not [name for name in os.listdir(tmp_path) if ".part" in name]
+
+
+def test_cache_counts_are_per_run_when_jobs_share_a_cache(tmp_path, monkeypatch, fake_tts):
+    monkeypatch.setattr(benchmark.FakeCommunicate, "profile", dataclasses.replace(fake_tts, tts_latency=0.02))
+    cache = TTSCache(str(tmp_path / "tts_cache"))
+    known = [{"title": f"料理{n}", "text": f"料理{n}、{n * 100}円。"} for n in range(6)]
+    new = [{"title": f"飲み物{n}", "text": f"飲み物{n}、{n * 50}円。"} for n in range(4)]
+    (tmp_path / "warm").mkdir()
+    asyncio.run(process_all_tracks_fast(known, str(tmp_path / "warm"), "ja-JP-NanamiNeural", "+10%", None, cache))
+
+    results = {}
+
+    def run(name, menu):
+        out = tmp_path / name
+        out.mkdir()
+        _, metrics = asyncio.run(process_all_tracks_fast(menu, str(out), "ja-JP-NanamiNeural", "+10%", None, cache))
+        results[name] = (metrics["cache_hits"], metrics["cache_misses"])
+
+    threads = [threading.Thread(target=run, args=("known", known)), threading.Thread(target=run, args=("new", new))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == {"known": (6, 0), "new": (0, 4)}
+    assert (cache.hits, cache.misses) == (6, 10)
@@ -0,0 +1,84 @@
+import asyncio
+import dataclasses
+
+import pytest
+
+import benchmark
+import tts_scheduler
+from menu_pipeline import synthesize_chapter
+from tts_scheduler import SchedulerConfig, TokenBucket, TTSScheduler
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def monotonic(self):
+        return self.now
+
+
+def test_token_bucket_refills_at_the_configured_rate(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(tts_scheduler.time, "monotonic", clock.monotonic)
+    bucket = TokenBucket(rate_per_sec=2.0, capacity=3)
+    # 最初は capacity 回まで待たずに使え、その先は 1/rate 秒ずつ待つ
+    assert [bucket._reserve() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket._reserve() == pytest.approx(0.5)
+    assert bucket._reserve() == pytest.approx(1.0)
+
+    clock.now += 1.0
+    assert bucket._reserve() == pytest.approx(0.5)
+    # 長く使わなくても capacity より多くはたまらない
+    clock.now += 100
+    assert [bucket._reserve() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket._reserve() == pytest.approx(0.5)
+
+
+@pytest.mark.parametrize("jitter", [0.0, 1.0])
+def test_backoff_delay_is_capped_and_jittered(monkeypatch, jitter):
+    monkeypatch.setattr(tts_scheduler.random, "uniform", lambda low, high: low + (high - low) * jitter)
+    scheduler = TTSScheduler(SchedulerConfig(backoff_base=0.5, backoff_max=3.0))
+    expected = [0.5, 1.0, 2.0, 3.0, 3.0, 3.0]
+    for attempt, full in enumerate(expected):
+        assert scheduler.backoff_delay(attempt) == pytest.approx(full if jitter else full / 2)
+
+
+def test_backoff_delay_stays_within_bounds():
+    scheduler = TTSScheduler(SchedulerConfig(backoff_base=0.5, backoff_max=3.0))
+    for attempt in range(10):
+        full = min(3.0, 0.5 * 2 ** attempt)
+        delays = [scheduler.backoff_delay(attempt) for _ in range(200)]
+        assert all(full / 2 <= d <= full for d in delays)
+        assert len(set(delays)) > 1
+
+
+def test_concurrent_synthesis_respects_max_concurrency(tmp_path, monkeypatch, fake_tts):
+    running = peak = 0
+
+    class CountingCommunicate(benchmark.FakeCommunicate):
+        async def save(self, filename):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            try:
+                await super().save(filename)
+            finally:
+                running -= 1
+
+    monkeypatch.setattr(benchmark.FakeCommunicate, "profile", dataclasses.replace(fake_tts, tts_latency=0.02))
+    monkeypatch.setattr("menu_pipeline.edge_tts.Communicate", CountingCommunicate)
+    # レート制限は別に確かめるため、ここでは十分に大きなバケットを使う
+    scheduler = TTSScheduler(SchedulerConfig(max_concurrency=3), bucket=TokenBucket(1000, 1000))
+    # 長いチャプター（文ごとに分けて合成）と短いチャプターを混ぜて同時に投入する
+    texts = [f"{n}番の料理、{n * 100}円。" * (20 if n % 2 else 1) for n in range(1, 9)]
+
+    async def run_all():
+        return await asyncio.gather(*[
+            synthesize_chapter(text, str(tmp_path / f"{n:02}.mp3"), "ja-JP-NanamiNeural", "+10%", None, scheduler)
+            for n, text in enumerate(texts)
+        ])
+
+    assert all(asyncio.run(run_all()))
+    assert peak == 3
+    assert scheduler.metrics.peak_running == 3
+    assert scheduler.metrics.running == 0 and scheduler.metrics.waiting == 0
@@ -0,0 +1,133 @@
+import pytest
+
+import web_fetch
+from web_fetch import fetch_menu_text, fetch_page, find_menu_links, _parse
+
+
+class StubResponse:
+    def __init__(self, status_code=200, body=b"", headers=None, chunk_size=64 * 1024):
+        self.status_code = status_code
+        self.body = body
+        self.headers = headers or {}
+        self.encoding = "utf-8"
+        self.chunk_size = chunk_size
+        self.chunks_read = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise web_fetch.requests.HTTPError(str(self.status_code))
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self.body), self.chunk_size):
+            self.chunks_read += 1
+            yield self.body[start:start + self.chunk_size]
+
+
+class StubSession:
+    """URL ごとに用意した応答を順に返し、送られたヘッダーを記録する"""
+
+    def __init__(self, routes):
+        self.routes = {url: list(responses) for url, responses in routes.items()}
+        self.requests = []
+
+    def get(self, url, headers=None, timeout=None, stream=False):
+        self.requests.append((url, dict(headers or {})))
+        responses = self.routes.get(url)
+        if not responses:
+            return StubResponse(404)
+        return responses.pop(0) if len(responses) > 1 else responses[0]
+
+
+@pytest.fixture
+def session(tmp_path, monkeypatch):
+    monkeypatch.setattr(web_fetch, "WEB_CACHE_DIR", str(tmp_path / "web_cache"))
+
+    def install(routes):
+        stub = StubSession(routes)
+        monkeypatch.setattr(web_fetch, "_session", stub)
+        return stub
+    return install
+
+
+def test_not_modified_reuses_cached_body(session):
+    url = "https://shop.example/menu"
+    headers = {"ETag": '"v1"', "Last-Modified": "Wed, 01 Oct 2025 00:00:00 GMT", "Content-Type": "text/html; charset=utf-8"}
+    stub = session({url: [StubResponse(200, "<p>唐揚げ定食 800円</p>".encode(), headers), StubResponse(304)]})
+    first = fetch_page(url)
+    assert stub.requests[0][1] == {}
+
+    assert fetch_page(url) == first == ("<p>唐揚げ定食 800円</p>".encode(), "utf-8")
+    assert stub.requests[1][1] == {"If-None-Match": '"v1"', "If-Modified-Since": "Wed, 01 Oct 2025 00:00:00 GMT"}
+
+
+def test_changed_page_replaces_cached_body(session):
+    url = "https://shop.example/menu"
+    session({url: [StubResponse(200, b"old", {"ETag": '"v1"'}), StubResponse(200, b"new", {"ETag": '"v2"'}),
+                   StubResponse(304)]})
+    assert fetch_page(url)[0] == b"old"
+    assert fetch_page(url)[0] == b"new"
+    assert fetch_page(url)[0] == b"new"
+
+
+def test_pages_without_validators_are_not_cached(session, tmp_path):
+    url = "https://shop.example/menu"
+    session({url: [StubResponse(200, b"body")]})
+    assert fetch_page(url) == (b"body", None)
+    assert not (tmp_path / "web_cache").exists()
+
+
+def test_body_is_capped_and_reading_stops(session):
+    url = "https://shop.example/huge"
+    huge = StubResponse(200, b"x" * 10_000, chunk_size=1000)
+    session({url: [huge]})
+    body, _ = fetch_page(url, max_bytes=2500)
+    assert body == b"x" * 2500
+    assert huge.chunks_read == 3
+
+
+def test_http_errors_are_raised(session):
+    session({"https://shop.example/menu": [StubResponse(500)]})
+    with pytest.raises(web_fetch.requests.HTTPError):
+        fetch_page("https://shop.example/menu")
+
+
+LINKS_HTML = """
+<a href="/menu/lunch">ランチ</a>
+<a href="/menu/lunch#top">ランチ（重複）</a>
+<a href="drinks.html">ドリンク</a>
+<a href="/access">アクセス</a>
+<a href="https://other.example/menu">他のサイトのメニュー</a>
+<a href="https://shop.example/">トップ</a>
+<a href="/">メニュー（このページ）</a>
+<a href="/p/3">お品書き</a>
+<a href="/dinner">夜</a>
+"""
+
+
+def test_menu_links_stay_on_the_same_site():
+    soup = _parse(LINKS_HTML.encode(), "utf-8")
+    assert find_menu_links(soup, "https://shop.example/", limit=10) == [
+        "https://shop.example/menu/lunch",
+        "https://shop.example/drinks.html",
+        "https://shop.example/p/3",
+        "https://shop.example/dinner",
+    ]
+    assert len(find_menu_links(soup, "https://shop.example/", limit=2)) == 2
+
+
+def test_follow_links_joins_linked_menu_pages(session):
+    session({
+        "https://shop.example/": [StubResponse(200, f"<h1>食堂</h1>{LINKS_HTML}".encode(), {"Content-Type": "text/html; charset=utf-8"})],
+        "https://shop.example/menu/lunch": [StubResponse(200, "<p>日替わり 700円</p>".encode(), {"Content-Type": "text/html; charset=utf-8"})],
+        "https://shop.example/drinks.html": [StubResponse(500)],
+    })
+    text = fetch_menu_text("https://shop.example/", follow_links=True)
+    assert text.startswith("食堂")
+    assert "日替わり 700円" in text
+    assert fetch_menu_text("https://shop.example/").count("日替わり") == 0
@@ -0,0 +1,57 @@
+import os
+import time
+
+from workspace import ACCESS_MARKER, ACTIVE_GRACE_SEC, reap_once, session_work_dir
+
+
+def make_dir(root, name: str, size: int, accessed_ago: float) -> str:
+    """size バイトのファイルを持ち、accessed_ago 秒前に使われた作業フォルダ"""
+    path = session_work_dir(name, str(root))
+    with open(os.path.join(path, "track.mp3"), "wb") as f:
+        f.write(b"\0" * size)
+    at = time.time() - accessed_ago
+    os.utime(os.path.join(path, ACCESS_MARKER), (at, at))
+    return path
+
+
+def test_session_ids_are_sanitized(tmp_path):
+    assert session_work_dir("../a b/c", str(tmp_path)) == os.path.join(str(tmp_path), "abc")
+    assert session_work_dir("///", str(tmp_path)) == os.path.join(str(tmp_path), "default")
+
+
+def test_expired_dirs_are_removed(tmp_path):
+    old = make_dir(tmp_path, "old", 10, accessed_ago=7200)
+    fresh = make_dir(tmp_path, "fresh", 10, accessed_ago=60)
+    result = reap_once([str(tmp_path), str(tmp_path / "missing")], ttl_sec=3600, quota_bytes=10**9)
+    assert result["removed"] == [old]
+    assert not os.path.exists(old) and os.path.exists(fresh)
+
+
+def test_over_quota_removes_least_recently_used_first(tmp_path):
+    oldest = make_dir(tmp_path, "oldest", 400, accessed_ago=ACTIVE_GRACE_SEC + 300)
+    older = make_dir(tmp_path, "older", 400, accessed_ago=ACTIVE_GRACE_SEC + 200)
+    newer = make_dir(tmp_path, "newer", 400, accessed_ago=ACTIVE_GRACE_SEC + 100)
+    result = reap_once([str(tmp_path)], ttl_sec=10**6, quota_bytes=900)
+    assert result["removed"] == [oldest]
+    assert os.path.exists(older) and os.path.exists(newer)
+    assert result["bytes"] == 800
+
+
+def test_recently_used_dirs_survive_quota_eviction(tmp_path):
+    # 実行中のジョブのフォルダ（直近に使われた）は、容量を超えていても削除しない
+    running = make_dir(tmp_path, "running", 1000, accessed_ago=5)
+    idle = make_dir(tmp_path, "idle", 100, accessed_ago=ACTIVE_GRACE_SEC + 60)
+    result = reap_once([str(tmp_path)], ttl_sec=10**6, quota_bytes=500)
+    assert result["removed"] == [idle]
+    assert os.path.exists(os.path.join(running, "track.mp3"))
+    assert result["bytes"] == 1000
+
+
+def test_dirs_without_marker_use_their_own_mtime(tmp_path):
+    path = tmp_path / "legacy"
+    path.mkdir()
+    at = time.time() - 7200
+    os.utime(path, (at, at))
+    (tmp_path / "stray.txt").write_text("x")
+    assert reap_once([str(tmp_path)], ttl_sec=3600, quota_bytes=10**9)["removed"] == [str(path)]
+    assert (tmp_path / "stray.txt").exists()
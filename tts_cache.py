@@ -0,0 +1,127 @@
+import os
+import json
+import hashlib
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+
+# ----------------------------
+# 音声キャッシュ（内容アドレス型・LRU）
+# ----------------------------
+
+CACHE_DIR = os.environ.get("RUNWITH_TTS_CACHE_DIR", "tts_cache")
+CACHE_MAX_BYTES = int(os.environ.get("RUNWITH_TTS_CACHE_MAX_MB", "512")) * 1024 * 1024
+
+
+def make_cache_key(text: str, voice: str, rate: str, engine: str) -> str:
+    """読み上げ内容・声・速度・エンジンからキャッシュキー（SHA-256）を作る"""
+    payload = json.dumps([engine, voice, rate, text], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class TTSCache:
+    """生成済みMP3をハッシュキーで保存し、容量上限を超えたら古い順に削除する"""
+
+    def __init__(self, cache_dir: str = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[str, int] = OrderedDict()
+        self._total_bytes = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_index()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], f"{key}.mp3")
+
+    def _load_index(self):
+        """起動時にディスク上のファイルを最終利用時刻（mtime）順に読み込む"""
+        found = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if not name.endswith(".mp3"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    info = os.stat(path)
+                except OSError:
+                    continue
+                found.append((info.st_mtime, name[:-4], info.st_size))
+        for _, key, size in sorted(found):
+            self._entries[key] = size
+            self._total_bytes += size
+        with self._lock:
+            self._evict_locked()
+
+    def _evict_locked(self):
+        while self._total_bytes > self.max_bytes and self._entries:
+            key, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            self.evictions += 1
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def fetch(self, key: str, dest: str, count: bool = True) -> bool:
+        """キャッシュにあれば dest にコピーして True を返す
+
+        count=False のときはヒット・ミスの件数に数えない（同じトラックの2回目の確認など）。
+        """
+        path = self._path(key)
+        try:
+            shutil.copyfile(path, dest)
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                if count:
+                    self.misses += 1
+                size = self._entries.pop(key, None)
+                if size is not None:
+                    self._total_bytes -= size
+            return False
+        with self._lock:
+            if count:
+                self.hits += 1
+            if key in self._entries:
+                self._entries.move_to_end(key)
+            else:
+                self._entries[key] = os.path.getsize(path)
+                self._total_bytes += self._entries[key]
+        return True
+
+    def store(self, key: str, src: str):
+        """生成したMP3をキャッシュに登録（書き込みは一時ファイル経由でアトミックに）"""
+        try:
+            size = os.path.getsize(src)
+            if size <= 0 or size > self.max_bytes:
+                return
+            path = self._path(key)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+            shutil.copyfile(src, tmp_path)
+            os.replace(tmp_path, path)
+        except OSError:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._total_bytes -= old
+            self._entries[key] = size
+            self._total_bytes += size
+            self._evict_locked()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+            }
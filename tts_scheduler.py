@@ -0,0 +1,129 @@
+import os
+import time
+import random
+import asyncio
+import threading
+from dataclasses import dataclass, field
+
+# ----------------------------
+# 音声生成スケジューラ（同時実行数の制限・バックオフ・レート制御）
+# ----------------------------
+
+
+@dataclass
+class SchedulerConfig:
+    """スケジューラの設定値（環境変数で既定値を上書き可能）"""
+    max_concurrency: int = int(os.environ.get("RUNWITH_TTS_MAX_CONCURRENCY", "4"))
+    max_attempts: int = int(os.environ.get("RUNWITH_TTS_MAX_ATTEMPTS", "3"))
+    backoff_base: float = float(os.environ.get("RUNWITH_TTS_BACKOFF_BASE", "0.5"))
+    backoff_max: float = float(os.environ.get("RUNWITH_TTS_BACKOFF_MAX", "8.0"))
+    rate_per_sec: float = float(os.environ.get("RUNWITH_TTS_RATE_PER_SEC", "5.0"))
+    burst: int = int(os.environ.get("RUNWITH_TTS_BURST", "10"))
+
+
+class TokenBucket:
+    """プロセス全体（全セッション）で共有するトークンバケット"""
+
+    def __init__(self, rate_per_sec: float, capacity: int):
+        self.rate_per_sec = rate_per_sec
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """トークンを1つ予約し、使えるようになるまでの待ち時間（秒）を返す"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate_per_sec)
+            self._updated = now
+            self._tokens -= 1
+            if self._tokens >= 0 or self.rate_per_sec <= 0:
+                return 0.0
+            return -self._tokens / self.rate_per_sec
+
+    async def acquire(self):
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+@dataclass
+class SchedulerMetrics:
+    """キューの深さ・実行数・リトライ数などの集計"""
+    waiting: int = 0
+    running: int = 0
+    peak_waiting: int = 0
+    peak_running: int = 0
+    submitted: int = 0
+    completed: int = 0
+    retries: int = 0
+    fallbacks: int = 0
+    # 音声キャッシュの再利用・新規生成（キャッシュはプロセス共有のため、件数はここで数える）
+    cache_hits: int = 0
+    cache_misses: int = 0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def update(self, **deltas):
+        with self._lock:
+            for name, delta in deltas.items():
+                setattr(self, name, getattr(self, name) + delta)
+            self.peak_waiting = max(self.peak_waiting, self.waiting)
+            self.peak_running = max(self.peak_running, self.running)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {k: v for k, v in self.__dict__.items() if not k.startswith("_")}
+
+
+DEFAULT_CONFIG = SchedulerConfig()
+SHARED_BUCKET = TokenBucket(DEFAULT_CONFIG.rate_per_sec, DEFAULT_CONFIG.burst)
+PROCESS_METRICS = SchedulerMetrics()
+
+
+class TTSScheduler:
+    """1回の生成処理（イベントループ）ごとに作るスケジューラ"""
+
+    def __init__(self, config: SchedulerConfig | None = None, bucket: TokenBucket = SHARED_BUCKET):
+        self.config = config or DEFAULT_CONFIG
+        self.bucket = bucket
+        self.metrics = SchedulerMetrics()
+        self._semaphore = asyncio.Semaphore(max(1, self.config.max_concurrency))
+
+    def _update(self, **deltas):
+        self.metrics.update(**deltas)
+        PROCESS_METRICS.update(**deltas)
+
+    async def run(self, coro_factory):
+        """同時実行数の上限内でジョブを実行する"""
+        self._update(submitted=1, waiting=1)
+        async with self._semaphore:
+            self._update(waiting=-1, running=1)
+            try:
+                return await coro_factory()
+            finally:
+                self._update(running=-1, completed=1)
+
+    async def throttle(self):
+        """共有トークンバケットでリクエスト間隔を制御"""
+        await self.bucket.acquire()
+
+    def backoff_delay(self, attempt: int) -> float:
+        """指数バックオフ + ジッター（attempt は 0 始まり）"""
+        delay = min(self.config.backoff_max, self.config.backoff_base * (2 ** attempt))
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    async def backoff(self, attempt: int):
+        self._update(retries=1)
+        await asyncio.sleep(self.backoff_delay(attempt))
+
+    def record_fallback(self):
+        self._update(fallbacks=1)
+
+    def record_cache(self, hit: bool):
+        self._update(**({"cache_hits": 1} if hit else {"cache_misses": 1}))
+
+
+def process_metrics() -> dict:
+    """プロセス全体のスケジューラ集計を返す"""
+    return PROCESS_METRICS.snapshot()
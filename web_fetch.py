@@ -0,0 +1,155 @@
+import os
+import re
+import json
+import hashlib
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin, urlparse, urldefrag
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from bs4 import BeautifulSoup
+
+# ----------------------------
+# Webページ取得（接続の再利用・条件付きリクエスト・サイズ上限・リンク先の並列取得）
+# ----------------------------
+
+WEB_CACHE_DIR = os.environ.get("RUNWITH_WEB_CACHE_DIR", "web_cache")
+MAX_PAGE_BYTES = int(os.environ.get("RUNWITH_MAX_PAGE_BYTES", str(2 * 1024 * 1024)))
+MAX_TEXT_CHARS = 30000
+MAX_LINKED_PAGES = 4
+FETCH_TIMEOUT = (5, 10)
+USER_AGENT = "Mozilla/5.0"
+# メニューページらしいリンクを見分けるためのキーワード
+MENU_LINK_PATTERN = re.compile(r"menu|food|drink|lunch|dinner|メニュー|お品書き|料理|ドリンク|ランチ|ディナー|コース", re.IGNORECASE)
+
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = "lxml"
+except ImportError:
+    HTML_PARSER = "html.parser"
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """プロセス内で共有する keep-alive 対応のセッション"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            retry = Retry(total=2, backoff_factor=0.5, status_forcelist=(502, 503, 504), allowed_methods=("GET",))
+            adapter = HTTPAdapter(pool_connections=8, pool_maxsize=16, max_retries=retry)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            session.headers["User-Agent"] = USER_AGENT
+            _session = session
+        return _session
+
+
+def _cache_paths(url: str) -> tuple[str, str]:
+    key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+    return os.path.join(WEB_CACHE_DIR, f"{key}.json"), os.path.join(WEB_CACHE_DIR, f"{key}.body")
+
+
+def _write_atomic(path: str, data: bytes):
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def fetch_page(url: str, max_bytes: int = MAX_PAGE_BYTES) -> tuple[bytes, str | None]:
+    """ページ本体（max_bytes まで）と文字コードを返す。ETag/Last-Modified で変更がなければキャッシュを使う"""
+    meta_path, body_path = _cache_paths(url)
+    meta = {}
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        pass
+
+    headers = {}
+    if meta.get("etag"):
+        headers["If-None-Match"] = meta["etag"]
+    if meta.get("last_modified"):
+        headers["If-Modified-Since"] = meta["last_modified"]
+
+    with get_session().get(url, headers=headers, timeout=FETCH_TIMEOUT, stream=True) as resp:
+        if resp.status_code == 304 and os.path.exists(body_path):
+            with open(body_path, "rb") as f:
+                return f.read(), meta.get("encoding")
+        resp.raise_for_status()
+        chunks, size = [], 0
+        for chunk in resp.iter_content(chunk_size=64 * 1024):
+            chunks.append(chunk)
+            size += len(chunk)
+            if size >= max_bytes:
+                break
+        body = b"".join(chunks)[:max_bytes]
+        # ヘッダーに charset がなければ BeautifulSoup の自動判定に任せる
+        encoding = resp.encoding if "charset" in resp.headers.get("Content-Type", "").lower() else None
+        etag, last_modified = resp.headers.get("ETag"), resp.headers.get("Last-Modified")
+
+    if etag or last_modified:
+        os.makedirs(WEB_CACHE_DIR, exist_ok=True)
+        _write_atomic(body_path, body)
+        _write_atomic(meta_path, json.dumps({"url": url, "etag": etag, "last_modified": last_modified,
+                                             "encoding": encoding}).encode("utf-8"))
+    return body, encoding
+
+
+def _parse(body: bytes, encoding: str | None) -> BeautifulSoup:
+    return BeautifulSoup(body, HTML_PARSER, from_encoding=encoding)
+
+
+def extract_text(soup: BeautifulSoup, max_chars: int = MAX_TEXT_CHARS) -> str:
+    """本文テキストを行単位で取り出し、max_chars に達したら打ち切る"""
+    for s in soup(["script", "style", "header", "footer", "nav", "noscript"]):
+        s.extract()
+    lines, total = [], 0
+    for line in soup.get_text(separator="\n").splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        lines.append(line)
+        total += len(line) + 1
+        if total >= max_chars:
+            break
+    return "\n".join(lines)[:max_chars]
+
+
+def find_menu_links(soup: BeautifulSoup, base_url: str, limit: int = MAX_LINKED_PAGES) -> list[str]:
+    """同じサイト内で、メニューページらしいリンクを最大 limit 件返す"""
+    host = urlparse(base_url).netloc
+    found = []
+    for a in soup.find_all("a", href=True):
+        href, _ = urldefrag(urljoin(base_url, a["href"]))
+        if urlparse(href).netloc != host or href == base_url or href in found:
+            continue
+        if MENU_LINK_PATTERN.search(href) or MENU_LINK_PATTERN.search(a.get_text(" ", strip=True)):
+            found.append(href)
+            if len(found) >= limit:
+                break
+    return found
+
+
+def fetch_menu_text(url: str, follow_links: bool = False, max_chars: int = MAX_TEXT_CHARS) -> str:
+    """URLの本文を取得。follow_links 時は同じサイトのメニューページも並列に取得して連結する"""
+    body, encoding = fetch_page(url)
+    soup = _parse(body, encoding)
+    links = find_menu_links(soup, url) if follow_links else []
+    texts = [extract_text(soup, max_chars)]
+
+    def fetch_linked(link):
+        try:
+            return extract_text(_parse(*fetch_page(link)), max_chars)
+        except Exception:
+            return ""
+
+    if links:
+        with ThreadPoolExecutor(max_workers=len(links)) as pool:
+            texts.extend(t for t in pool.map(fetch_linked, links) if t)
+    return "\n\n".join(texts)[:max_chars]
@@ -0,0 +1,109 @@
+import os
+import re
+import time
+import shutil
+import threading
+
+# ----------------------------
+# セッションごとの作業フォルダと自動削除（TTL・ディスク容量上限）
+# ----------------------------
+
+WORK_ROOT = os.environ.get("RUNWITH_WORK_ROOT", "menu_audio_temp")
+SESSION_TTL_SEC = int(os.environ.get("RUNWITH_SESSION_TTL_SEC", str(6 * 3600)))
+DISK_QUOTA_BYTES = int(os.environ.get("RUNWITH_DISK_QUOTA_MB", "2048")) * 1024 * 1024
+REAP_INTERVAL_SEC = int(os.environ.get("RUNWITH_REAP_INTERVAL_SEC", "300"))
+# 容量超過時でも、直近に使われたフォルダは削除しない
+ACTIVE_GRACE_SEC = 600
+ACCESS_MARKER = ".last_access"
+
+
+def _touch(path: str):
+    with open(path, "a"):
+        pass
+    os.utime(path)
+
+
+def session_work_dir(session_id: str, root: str = WORK_ROOT) -> str:
+    """セッション専用の作業フォルダを返す（呼ぶたびに最終利用時刻を更新）"""
+    safe_id = re.sub(r"[^0-9A-Za-z_-]", "", session_id) or "default"
+    path = os.path.join(root, safe_id)
+    os.makedirs(path, exist_ok=True)
+    _touch(os.path.join(path, ACCESS_MARKER))
+    return path
+
+
+def _last_access(path: str) -> float:
+    try:
+        return os.path.getmtime(os.path.join(path, ACCESS_MARKER))
+    except OSError:
+        return os.path.getmtime(path)
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for base, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(base, name))
+            except OSError:
+                pass
+    return total
+
+
+def reap_once(roots: list[str], ttl_sec: int = SESSION_TTL_SEC, quota_bytes: int = DISK_QUOTA_BYTES) -> dict:
+    """期限切れのフォルダを削除し、合計が上限を超えていれば古い順に削除する"""
+    now = time.time()
+    entries = []
+    for root in roots:
+        if not os.path.isdir(root):
+            continue
+        for name in os.listdir(root):
+            path = os.path.join(root, name)
+            if not os.path.isdir(path):
+                continue
+            try:
+                entries.append((_last_access(path), path))
+            except OSError:
+                continue
+
+    removed = []
+    alive = []
+    for accessed, path in entries:
+        if now - accessed > ttl_sec:
+            shutil.rmtree(path, ignore_errors=True)
+            removed.append(path)
+        else:
+            alive.append((accessed, _dir_size(path), path))
+
+    total = sum(size for _, size, _ in alive)
+    for accessed, size, path in sorted(alive):
+        if total <= quota_bytes:
+            break
+        if now - accessed < ACTIVE_GRACE_SEC:
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+        removed.append(path)
+        total -= size
+    return {"removed": removed, "bytes": total}
+
+
+class WorkspaceReaper(threading.Thread):
+    """一定間隔で reap_once を実行するバックグラウンドスレッド"""
+
+    def __init__(self, roots: list[str], interval_sec: int = REAP_INTERVAL_SEC):
+        super().__init__(name="runwith-workspace-reaper", daemon=True)
+        self.roots = roots
+        self.interval_sec = interval_sec
+        self.last_result: dict = {}
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.is_set():
+            try:
+                self.last_result = reap_once(self.roots)
+            except Exception:
+                pass
+            self._stop_event.wait(self.interval_sec)
+
+    def stop(self):
+        self._stop_event.set()